@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import time
+import resource
+import multiprocessing
+from ansible.executor.playbook_executor import PlaybookExecutor
+
+
+__all__ = ["ForksController", "AdaptivePlaybookExecutor"]
+
+
+def cpu_seconds():
+    """ CPU time of this process and of its (finished) children """
+    usage = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        r = resource.getrusage(who)
+        usage += r.ru_utime + r.ru_stime
+    return usage
+
+
+def memory_pressure():
+    """ used fraction of the memory (linux), None if unknown """
+    try:
+        with open("/proc/meminfo") as fd:
+            info = dict(line.split(":", 1) for line in fd if ":" in line)
+        total = float(info["MemTotal"].split()[0])
+        available = float(info["MemAvailable"].split()[0])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+    return 1 - available / total if total else None
+
+
+class ForksController(object):
+    """
+    Concurrency of a run adapted from one batch of hosts to the next,
+    within [min_forks, max_forks]. The run starts at min_forks.
+    参数说明:
+        min_forks:: 最小并发数, 也是起始并发数
+        max_forks:: 最大并发数
+        window:: Runner每批的主机数为当前并发数的多少倍, 默认2
+        step:: 线性增减的步长, 默认为 min_forks
+        target_latency:: 每个主机的平均耗时超过它(秒)时降低并发
+        cpu_limit:: 控制机CPU使用率(0~1, 按核数)超过它时并发减半
+        memory_limit:: 控制机内存使用率(0~1)超过它时并发减半
+
+    After each batch: concurrency halves under CPU or memory pressure and
+    shrinks by a quarter when hosts are slower than `target_latency`.
+    Otherwise it doubles while the results per second keep growing by 5%
+    or more (slow start), then grows by `step` as long as they do, and
+    backs off by `step` when they drop by 20% or more.
+    The per-host latency is estimated: batch time * forks / hosts.
+
+    history is [{"started", "forks", "hosts", "seconds", "throughput",
+    "latency", "cpu", "memory", "next", "reason"}, ...], one per batch.
+    """
+    def __init__(self, min_forks=5, max_forks=100, window=2, step=None,
+                 target_latency=None, cpu_limit=0.9, memory_limit=0.9):
+        if min_forks < 1 or max_forks < min_forks:
+            raise ValueError("should be 1 <= min_forks <= max_forks.")
+        self.min_forks = min_forks
+        self.max_forks = max_forks
+        self.window = window
+        self.step = step or min_forks
+        self.target_latency = target_latency
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.cpus = multiprocessing.cpu_count()
+        self.forks = min_forks
+        self.history = []
+        self._slow_start = True
+        self._previous = None
+        self._batch = None
+
+    def reset(self):
+        """ start over from min_forks, for a new run """
+        self.forks = self.min_forks
+        self.history = []
+        self._slow_start = True
+        self._previous = None
+        self._batch = None
+
+    def _bound(self, forks):
+        return max(self.min_forks, min(self.max_forks, int(forks)))
+
+    def begin(self, hosts):
+        """ a batch of `hosts` hosts starts, at self.forks """
+        self._batch = (time.time(), cpu_seconds(), hosts, self.forks)
+
+    def end(self):
+        """ the batch is over: measure it and set the next forks """
+        if self._batch is None:
+            return
+        started, cpu_before, hosts, forks = self._batch
+        self._batch = None
+        seconds = max(time.time() - started, 1e-6)
+        throughput = hosts / seconds
+        latency = seconds * min(forks, hosts) / hosts if hosts else None
+        cpu = (cpu_seconds() - cpu_before) / (seconds * self.cpus)
+        memory = memory_pressure()
+
+        if cpu > self.cpu_limit or (memory is not None and memory > self.memory_limit):
+            reason = "cpu" if cpu > self.cpu_limit else "memory"
+            self.forks = self._bound(forks // 2)
+            self._slow_start = False
+        elif self.target_latency is not None and latency > self.target_latency:
+            reason = "latency"
+            self.forks = self._bound(forks * 0.75)
+            self._slow_start = False
+        elif hosts < forks:
+            # a batch that can't fill the forks says nothing
+            reason = "hold"
+        elif self._previous is None or throughput >= self._previous * 1.05:
+            reason = "grow"
+            self.forks = self._bound(forks * 2 if self._slow_start else forks + self.step)
+        elif throughput < self._previous * 0.8:
+            reason = "shrink"
+            self.forks = self._bound(forks - self.step)
+            self._slow_start = False
+        else:
+            reason = "hold"
+            self._slow_start = False
+        if hosts >= forks:
+            self._previous = throughput
+
+        self.history.append(dict(
+            started=started, forks=forks, hosts=hosts, seconds=seconds,
+            throughput=throughput, latency=latency, cpu=cpu, memory=memory,
+            next=self.forks, reason=reason))
+
+    def batches(self, hosts):
+        """
+        `hosts` in batches of window * forks, each sized when it starts.
+        The caller runs a batch before asking for the next one.
+        """
+        hosts = list(hosts)
+        i = 0
+        while i < len(hosts):
+            batch = hosts[i:i + max(1, self.window * self.forks)]
+            i += len(batch)
+            self.begin(len(batch))
+            yield batch
+            self.end()
+
+
+class _Batches(object):
+    """
+    The batches of a play, each run at the forks of the controller as it
+    starts. Ansible 2.3 checks len() of the batches before it runs them.
+    """
+    def __init__(self, batches, executor):
+        self._batches = batches
+        self._executor = executor
+
+    def __len__(self):
+        return len(self._batches)
+
+    def __iter__(self):
+        controller = self._executor.controller
+        tqm = self._executor._tqm
+        for batch in self._batches:
+            controller.begin(len(batch))
+            tqm._options = tqm._options._replace(forks=controller.forks)
+            try:
+                yield batch
+            finally:
+                # also when run() stops the play after this batch
+                controller.end()
+
+
+class AdaptivePlaybookExecutor(PlaybookExecutor):
+    """
+    PlaybookExecutor whose batches run at the forks of a ForksController.
+    The batches are those of ansible: a play with `serial` in its serial
+    batches, any other play in one batch, so the forks of such a play
+    follow the previous plays.
+    """
+    def __init__(self, controller, **kwargs):
+        super(AdaptivePlaybookExecutor, self).__init__(**kwargs)
+        self.controller = controller
+
+    def _get_serialized_batches(self, play):
+        batches = super(AdaptivePlaybookExecutor, self)._get_serialized_batches(play)
+        return _Batches(batches, self)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding:utf8
+"""
+asyncio support of Runner/PlaybookRunner (python 3.5+).
+
+The TaskQueueManager still runs in a thread of the loop's default executor,
+the result callbacks hand each (host, status, result) to an asyncio.Queue.
+Use it through Runner.run_async()/aiter_results() and the same methods of
+PlaybookRunner.
+
+Written with futures and callbacks rather than `async def`/`await`: the
+package is byte-compiled by python 2.7 too (compileall, pip), where that
+syntax doesn't parse.
+"""
+
+import asyncio
+import functools
+
+from runner import _DONE
+
+
+__all__ = ["run_async", "AsyncResultIterator"]
+
+
+class _LoopQueue(object):
+    """
+    The `queue` of a result callback: put() runs in the executor thread and
+    waits for room in the asyncio.Queue, so a slow consumer slows the run.
+    """
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.closed = False
+
+    def put(self, item):
+        if self.closed:
+            return
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+
+class _RunFuture(asyncio.Future):
+    """
+    A future resolved by the run in the executor. Cancelling it, as
+    cancelling the task awaiting it does, calls `stop()` instead: the
+    future stays pending until the run has wound down, and the task gets
+    its CancelledError then.
+    """
+    def __init__(self, loop, stop):
+        super(_RunFuture, self).__init__(loop=loop)
+        self._stop = stop
+        self.stopping = False
+
+    def cancel(self, *args, **kwargs):
+        if not self.done() and not self.stopping:
+            self.stopping = True
+            self._stop()
+        return False
+
+
+def _settle(future, source):
+    """ done callback of `source`: `future` gets its result or exception """
+    if future.done():
+        return
+    if source.cancelled():
+        future.set_exception(asyncio.CancelledError())
+    elif source.exception() is not None:
+        future.set_exception(source.exception())
+    else:
+        future.set_result(source.result())
+
+
+def run_async(run, terminate):
+    """
+    An awaitable of `run()` in the default executor. Cancelling the
+    awaiting task calls `terminate()` and waits for the run to wind down.
+    """
+    loop = asyncio.get_event_loop()
+    future = _RunFuture(loop, terminate)
+    loop.run_in_executor(None, run).add_done_callback(
+        functools.partial(_settle, future))
+    return future
+
+
+class AsyncResultIterator(object):
+    """
+    `async for host, status, result in ...`, status being
+    ok/failed/unreachable/skipped. At most `maxsize` results wait in the
+    queue. Leaving the loop early: `await aclose()`, which stops the run.
+    """
+    def __init__(self, execute, callback, terminate, maxsize=1000):
+        self._execute = execute
+        self._callback = callback
+        self._terminate = terminate
+        self._maxsize = maxsize
+        self._loop = None
+        self._queue = None
+        self._bridge = None
+        self._future = None
+
+    def __aiter__(self):
+        return self
+
+    def _start(self):
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(self._maxsize)
+        self._bridge = _LoopQueue(self._loop, self._queue)
+        self._callback.queue = self._bridge
+
+        def target():
+            try:
+                self._execute()
+            finally:
+                self._bridge.put(_DONE)
+
+        self._future = self._loop.run_in_executor(None, target)
+
+    def __anext__(self):
+        if self._future is None:
+            self._start()
+
+        getter = self._loop.create_task(self._queue.get())
+
+        def stop():
+            getter.cancel()
+            self._stop()
+            self._future.add_done_callback(
+                lambda _: item.done() or item.set_result(None))
+
+        def got(getter):
+            if item.done() or item.stopping or getter.cancelled():
+                return
+            if getter.result() is not _DONE:
+                item.set_result(getter.result())
+            else:
+                # raises what the run raised, if anything
+                self._future.add_done_callback(ended)
+
+        def ended(future):
+            if item.done():
+                return
+            if not future.cancelled() and future.exception() is not None:
+                item.set_exception(future.exception())
+            else:
+                item.set_exception(StopAsyncIteration())
+
+        item = _RunFuture(self._loop, stop)
+        getter.add_done_callback(got)
+        return item
+
+    def _stop(self):
+        """ stop the run, unblock a put() waiting for room """
+        self._bridge.closed = True
+        self._terminate()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def aclose(self):
+        """ an awaitable: stop the run and wait for it to wind down """
+        loop = self._loop or asyncio.get_event_loop()
+        closed = loop.create_future()
+        if self._future is None or self._future.done():
+            closed.set_result(None)
+            return closed
+        self._stop()
+        self._future.add_done_callback(
+            lambda _: closed.done() or closed.set_result(None))
+        return closed
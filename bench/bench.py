@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# coding:utf8
+"""
+Benchmarks of MyInventory, Runner and PlaybookRunner against fake hosts,
+no real host needed. Prints (or writes with -o) one JSON document:
+
+    inventory:: 每种规模/形式的inventory解析时间
+    inventory_memory:: 普通/compact模式下inventory占用的内存
+    snapshot:: inventory脚本的冷启动时间: 解析, 解析并写快照, 从快照加载
+    patterns:: 各种pattern的匹配时间, 冷(清空缓存)/热
+    runner, playbook:: 不同forks下的总时间、每秒结果数、失败数
+    scheduler:: 慢主机排在最后时, 默认顺序和HostScheduler(LPT)顺序的总时间
+    daemon:: 小job的耗时: 新python进程执行Runner, JobDaemon中执行
+    peak_rss_kb:: 本进程和子进程的峰值内存
+
+    python bench/bench.py --sizes 10,1000,20000 --forks 5,20,50 \\
+        --run-hosts 100 --latency 0.05 --failure-rate 0.01 -o bench.json
+
+The hosts of the runs use the `fake` connection (connection_plugins/fake.py)
+with the latency/failure rate given, or `local` with --connection local.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+import resource
+import shutil
+import subprocess
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, ".."))
+
+from ansible import __version__ as ansible_version
+from ansible.plugins import connection_loader
+
+from myinventory import MyInventory
+from runner import Runner
+from playbook_runner import PlaybookRunner
+from scheduler import HostScheduler
+from daemon import JobDaemon, DaemonClient
+from fake_hosts import make_inventory, make_host_dict, write_inventory_script
+
+
+PATTERNS = ["all", "group0", "host-0001*", "group1*", "~group[0-9]5$",
+            "region0:&group3", "all:!region0", "host-00042,group7"]
+
+PLAYBOOK = """
+- hosts: all
+  gather_facts: no
+  tasks:
+  - ping:
+  - command: "true"
+"""
+
+
+def peak_rss():
+    """ peak RSS in KB (linux) of this process and of its children """
+    return dict(self=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def bench_inventory(sizes, forms):
+    results = []
+    for size in sizes:
+        for form in forms:
+            host_list = make_inventory(size, form)
+            seconds, inventory = timed(MyInventory, host_list)
+            results.append(dict(size=size, form=form, lazy_vars=False,
+                                seconds=seconds, hosts=len(inventory.list_hosts())))
+            if form == "dict":
+                seconds, inventory = timed(MyInventory, host_list, lazy_vars=True)
+                results.append(dict(size=size, form=form, lazy_vars=True,
+                                    seconds=seconds, hosts=len(inventory.list_hosts())))
+    return results
+
+
+def current_rss():
+    """ current RSS in KB (linux) """
+    with open("/proc/self/statm") as fd:
+        return int(fd.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def _inventory_memory(size, compact, shared, output):
+    # in a child: the memory freed by the previous inventories doesn't count
+    host_list = make_host_dict(size, shared_host_vars=shared)
+    before = current_rss()
+    seconds, inventory = timed(MyInventory, host_list, compact=compact)
+    output.put((current_rss() - before, seconds))
+
+
+def bench_inventory_memory(sizes):
+    """ memory of a MyInventory, its host_list aside, normal and compact """
+    results = []
+    for size in sizes:
+        for shared in (False, True):
+            for compact in (False, True):
+                output = multiprocessing.Queue()
+                child = multiprocessing.Process(
+                    target=_inventory_memory, args=(size, compact, shared, output))
+                child.start()
+                kb, seconds = output.get()
+                child.join()
+                results.append(dict(size=size, compact=compact, shared_host_vars=shared,
+                                    rss_kb=kb, seconds=seconds,
+                                    bytes_per_host=kb * 1024 // size))
+    return results
+
+
+def _inventory_cold_start(script, snapshot, output):
+    # in a child: nothing of the previous inventories left in memory
+    seconds, inventory = timed(MyInventory, script, snapshot=snapshot)
+    output.put((seconds, inventory.parser is None, len(inventory.list_hosts())))
+
+
+def bench_snapshot(sizes):
+    """ cold start of a MyInventory of an inventory script, with and without snapshot """
+    results = []
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            script = write_inventory_script(size, directory)
+            snapshot = os.path.join(directory, "inventory.snapshot")
+            for mode, path in (("parse", None), ("parse+save", snapshot), ("load", snapshot)):
+                output = multiprocessing.Queue()
+                child = multiprocessing.Process(
+                    target=_inventory_cold_start, args=(script, path, output))
+                child.start()
+                seconds, loaded, hosts = output.get()
+                child.join()
+                results.append(dict(size=size, mode=mode, seconds=seconds,
+                                    loaded=loaded, hosts=hosts))
+        finally:
+            shutil.rmtree(directory)
+    return results
+
+
+def bench_patterns(size, repeat):
+    inventory = MyInventory(make_host_dict(size))
+    results = []
+    for pattern in PATTERNS:
+        cold = []
+        for i in range(repeat):
+            inventory.clear_pattern_cache()
+            seconds, hosts = timed(inventory.list_hosts, pattern)
+            cold.append(seconds)
+        warm, hosts = timed(inventory.list_hosts, pattern)
+        results.append(dict(size=size, pattern=pattern, hosts=len(hosts),
+                            cold=min(cold), warm=warm))
+    return results
+
+
+def run_options(args):
+    return dict(connection_type=args.connection,
+                extra_vars=["ansible_python_interpreter=%s" % sys.executable])
+
+
+def bench_runner(args):
+    results = []
+    hosts = make_host_dict(args.run_hosts)
+    for forks in args.forks:
+        runner = Runner(hosts=hosts, module_name="ping", forks=forks,
+                        **run_options(args))
+        seconds, result = timed(runner.run)
+        done = len(result["contacted"]) + len(result["dark"])
+        results.append(dict(hosts=args.run_hosts, forks=forks, seconds=seconds,
+                            results_per_second=done / seconds,
+                            failed=len(result["dark"])))
+    return results
+
+
+def bench_playbook(args):
+    results = []
+    hosts = make_host_dict(args.run_hosts)
+    fd, path = tempfile.mkstemp(suffix=".yml")
+    with os.fdopen(fd, "w") as playbook:
+        playbook.write(PLAYBOOK)
+    try:
+        for forks in args.forks:
+            runner = PlaybookRunner(hosts=hosts, playbook_path=path, forks=forks,
+                                    become=False, **run_options(args))
+            seconds, output = timed(runner.run)
+            stats = output["stats"] if isinstance(output, dict) else {}
+            done = sum(s["ok"] + s["failures"] + s["unreachable"] + s["skipped"]
+                       for s in stats.values())
+            results.append(dict(hosts=args.run_hosts, forks=forks, seconds=seconds,
+                                results_per_second=done / seconds,
+                                failed=sum(1 for s in stats.values()
+                                           if s["failures"] or s["unreachable"])))
+    finally:
+        os.remove(path)
+    return results
+
+
+def bench_scheduler(args):
+    """
+    The slowest hosts are the last ones queued by default: the makespan of
+    the default order against that of a run ordered by a HostScheduler
+    which saw one run before.
+    """
+    results = []
+    hosts = make_host_dict(args.run_hosts)
+    names = [h.name for h in MyInventory(hosts).list_hosts()]
+    slow = set(names[-max(1, int(len(names) * args.slow_fraction)):])
+    for name, hostvars in hosts["_meta"]["hostvars"].items():
+        hostvars["delay"] = args.slow_seconds if name in slow else 0
+    for forks in args.forks:
+        def run(scheduler=None):
+            runner = Runner(hosts=hosts, module_name="shell", module_args="sleep {{ delay }}",
+                            forks=forks, scheduler=scheduler, **run_options(args))
+            return timed(runner.run)[0]
+        default = run()
+        scheduler = HostScheduler()
+        learning = run(scheduler)
+        scheduled = run(scheduler)
+        results.append(dict(hosts=args.run_hosts, forks=forks, slow=len(slow),
+                            default=default, learning=learning, scheduled=scheduled))
+    return results
+
+
+def bench_daemon(args):
+    """
+    A small job (a debug task, run on this machine, for one host): in a new
+    python process, in this warm process, and as a job of a JobDaemon.
+    """
+    job = dict(hosts=make_host_dict(1), module_name="debug", module_args="msg=hello")
+    script = ("import sys; sys.path.insert(0, %r); from runner import Runner; "
+              "Runner(**%r).run()" % (os.path.join(HERE, ".."), job))
+    process = []
+    with open(os.devnull, "w") as devnull:
+        for i in range(args.repeat):
+            seconds, code = timed(subprocess.call, [sys.executable, "-c", script],
+                                  stdout=devnull, stderr=devnull)
+            process.append(seconds)
+    in_process = [timed(lambda: Runner(**job).run())[0] for i in range(args.repeat)]
+
+    directory = tempfile.mkdtemp()
+    daemon = JobDaemon(os.path.join(directory, "jobs.sock")).start()
+    try:
+        client = DaemonClient(daemon.address)
+        jobs = [timed(lambda: client.wait(client.submit("runner", **job)))[0]
+                for i in range(args.repeat + 1)]
+    finally:
+        daemon.shutdown()
+        shutil.rmtree(directory)
+    # the first job of the daemon parses the inventory
+    return dict(process=min(process), in_process=min(in_process),
+                daemon_first=jobs[0], daemon=min(jobs[1:]))
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int_list, default=[10, 1000, 20000],
+                        help="inventory sizes, comma separated")
+    parser.add_argument("--forms", default="dict,list,string",
+                        help="inventory forms: dict, list, string")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="pattern runs, the best one counts")
+    parser.add_argument("--forks", type=int_list, default=[5, 20, 50])
+    parser.add_argument("--run-hosts", type=int, default=100,
+                        help="hosts of the Runner/PlaybookRunner runs, 0 to skip them")
+    parser.add_argument("--connection", default="fake", choices=["fake", "local"])
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="fake: seconds added to each command")
+    parser.add_argument("--connect-latency", type=float, default=0.0,
+                        help="fake: seconds to connect to a host")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="fake: probability that a host is unreachable")
+    parser.add_argument("--slow-fraction", type=float, default=0.1,
+                        help="scheduler: fraction of slow hosts")
+    parser.add_argument("--slow-seconds", type=float, default=2.0,
+                        help="scheduler: seconds a slow host takes")
+    parser.add_argument("-o", "--output", help="write the JSON there, not to stdout")
+    args = parser.parse_args()
+
+    connection_loader.add_directory(os.path.join(HERE, "connection_plugins"))
+    os.environ["FAKE_LATENCY"] = str(args.latency)
+    os.environ["FAKE_CONNECT_LATENCY"] = str(args.connect_latency)
+    os.environ["FAKE_JITTER"] = str(args.jitter)
+    os.environ["FAKE_FAILURE_RATE"] = str(args.failure_rate)
+
+    report = dict(
+        python=platform.python_version(),
+        ansible=ansible_version,
+        args=vars(args),
+        peak_rss_kb={},
+    )
+    report["inventory"] = bench_inventory(args.sizes, args.forms.split(","))
+    report["peak_rss_kb"]["inventory"] = peak_rss()
+    report["inventory_memory"] = bench_inventory_memory(args.sizes)
+    report["snapshot"] = bench_snapshot(args.sizes)
+    report["patterns"] = bench_patterns(max(args.sizes), args.repeat)
+    report["peak_rss_kb"]["patterns"] = peak_rss()
+    if args.run_hosts:
+        report["runner"] = bench_runner(args)
+        report["peak_rss_kb"]["runner"] = peak_rss()
+        report["playbook"] = bench_playbook(args)
+        report["peak_rss_kb"]["playbook"] = peak_rss()
+        report["scheduler"] = bench_scheduler(args)
+        report["peak_rss_kb"]["scheduler"] = peak_rss()
+        report["daemon"] = bench_daemon(args)
+
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(data + "\n")
+    else:
+        print(data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# coding:utf8
+"""
+`fake` connection: the `local` connection, made to look like a remote host.
+
+    FAKE_CONNECT_LATENCY   seconds to "connect" to a host, default 0
+    FAKE_LATENCY           seconds added to each command, default 0
+    FAKE_JITTER            +/- random part of both latencies, default 0
+    FAKE_FAILURE_RATE      probability that a host is unreachable, default 0
+
+The benchmarks load it with connection_loader.add_directory().
+"""
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+import random
+import time
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.plugins.connection.local import Connection as LocalConnection
+
+
+def _setting(name):
+    return float(os.environ.get(name) or 0)
+
+
+def _sleep(latency):
+    jitter = _setting("FAKE_JITTER")
+    delay = latency + random.uniform(-jitter, jitter) if jitter else latency
+    if delay > 0:
+        time.sleep(delay)
+
+
+class Connection(LocalConnection):
+    ''' local connection with simulated latency and failures '''
+
+    transport = 'fake'
+
+    def _connect(self):
+        if not self._connected:
+            _sleep(_setting("FAKE_CONNECT_LATENCY"))
+            if random.random() < _setting("FAKE_FAILURE_RATE"):
+                raise AnsibleConnectionFailure(
+                    "fake: %s is unreachable" % self._play_context.remote_addr)
+        return super(Connection, self)._connect()
+
+    def exec_command(self, cmd, in_data=None, sudoable=True):
+        _sleep(_setting("FAKE_LATENCY"))
+        return super(Connection, self).exec_command(cmd, in_data=in_data, sudoable=sudoable)
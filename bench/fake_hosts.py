@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding:utf8
+"""
+Synthetic inventories for the benchmarks, in the forms MyInventory takes:
+a dict (like a dynamic inventory's output), a list and a comma string.
+
+Hosts are named host-00000..., `group_size` hosts per group group0...,
+groups grouped by `groups_per_region` under region0...
+The dict can also be the output of an inventory script.
+"""
+
+import os
+import sys
+import json
+
+
+def host_names(count):
+    return ["host-%05d" % i for i in range(count)]
+
+
+def make_host_dict(count, group_size=50, groups_per_region=10, host_vars=True,
+                   shared_host_vars=False):
+    """
+    host_vars: each host has its own host_id/rack vars. shared_host_vars:
+    the vars of a host are those of many others instead (user, port and
+    one of 40 racks), each in its own dict as a parsed JSON would be.
+    """
+    inventory = {}
+    names = host_names(count)
+    groups = []
+    for i in range(0, count, group_size):
+        name = "group%d" % (i // group_size)
+        groups.append(name)
+        inventory[name] = {
+            "hosts": names[i:i + group_size],
+            "vars": {"group_id": i // group_size, "ntp_server": "ntp-%d" % (i % 7)},
+        }
+
+    for i in range(0, len(groups), groups_per_region):
+        inventory["region%d" % (i // groups_per_region)] = {
+            "children": groups[i:i + groups_per_region],
+            "vars": {"region": i // groups_per_region},
+        }
+
+    if shared_host_vars:
+        inventory["_meta"] = {"hostvars": dict(
+            (name, {"ansible_user": "deploy", "ansible_port": 22, "rack": "rack-%d" % (n % 40)})
+            for n, name in enumerate(names))}
+    elif host_vars:
+        inventory["_meta"] = {"hostvars": dict(
+            (name, {"host_id": n, "rack": "rack-%d" % (n % 40)})
+            for n, name in enumerate(names))}
+    return inventory
+
+
+def make_host_list(count):
+    return host_names(count)
+
+
+def make_host_string(count):
+    return ",".join(host_names(count))
+
+
+def write_inventory_script(count, directory, **kwargs):
+    """
+    An executable inventory script printing make_host_dict(count) for
+    --list, with its _meta: the path of the script.
+    """
+    data = os.path.join(directory, "inventory.json")
+    with open(data, "w") as fd:
+        json.dump(make_host_dict(count, **kwargs), fd)
+    path = os.path.join(directory, "inventory.py")
+    with open(path, "w") as fd:
+        fd.write("#!%s\nimport sys\n"
+                 "if sys.argv[1:] == ['--list']:\n"
+                 "    sys.stdout.write(open(%r).read())\n"
+                 "else:\n"
+                 "    sys.stdout.write('{}')\n" % (sys.executable, data))
+    os.chmod(path, 0o755)
+    return path
+
+
+def make_inventory(count, form="dict", **kwargs):
+    if form == "dict":
+        return make_host_dict(count, **kwargs)
+    if form == "list":
+        return make_host_list(count)
+    if form == "string":
+        return make_host_string(count)
+    raise ValueError("unknown inventory form: %s" % form)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding:utf8
+"""
+Startup latency of the API: each case runs in a new python process,
+timed from its first import. Prints (or writes with -o) one JSON document:
+
+    import_myinventory, import_runner, import_playbook_runner, import_session:: import的耗时
+    inventory:: import myinventory, 解析 --hosts 个主机的dict, 匹配pattern
+    first_run:: import runner, 第一个Runner(本机执行debug, 1个主机)的耗时
+    process:: 新python进程执行first_run的总耗时(含解释器启动)
+
+each with seconds (the best of --repeat), modules (the number of modules
+loaded) and heavy (those of HEAVY it loaded).
+
+    python bench/startup.py --budget bench/startup_budget.json
+
+With --budget, the report is checked against the budget file, and the
+exit status is 1 if a case is slower than its seconds, loads more modules
+than its modules, or loads one of its forbidden modules:
+
+    {"seconds": {"import_runner": 0.3, ...},
+     "modules": {"import_runner": 300, ...},
+     "forbidden": {"import_runner": ["ansible.parsing.dataloader", ...], ...}}
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+# what the entry points should only import when they run something
+HEAVY = ["ansible.parsing.dataloader", "ansible.vars", "ansible.template",
+         "ansible.playbook.play", "ansible.plugins.callback",
+         "ansible.executor.task_queue_manager",
+         "ansible.executor.playbook_executor", "jinja2", "yaml"]
+
+# run by the new process: `setup` isn't timed, `code` is
+CHILD = """
+import sys, time, json
+sys.path[:0] = [%(root)r, %(here)r]
+%(setup)s
+start = time.time()
+%(code)s
+seconds = time.time() - start
+print(json.dumps(dict(seconds=seconds, modules=len(sys.modules),
+                      heavy=[m for m in %(heavy)r if m in sys.modules])))
+"""
+
+CASES = [
+    ("import_myinventory", "", "import myinventory"),
+    ("import_runner", "", "import runner"),
+    ("import_playbook_runner", "", "import playbook_runner"),
+    ("import_session", "", "import session"),
+    ("inventory",
+     "from fake_hosts import make_host_dict; data = make_host_dict(%(hosts)d)",
+     "from myinventory import MyInventory\n"
+     "MyInventory(data).get_hosts('group1*:!host-00010')"),
+    ("first_run",
+     "from fake_hosts import make_host_dict; data = make_host_dict(1)",
+     "from runner import Runner\n"
+     "Runner(hosts=data, module_name='debug', module_args='msg=hello').run()"),
+]
+
+
+def run_case(setup, code, args):
+    script = CHILD % dict(root=ROOT, here=HERE, heavy=HEAVY,
+                          setup=setup % vars(args), code=code % vars(args))
+    start = time.time()
+    output = subprocess.check_output([sys.executable, "-W", "ignore", "-c", script],
+                                     stderr=open(os.devnull, "w"))
+    seconds = time.time() - start
+    result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    return seconds, result
+
+
+def bench_startup(args):
+    report = {}
+    for name, setup, code in CASES:
+        runs = [run_case(setup, code, args) for i in range(args.repeat)]
+        best = min(runs, key=lambda run: run[1]["seconds"])[1]
+        report[name] = best
+        if name == "first_run":
+            report["process"] = dict(min(runs)[1], seconds=min(runs)[0])
+    return report
+
+
+def check_budget(report, budget):
+    """ the list of what exceeds the budget """
+    errors = []
+    for name, limit in sorted(budget.get("seconds", {}).items()):
+        if report[name]["seconds"] > limit:
+            errors.append("%s: %.3fs > %.3fs" % (name, report[name]["seconds"], limit))
+    for name, limit in sorted(budget.get("modules", {}).items()):
+        if report[name]["modules"] > limit:
+            errors.append("%s: %d modules > %d" % (name, report[name]["modules"], limit))
+    for name, modules in sorted(budget.get("forbidden", {}).items()):
+        loaded = [m for m in modules if m in report[name]["heavy"]]
+        if loaded:
+            errors.append("%s: imports %s" % (name, ", ".join(loaded)))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="processes per case, the best one is kept")
+    parser.add_argument("--hosts", type=int, default=1000,
+                        help="hosts of the inventory case")
+    parser.add_argument("--budget", help="a JSON budget file to check the report against")
+    parser.add_argument("-o", "--output", help="write the JSON there, not to stdout")
+    args = parser.parse_args()
+
+    from ansible import __version__ as ansible_version
+    report = dict(python=platform.python_version(), ansible=ansible_version,
+                  args=vars(args), startup=bench_startup(args))
+
+    errors = []
+    if args.budget:
+        with open(args.budget) as fd:
+            errors = check_budget(report["startup"], json.load(fd))
+        report["budget_errors"] = errors
+
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(data + "\n")
+    else:
+        print(data)
+    for error in errors:
+        sys.stderr.write("over budget: %s\n" % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
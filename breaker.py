@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import time
+import sqlite3
+import threading
+from ansible.compat.six import string_types
+
+
+__all__ = ["CircuitBreaker"]
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker(object):
+    """
+    Health of the hosts across runs, kept in a SQLite database so that
+    every Runner/PlaybookRunner (and process) using it shares it.
+    参数说明:
+        path:: SQLite文件, 默认只在内存中
+        threshold:: 连续不可达多少次后暂时排除该主机
+        backoff:: 第一次排除的时间(秒), 之后每次探测失败翻倍
+        max_backoff:: 排除时间的上限(秒)
+
+    An excluded host (open) is left out of the runs until its backoff is
+    over, then the next run probes it (half_open): reachable closes the
+    breaker, unreachable opens it again for twice as long. Any result
+    other than unreachable counts as reachable.
+
+        breaker = CircuitBreaker("/var/lib/ansible/breaker.db", threshold=3)
+        result = Runner(hosts=host_dict, module_name="ping", breaker=breaker).run()
+        result["skipped_by_breaker"]    # hosts left out of this run
+    """
+    def __init__(self, path=":memory:", threshold=3, backoff=60, max_backoff=3600):
+        self.path = path
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        # results come from the thread of Runner.iter_results() too
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS breaker (
+                host TEXT PRIMARY KEY, state TEXT, failures INTEGER,
+                trips INTEGER, retry_at REAL, updated REAL, error TEXT)""")
+        self._db.commit()
+        # hosts with a row: a reachable host without one costs no write
+        self._known = set()
+        self._load_known()
+
+    def _load_known(self):
+        self._known = set(row[0] for row in self._db.execute("SELECT host FROM breaker"))
+
+    def _row(self, host):
+        row = self._db.execute(
+            "SELECT state, failures, trips, retry_at, updated, error "
+            "FROM breaker WHERE host = ?", (host,)).fetchone()
+        if row is None:
+            return dict(host=host, state=CLOSED, failures=0, trips=0,
+                        retry_at=None, updated=None, error=None)
+        return dict(host=host, state=row[0], failures=row[1], trips=row[2],
+                    retry_at=row[3], updated=row[4], error=row[5])
+
+    def _save(self, state):
+        self._db.execute(
+            "INSERT OR REPLACE INTO breaker "
+            "(host, state, failures, trips, retry_at, updated, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (state["host"], state["state"], state["failures"], state["trips"],
+             state["retry_at"], time.time(), state["error"]))
+        self._db.commit()
+        self._known.add(state["host"])
+
+    def excluded(self, hosts):
+        """
+        The names among `hosts` to leave out of a run. Hosts whose backoff
+        is over are let through, as probes.
+        """
+        names = [h if isinstance(h, string_types) else h.name for h in hosts]
+        now = time.time()
+        excluded = []
+        with self._lock:
+            # other processes may have updated the database
+            self._load_known()
+            for name in names:
+                if name not in self._known:
+                    continue
+                state = self._row(name)
+                if state["state"] != OPEN:
+                    continue
+                if state["retry_at"] is not None and now < state["retry_at"]:
+                    excluded.append(name)
+                else:
+                    state["state"] = HALF_OPEN
+                    self._save(state)
+        return excluded
+
+    def success(self, host):
+        with self._lock:
+            if host not in self._known:
+                return
+            self._db.execute("DELETE FROM breaker WHERE host = ?", (host,))
+            self._db.commit()
+            self._known.discard(host)
+
+    def failure(self, host, error=None):
+        with self._lock:
+            state = self._row(host)
+            state["failures"] += 1
+            state["error"] = error
+            if state["state"] == HALF_OPEN or state["failures"] >= self.threshold:
+                # the probe failed, or too many failures in a row
+                state["trips"] += 1
+                delay = min(self.backoff * 2 ** (state["trips"] - 1), self.max_backoff)
+                state["state"] = OPEN
+                state["retry_at"] = time.time() + delay
+            self._save(state)
+
+    def observe(self, host, status, result=None):
+        """ feed a result, status being ok/failed/unreachable/skipped """
+        if status == "unreachable":
+            error = result.get("msg") if isinstance(result, dict) else None
+            self.failure(host, error)
+        else:
+            self.success(host)
+
+    def state(self, host):
+        """ {"state", "failures", "trips", "retry_at", "updated", "error"} """
+        with self._lock:
+            return self._row(host)
+
+    def states(self, state=None):
+        """ {host: state} of the hosts with a failure, or in `state` only """
+        with self._lock:
+            hosts = list(self._known)
+            states = [self._row(host) for host in hosts]
+        return dict((s["host"], s) for s in states
+                    if state is None or s["state"] == state)
+
+    def reset(self, host=None):
+        """ close the breaker of `host`, or of every host """
+        with self._lock:
+            if host is None:
+                self._db.execute("DELETE FROM breaker")
+                self._known.clear()
+            else:
+                self._db.execute("DELETE FROM breaker WHERE host = ?", (host,))
+                self._known.discard(host)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# coding:utf8
+"""
+The callbacks of Runner/BatchRunner and of PlaybookRunner: they import
+ansible's callback plugins, which load jinja2, yaml and the templating,
+so they are only imported by the first run (see runner.py).
+"""
+
+from ansible.plugins.callback import CallbackBase
+
+
+__all__ = ["ResultCallback", "BatchResultCallback", "CallbackModule"]
+
+
+class ResultCallback(CallbackBase):
+    """
+    Custom Callback
+
+    With a `queue`, results are put there as (host, status, result), with
+    a `sink` (see result_sink.py) they are written to it, instead of being
+    kept in result_q. status is one of ok/failed/unreachable/skipped,
+    or timed_out/cancelled for the hosts a `watchdog` (see watchdog.py)
+    cut off.
+    A `projection` (see projection.py) trims each result before all that.
+    A `timing` (see timing.py) records when each host result arrives.
+    A `fact_cache` (see fact_cache.py) gets the facts of each result.
+    A `breaker` (see breaker.py) learns from each result which hosts are down.
+    With `skip_setup`, the facts gathering of the play is left out, unless
+    it fails or the host is unreachable: that's the last result of the host.
+    """
+    def __init__(self, queue=None, sink=None, projection=None, timing=None,
+                 fact_cache=None, breaker=None, skip_setup=False):
+        self.result_q = dict(contacted={}, dark={})
+        self.queue = queue
+        self.sink = sink
+        self.projection = projection
+        self.timing = timing
+        self.fact_cache = fact_cache
+        self.breaker = breaker
+        self.skip_setup = skip_setup
+        # the RunWatchdog of the run in progress, set by Runner
+        self.watchdog = None
+        # the uuids of the tasks of the play, see set_play()
+        self.task_ids = None
+
+    def set_play(self, play):
+        """
+        The play to run: the results of any other task are those of its
+        implicit facts gathering, whatever ansible names it ('Gathering
+        Facts' since 2.3). Task uuids are kept by every copy of a task.
+        """
+        self.task_ids = set(task._uuid for block in play.tasks for task in block.block)
+
+    def is_setup(self, res):
+        """ whether `res` is a result of the facts gathering of the play """
+        if self.task_ids is not None:
+            return res._task._uuid not in self.task_ids
+        return res._task.action == 'setup' and res._task.name in (None, '', 'Gathering Facts')
+
+    def is_last_task(self, res):
+        return True
+
+    def observe(self, status, res):
+        """
+        Time the result and cache its facts. False if it's the result of
+        the facts gathering and that is left out.
+        """
+        if self.timing is not None:
+            self.timing.host_done(res._host.name, status, res._result)
+        if self.fact_cache is not None and status == "ok":
+            self.fact_cache.save_result(res)
+        if self.breaker is not None:
+            self.breaker.observe(res._host.name, status, res._result)
+        # no more results for a host that's unreachable or failed
+        last = status == "unreachable" or \
+            (status == "failed" and not res._task.ignore_errors)
+        keep = last or not (self.skip_setup and self.is_setup(res))
+        if self.watchdog is not None and (last or (keep and self.is_last_task(res))):
+            self.watchdog.add_result(res._host.name, status, res._result)
+            self.watchdog.host_done(res._host.name)
+        return keep
+
+    def gather_cut_off(self, host, status, result):
+        """ a host the watchdog cut off, status being timed_out/cancelled """
+        if self.sink is not None:
+            self.sink.add(host, status, result)
+        if self.queue is not None:
+            self.queue.put((host, status, result))
+        elif self.sink is None:
+            self.result_q.setdefault(status, {})[host] = result
+
+    def gather_result(self, n, status, res):
+        if not self.observe(status, res):
+            return
+        result = res._result
+        if self.projection is not None:
+            result = self.projection(result)
+
+        if self.sink is not None:
+            self.sink.add(res._host.name, status, result,
+                          task=res._task.get_name())
+        if self.queue is not None:
+            self.queue.put((res._host.name, status, result))
+        elif self.sink is None:
+            self.result_q[n].update({res._host.name: result})
+
+    def v2_runner_on_ok(self, result):
+        self.gather_result("contacted", "ok", result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.gather_result("dark", "failed", result)
+
+    def v2_runner_on_unreachable(self, result):
+        self.gather_result("dark", "unreachable", result)
+
+    def v2_runner_on_skipped(self, result):
+        self.gather_result("dark", "skipped", result)
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        if self.timing is not None:
+            self.timing.task_start(task.get_name())
+
+    def v2_playbook_on_play_start(self, play):
+        pass
+
+
+
+class BatchResultCallback(ResultCallback):
+    """
+    Callback of BatchRunner: result_q is {task name: {contacted, dark}},
+    and a `queue` gets (task name, host, status, result). The hosts cut
+    off by a watchdog are in result_q['timed_out'/'cancelled'], with task
+    name None.
+    """
+    def __init__(self, task_names, **kwargs):
+        super(BatchResultCallback, self).__init__(**kwargs)
+        self.last_task = task_names[-1]
+        self.result_q = dict(
+            (name, dict(contacted={}, dark={})) for name in task_names)
+
+    def gather_result(self, n, status, res):
+        if not self.observe(status, res):
+            return
+        name = res._task.get_name()
+        result = res._result
+        if self.projection is not None:
+            result = self.projection(result)
+
+        if self.sink is not None:
+            self.sink.add(res._host.name, status, result, task=name)
+        if self.queue is not None:
+            self.queue.put((name, res._host.name, status, result))
+        elif self.sink is None:
+            self.result_q.setdefault(name, dict(contacted={}, dark={}))
+            self.result_q[name][n].update({res._host.name: result})
+
+    def is_last_task(self, res):
+        return res._task.get_name() == self.last_task
+
+    def gather_cut_off(self, host, status, result):
+        if self.queue is not None:
+            if self.sink is not None:
+                self.sink.add(host, status, result)
+            self.queue.put((None, host, status, result))
+        else:
+            super(BatchResultCallback, self).gather_cut_off(host, status, result)
+
+
+class CallbackModule(CallbackBase):
+    """
+    Custom callback model for handlering the output data of
+    execute playbook file,
+
+    Base on the build-in callback plugins of ansible which named `json`.
+
+    With a `sink` (see result_sink.py), each host result is written to it
+    rather than nested in `output`, and `output` is the sink itself.
+    A `projection` (see projection.py) trims each result before it's kept.
+    With a `queue`, (host, status, result) is put there instead.
+    A `timing` (see timing.py) records when each host result arrives.
+    A `fact_cache` (see fact_cache.py) gets the facts of each result.
+    A `breaker` (see breaker.py) learns from each result which hosts are down.
+    """
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'stdout'
+    CALLBACK_NAME = 'Dict'
+
+    def __init__(self, display=None, sink=None, projection=None, timing=None,
+                 fact_cache=None, breaker=None):
+        super(CallbackModule, self).__init__(display)
+        self.results = []
+        self.output = ""
+        self.item_results = {}  # {"host": []}
+        self.sink = sink
+        self.projection = projection
+        self.timing = timing
+        self.fact_cache = fact_cache
+        self.breaker = breaker
+        self.queue = None
+
+    def _new_play(self, play):
+        return {
+            'play': {
+                'name': play.name,
+                'id': str(play._uuid)
+            },
+            'tasks': []
+        }
+
+    def _new_task(self, task):
+        return {
+            'task': {
+                'name': task.get_name(),
+            },
+            'hosts': {}
+        }
+
+    def v2_playbook_on_no_hosts_matched(self):
+        self.output = "skipping: No match hosts."
+        if self.sink is not None:
+            self.sink.message = self.output
+
+    def v2_playbook_on_no_hosts_remaining(self):
+        pass
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.results[-1]['tasks'].append(self._new_task(task))
+        if self.timing is not None:
+            self.timing.task_start(task.get_name())
+
+    def v2_playbook_on_play_start(self, play):
+        self.results.append(self._new_play(play))
+
+    def v2_playbook_on_stats(self, stats):
+        hosts = sorted(stats.processed.keys())
+        summary = {}
+        for h in hosts:
+            s = stats.summarize(h)
+            summary[h] = s
+
+        if self.sink is not None:
+            # the sink, always: the message is sink.message
+            self.sink.stats = summary
+            self.sink.flush()
+            self.output = self.sink
+        elif self.output:
+            pass
+        else:
+            self.output = {
+                'plays': self.results,
+                'stats': summary
+            }
+
+    def gather_result(self, res, status):
+        if self.timing is not None:
+            self.timing.host_done(res._host.name, status, res._result)
+        if self.breaker is not None:
+            self.breaker.observe(res._host.name, status, res._result)
+        if res._task.loop and "results" in res._result and res._host.name in self.item_results:
+            res._result.update({"results": self.item_results[res._host.name]})
+            del self.item_results[res._host.name]
+
+        result = res._result
+        if self.projection is not None:
+            result = self.projection(result)
+
+        if self.sink is not None:
+            self.sink.add(res._host.name, status, result,
+                          task=res._task.get_name(),
+                          play=self.results[-1]['play']['name'])
+        if self.queue is not None:
+            self.queue.put((res._host.name, status, result))
+        if self.sink is not None or self.queue is not None:
+            return
+
+        self.results[-1]['tasks'][-1]['hosts'][res._host.name] = result
+
+    def v2_runner_on_ok(self, res, **kwargs):
+        if self.fact_cache is not None:
+            self.fact_cache.save_result(res)
+        if "ansible_facts" in res._result:
+            del res._result["ansible_facts"]
+
+        self.gather_result(res, "ok")
+
+    def v2_runner_on_failed(self, res, **kwargs):
+        self.gather_result(res, "failed")
+
+    def v2_runner_on_unreachable(self, res, **kwargs):
+        self.gather_result(res, "unreachable")
+
+    def v2_runner_on_skipped(self, res, **kwargs):
+        self.gather_result(res, "skipped")
+
+    def gather_item_result(self, res):
+        self.item_results.setdefault(res._host.name, []).append(res._result)
+
+    def v2_runner_item_on_ok(self, res):
+        self.gather_item_result(res)
+
+    def v2_runner_item_on_failed(self, res):
+        self.gather_item_result(res)
+
+    def v2_runner_item_on_skipped(self, res):
+        self.gather_item_result(res)
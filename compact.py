@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import uuid
+from ansible.inventory.host import Host
+from ansible.compat.six import string_types, integer_types
+
+
+__all__ = ["CompactHost", "SharedVars", "VarsTable"]
+
+
+SCALARS = string_types + integer_types + (float, bool, type(None))
+
+
+class SharedVars(dict):
+    """
+    The vars of a host which other hosts share: not to be written to,
+    CompactHost.set_variable() copies it first.
+    """
+    __slots__ = ()
+
+
+# the vars of a new host, until it gets its own
+EMPTY_VARS = SharedVars()
+
+
+class CompactHost(Host):
+    """
+    Host without an instance __dict__: every attribute Host sets is a
+    slot, which leaves 7 pointers per host instead of a dict of 7 entries,
+    and its uuid is kept as an int. `vars` may be SharedVars, it's the
+    same empty one for every new host.
+    """
+    __slots__ = ("name", "vars", "groups", "address", "_gathered_facts",
+                 "_uuid", "implicit")
+
+    def __init__(self, name=None, port=None, gen_uuid=True):
+        self.name = name
+        self.vars = EMPTY_VARS
+        self.groups = []
+        self.address = name
+        if port:
+            self.set_variable('ansible_port', int(port))
+        self._gathered_facts = False
+        self._uuid = uuid.uuid4().int if gen_uuid else None
+        self.implicit = False
+
+    def set_variable(self, key, value):
+        if isinstance(self.vars, SharedVars):
+            self.vars = dict(self.vars)
+        self.vars[key] = value
+
+
+class VarsTable(object):
+    """
+    One object per distinct var key/value and one dict per distinct set of
+    host vars, as far as they are hashable. Identical host vars layers,
+    like {"ansible_user": "deploy", "ansible_port": 22} on thousands of
+    hosts, are then stored once as SharedVars.
+    """
+    def __init__(self):
+        self._values = {}       # (type, value): value
+        self._layers = {}       # hash of the items: [SharedVars, ...]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._layers.values())
+
+    @staticmethod
+    def _same(a, b):
+        return len(a) == len(b) and all(
+            k in b and type(b[k]) is type(v) and b[k] == v for k, v in a.items())
+
+    def value(self, value):
+        if not isinstance(value, SCALARS):
+            return value
+        # keyed with the type: 1, 1.0 and True are equal
+        return self._values.setdefault((type(value), value), value)
+
+    def interned(self, data):
+        """ a copy of the dict `data`, its keys and scalar values interned """
+        return dict((self.value(k), self.value(v)) for k, v in data.items())
+
+    def share(self, data):
+        """ the SharedVars equal to the dict `data`, or `data` if unhashable """
+        if isinstance(data, SharedVars):
+            return data
+        data = self.interned(data)
+        try:
+            # only the hash is kept, a frozenset per layer would cost more
+            # than most layers
+            key = hash(frozenset((k, type(v), v) for k, v in data.items()))
+        except TypeError:
+            # lists, dicts...: kept as they are
+            return data
+        bucket = self._layers.setdefault(key, [])
+        for layer in bucket:
+            if self._same(data, layer):
+                return layer
+        layer = SharedVars(data)
+        bucket.append(layer)
+        return layer
+
+    def clear(self):
+        self._values.clear()
+        self._layers.clear()
@@ -0,0 +1,665 @@
+#!/usr/bin/env python
+# coding:utf8
+
+from __future__ import print_function
+import os
+import hmac
+import json
+import time
+import heapq
+import signal
+import socket
+import argparse
+import binascii
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from ansible.compat.six import string_types
+from ansible.compat.six.moves import queue, socketserver
+from ansible.errors import AnsibleError
+from ansible.playbook import Playbook
+from ansible.vars import VariableManager
+
+from myinventory import MyInventory
+from inventory_cache import InventoryCache
+from playbook_cache import PlaybookCache, CachingDataLoader
+from result_sink import ResultSink
+from runner import Runner, BatchRunner, kill_processes
+from playbook_runner import PlaybookRunner
+
+
+__all__ = ["JobDaemon", "DaemonClient", "Job"]
+
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# the kinds of job: the runner class, called with the args of the job
+RUNNERS = {"runner": Runner, "batch": BatchRunner, "playbook": PlaybookRunner}
+
+
+def _encode(message):
+    return (json.dumps(message, default=repr) + "\n").encode("utf-8")
+
+
+def read_token(path, create=False):
+    """
+    The shared token of a JobDaemon in `path`, a file only its owner may
+    read. With `create`, a random one is written there if it's missing.
+    """
+    if create and not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(binascii.hexlify(os.urandom(32)).decode("ascii"))
+    if os.stat(path).st_mode & 0o077:
+        raise AnsibleError("%s should only be readable by its owner (chmod 600)." % path)
+    with open(path) as f:
+        token = f.read().strip()
+    if not token:
+        raise AnsibleError("%s is empty." % path)
+    return token
+
+
+class _JobSink(ResultSink):
+    """ the sink of a job process: send each record to the daemon """
+    def __init__(self, queue):
+        super(_JobSink, self).__init__()
+        self.queue = queue
+
+    def _write(self, record):
+        self.queue.put(("record", record))
+
+    def records(self, host=None, task=None, status=None):
+        # they are in the Job of the daemon
+        return iter(())
+
+
+def _summary(runner, sink, output):
+    summary = dict(stats=sink.stats, skipped_by_breaker=sink.skipped_by_breaker)
+    if sink.timing is not None:
+        summary["timing"] = sink.timing.to_dict()
+    if sink.concurrency is not None:
+        summary["concurrency"] = sink.concurrency
+    if getattr(runner, "quorum", None) is not None:
+        summary["quorum_reached"] = runner.quorum_reached
+    if sink.message is not None:
+        # PlaybookRunner: no hosts matched
+        summary["message"] = sink.message
+    return summary
+
+
+def _run_job(runner_class, kwargs, results):
+    """ the process of a job, forked from the daemon: run it, send back its results """
+    pid = os.getpid()
+    runners = []
+
+    def stop(signum, frame):
+        if os.getpid() != pid:
+            # a worker of the run, forked with this handler
+            os._exit(1)
+        # cancelled: the run stops and what it has is sent
+        for runner in runners:
+            runner.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        sink = _JobSink(results)
+        runner = runner_class(result_sink=sink, **kwargs)
+        runners.append(runner)
+        output = runner.run()
+        results.put(("done", _summary(runner, sink, output)))
+    except Exception as e:
+        results.put(("error", "%s" % e))
+
+
+class Job(object):
+    """
+    a job of a JobDaemon: its state and its results so far, the last
+    `max_records` of them (None: all); counts covers them all
+    """
+    def __init__(self, id, kind, args, priority=0, queue="default", max_records=None):
+        self.id = id
+        self.kind = kind
+        self.args = args
+        self.priority = priority
+        self.queue = queue
+        self.state = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.results = []   # records: {"play", "task", "host", "status", "result"}
+        self.max_records = max_records
+        self.dropped = 0    # the records before self.results[0], no longer kept
+        self.counts = {}
+        self.summary = None
+        self.error = None
+        self.process = None
+        self.cancelled = False
+        self.cancelled_at = None
+        self.cond = threading.Condition()
+
+    def add(self, record):
+        with self.cond:
+            self.results.append(record)
+            if self.max_records is not None and len(self.results) > self.max_records:
+                del self.results[0]
+                self.dropped += 1
+            self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+            self.cond.notify_all()
+
+    def finish(self, state):
+        with self.cond:
+            self.state = state
+            self.finished = time.time()
+            self.process = None
+            self.cond.notify_all()
+
+    def events(self, offset=0):
+        """
+        yield {"event": "result", ...record} for each result from `offset`
+        (None: from now) on, as they arrive, then {"event": "end", ...status}
+        once finished. The records no longer kept are skipped.
+        """
+        with self.cond:
+            index = self.total() if offset is None else offset
+        while True:
+            with self.cond:
+                while index >= self.total() and self.state not in FINISHED:
+                    # py2's wait() without a timeout can't be interrupted
+                    self.cond.wait(1)
+                records = self.since(index)
+                index = self.total()
+                finished = self.state in FINISHED
+            for record in records:
+                event = dict(record, job=self.id, event="result")
+                yield event
+            if finished:
+                break
+        yield dict(self.status(), event="end")
+
+    def total(self):
+        """ the number of results so far, kept or not """
+        return self.dropped + len(self.results)
+
+    def since(self, offset):
+        """ the records kept from the `offset`-th result on """
+        return self.results[max(0, offset - self.dropped):]
+
+    def status(self):
+        return dict(job=self.id, kind=self.kind, priority=self.priority,
+                    queue=self.queue, state=self.state, submitted=self.submitted,
+                    started=self.started, finished=self.finished,
+                    results=self.total(), dropped=self.dropped, counts=dict(self.counts),
+                    summary=self.summary, error=self.error)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """ one connection: JSON requests, one per line, each answered by JSON lines """
+    def handle(self):
+        daemon = self.server.job_daemon
+        for line in iter(self.rfile.readline, b""):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode("utf-8"))
+                if not daemon.authorized(request):
+                    self.wfile.write(_encode(dict(ok=False, error="bad or missing token")))
+                    self.wfile.flush()
+                    return
+                for reply in daemon.handle(request):
+                    self.wfile.write(_encode(reply))
+                    self.wfile.flush()
+            except (socket.error, IOError):
+                # the client left
+                return
+            except Exception as e:
+                try:
+                    self.wfile.write(_encode(dict(ok=False, error="%s" % e)))
+                    self.wfile.flush()
+                except (socket.error, IOError):
+                    return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class JobDaemon(object):
+    """
+    A long running process taking ad-hoc and playbook jobs over a Unix
+    socket (or a localhost TCP port, with a token): ansible is imported once, the
+    inventories and playbooks are parsed once (InventoryCache,
+    PlaybookCache), and each job runs in a process forked from this warm
+    one, in priority order, at most `max_jobs` at a time.
+    参数说明:
+        address:: Unix socket的路径(权限0600), 或本机TCP地址 ("127.0.0.1", port)
+        token_file:: 共享token的文件, 只能所有者读写(0600), 不存在时生成;
+                     每个请求须带上它, TCP时必须有, 因为本机所有用户都能连接
+        max_jobs:: 同时执行的job数, 默认4
+        limits:: {队列名: 该队列同时执行的job数}, 比如 {"deploy": 1}
+        defaults:: 每个job的Runner/PlaybookRunner默认参数, 可以是对象,
+                   比如 fact_cache, breaker, ssh_pool
+        inventory_cache:: InventoryCache对象, 默认 InventoryCache(maxsize=32, ttl=300)
+        playbook_cache:: PlaybookCache对象, 默认新建一个
+        history:: 保留多少个已结束job的状态和结果, 默认1000
+        max_records:: 每个job在内存中保留的最近结果数, 默认1000, None不限;
+                      counts 仍统计所有结果, watch/stream 边执行边返回所有结果
+        kill_after:: 取消执行中的job后等待它结束的时间(秒), 之后强制结束(SIGKILL), 默认30
+
+    The protocol is JSON lines, one request per line:
+        {"op": "submit", "kind": "runner"|"batch"|"playbook", "args": {...},
+         "priority": 0, "queue": "default", "stream": false}
+        {"op": "status", "job": id}, {"op": "status"}: one job, every job
+        {"op": "watch", "job": id, "offset": 0}: its results as they arrive
+        {"op": "results", "job": id, "offset": 0}, {"op": "cancel", "job": id}
+        {"op": "ping"}
+    With a token_file, each request also has {"token": ...}, a connection
+    without it is answered {"ok": false, ...} and closed.
+    A request that fails is answered {"ok": false, "error": message}.
+    `args` are the arguments of the runner class. A higher priority runs
+    first. With "stream" (and for "watch") the answer is one line per
+    result, {"event": "result", "host", "status", "result", "task", ...},
+    then {"event": "end", "state", "counts", "summary", "error", ...}.
+    See DaemonClient.
+
+        daemon = JobDaemon("/run/ansible-jobs.sock", max_jobs=8,
+                           defaults=dict(fact_cache=JsonFactCache("/var/cache/facts")))
+        daemon.serve_forever()
+    """
+    def __init__(self, address, max_jobs=4, limits=None, defaults=None,
+                 inventory_cache=None, playbook_cache=None, history=1000,
+                 kill_after=30, token_file=None, max_records=1000):
+        if max_jobs < 1:
+            raise AnsibleError("max_jobs should be 1 at least.")
+        if not isinstance(address, string_types) and token_file is None:
+            # the jobs run as this user, with its SSH keys
+            raise AnsibleError("a TCP JobDaemon needs a token_file: any local user can connect to it.")
+        self.address = address
+        self.token = read_token(token_file, create=True) if token_file else None
+        self.max_jobs = max_jobs
+        self.limits = limits or {}
+        self.defaults = defaults or {}
+        self.inventory_cache = inventory_cache or InventoryCache(maxsize=32, ttl=300)
+        self.playbook_cache = playbook_cache or PlaybookCache()
+        self.history = history
+        self.max_records = max_records
+        self.kill_after = kill_after
+        self.jobs = OrderedDict()   # id: Job
+        self._ids = itertools.count(1)
+        self._queue = []            # heap of (-priority, n, job)
+        self._running = {}          # queue name: jobs running
+        self._active = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._server = None
+        self._threads = []
+
+    # jobs
+
+    def submit(self, kind, args=None, priority=0, queue="default"):
+        """ queue a job: RUNNERS[kind](**args) """
+        if kind not in RUNNERS:
+            raise AnsibleError("unknown kind of job: %s, should be one of %s"
+                               % (kind, ", ".join(sorted(RUNNERS))))
+        if args is not None and not isinstance(args, dict):
+            raise AnsibleError("the args of a job should be a dict.")
+        with self._cond:
+            n = next(self._ids)
+            job = Job("%d" % n, kind, dict(args or {}), priority, queue or "default",
+                      self.max_records)
+            self.jobs[job.id] = job
+            heapq.heappush(self._queue, (-job.priority, n, job))
+            self._forget_finished()
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id):
+        job = self.jobs.get("%s" % job_id)
+        if job is None:
+            raise AnsibleError("no such job: %s" % job_id)
+        return job
+
+    def cancel(self, job_id):
+        """
+        A queued job won't run, a running one is stopped: SIGTERM, then
+        SIGKILL if its process hasn't exited after `kill_after` seconds.
+        """
+        job = self.get(job_id)
+        with self._cond:
+            if job.state in FINISHED:
+                return job
+            if not job.cancelled:
+                job.cancelled = True
+                job.cancelled_at = time.time()
+            if job.state == QUEUED:
+                job.finish(CANCELLED)
+                self._cond.notify_all()
+                return job
+            process = job.process
+        if process is not None and process.is_alive():
+            process.terminate()
+        return job
+
+    def _forget_finished(self):
+        finished = [j.id for j in self.jobs.values() if j.state in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _next_job(self):
+        """ the queued job to run now, if any, by priority within the limits """
+        if self._active >= self.max_jobs:
+            return None
+        held, job = [], None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            candidate = entry[2]
+            if candidate.state != QUEUED:
+                continue
+            limit = self.limits.get(candidate.queue)
+            if limit is not None and self._running.get(candidate.queue, 0) >= limit:
+                held.append(entry)
+                continue
+            job = candidate
+            break
+        for entry in held:
+            heapq.heappush(self._queue, entry)
+        return job
+
+    def _dispatch(self):
+        with self._cond:
+            while not self._stopping:
+                job = self._next_job()
+                if job is None:
+                    self._cond.wait(1)
+                    continue
+                self._active += 1
+                self._running[job.queue] = self._running.get(job.queue, 0) + 1
+                job.state = RUNNING
+                job.started = time.time()
+                thread = threading.Thread(target=self._run, args=(job,),
+                                          name="job-%s" % job.id)
+                thread.daemon = True
+                thread.start()
+
+    def job_kwargs(self, job):
+        """
+        The runner arguments of `job`: the daemon's defaults, the job's
+        args, and its inventory from the InventoryCache, parsed here so that
+        the job process and the next jobs get it as it is.
+        """
+        kwargs = dict(self.defaults)
+        kwargs.update(job.args)
+        hosts = kwargs.get("hosts")
+        if hosts is not None and not isinstance(hosts, MyInventory):
+            kwargs["hosts"] = self.inventory_cache.get(hosts)
+        if job.kind == "playbook":
+            kwargs.setdefault("playbook_cache", self.playbook_cache)
+            self.warm_playbook(kwargs)
+        return kwargs
+
+    def warm_playbook(self, kwargs):
+        """ parse the playbook and its roles into the PlaybookCache, here """
+        path = kwargs.get("playbook_path")
+        if not path or not os.path.exists(path):
+            # the job process reports it
+            return
+        variable_manager = VariableManager()
+        if kwargs.get("hosts") is not None:
+            variable_manager.set_inventory(kwargs["hosts"])
+        try:
+            Playbook.load(path, variable_manager=variable_manager,
+                          loader=CachingDataLoader(kwargs["playbook_cache"]))
+        except Exception:
+            # the same error comes again in the job process, reported there
+            pass
+
+    def _run(self, job):
+        results = multiprocessing.Queue()
+        state = FAILED
+        try:
+            process = multiprocessing.Process(
+                target=_run_job, args=(RUNNERS[job.kind], self.job_kwargs(job), results),
+                name="job-%s" % job.id)
+            with self._cond:
+                if job.cancelled:
+                    raise AnsibleError("cancelled")
+                job.process = process
+                process.start()
+
+            while True:
+                if job.cancelled_at is not None and process.is_alive() and \
+                        time.time() - job.cancelled_at >= self.kill_after:
+                    # stuck winding down; killed between two records, this
+                    # thread reads them: it only waits a little for that
+                    kill_processes([process], results, signal.SIGKILL, timeout=0.5)
+                try:
+                    kind, payload = results.get(timeout=1)
+                except queue.Empty:
+                    if not process.is_alive():
+                        job.error = "job process exited with code %s" % process.exitcode
+                        break
+                    continue
+                if kind == "record":
+                    job.add(payload)
+                elif kind == "done":
+                    job.summary = payload
+                    state = DONE
+                    break
+                else:
+                    job.error = payload
+                    break
+            process.join()
+        except Exception as e:
+            job.error = "%s" % e
+        finally:
+            if job.cancelled:
+                state = CANCELLED
+            with self._cond:
+                self._active -= 1
+                self._running[job.queue] -= 1
+                job.finish(state)
+                self._cond.notify_all()
+
+    # server
+
+    def authorized(self, request):
+        if self.token is None:
+            return True
+        token = request.get("token") if isinstance(request, dict) else None
+        if not isinstance(token, string_types):
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def handle(self, request):
+        """ the replies to a request of the protocol, as they come """
+        op = request.get("op")
+        if op == "ping":
+            yield dict(pong=True, pid=os.getpid(), jobs=len(self.jobs),
+                       running=self._active)
+        elif op == "submit":
+            job = self.submit(request.get("kind"), request.get("args"),
+                              request.get("priority", 0), request.get("queue", "default"))
+            yield job.status()
+            if request.get("stream"):
+                for event in job.events():
+                    yield event
+        elif op == "status":
+            if request.get("job") is not None:
+                yield self.get(request["job"]).status()
+            else:
+                yield dict(jobs=[job.status() for job in list(self.jobs.values())])
+        elif op == "watch":
+            for event in self.get(request.get("job")).events(request.get("offset", 0)):
+                yield event
+        elif op == "results":
+            job = self.get(request.get("job"))
+            with job.cond:
+                results = job.since(request.get("offset", 0))
+                dropped = job.dropped
+            yield dict(job=job.id, state=job.state, results=results, dropped=dropped)
+        elif op == "cancel":
+            yield self.cancel(request.get("job")).status()
+        else:
+            raise AnsibleError("unknown op: %s" % op)
+
+    def start(self):
+        """ listen and run jobs, in background threads """
+        if isinstance(self.address, string_types):
+            if os.path.exists(self.address):
+                # left by a previous daemon
+                os.remove(self.address)
+            self._server = _UnixServer(self.address, _Handler)
+            os.chmod(self.address, 0o600)
+        else:
+            self._server = _TCPServer(tuple(self.address), _Handler)
+            self.address = self._server.server_address
+        self._server.job_daemon = self
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._dispatch, name="job-dispatch"),
+            threading.Thread(target=self._server.serve_forever, name="job-server"),
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def serve_forever(self):
+        """ start() and wait, until shutdown() or SIGINT/SIGTERM """
+        self.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.shutdown())
+        try:
+            while not self._stopping:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.shutdown()
+
+    def shutdown(self, cancel=True):
+        """ stop listening; cancel the jobs not finished (or let them run) """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            if isinstance(self.address, string_types) and os.path.exists(self.address):
+                os.remove(self.address)
+            self._server = None
+        if cancel:
+            for job in list(self.jobs.values()):
+                if job.state not in FINISHED:
+                    self.cancel(job.id)
+
+
+class DaemonClient(object):
+    """
+    Client of a JobDaemon, a connection per call.
+
+        client = DaemonClient("/run/ansible-jobs.sock")    # token_file= as the daemon's
+        for event in client.stream("runner", hosts=["10.0.0.1"], module_name="ping"):
+            print(event)
+        job = client.submit("playbook", priority=10, hosts=host_dict,
+                            playbook_path="/srv/site.yml")
+        client.wait(job)["state"]
+    """
+    def __init__(self, address, timeout=None, token_file=None):
+        self.address = address
+        self.timeout = timeout
+        self.token = read_token(token_file) if token_file else None
+
+    def _connect(self):
+        if isinstance(self.address, string_types):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+        else:
+            sock = socket.create_connection(tuple(self.address), self.timeout)
+        return sock
+
+    def _replies(self, request, stream=False):
+        """ the reply to `request`, or with `stream` every one up to the "end" event """
+        if self.token is not None:
+            request = dict(request, token=self.token)
+        sock = self._connect()
+        try:
+            sock.sendall(_encode(request))
+            reader = sock.makefile("rb")
+            for line in iter(reader.readline, b""):
+                reply = json.loads(line.decode("utf-8"))
+                if reply.get("ok") is False:
+                    raise AnsibleError(reply["error"])
+                yield reply
+                if not stream or reply.get("event") == "end":
+                    break
+            reader.close()
+        finally:
+            sock.close()
+
+    def request(self, request):
+        for reply in self._replies(request):
+            return reply
+
+    def ping(self):
+        return self.request(dict(op="ping"))
+
+    def submit(self, kind, priority=0, queue="default", **args):
+        """ queue a job, the args being those of the runner: its id """
+        return self.request(dict(op="submit", kind=kind, args=args,
+                                 priority=priority, queue=queue))["job"]
+
+    def stream(self, kind, priority=0, queue="default", **args):
+        """ submit a job and yield its status, then its events as they come """
+        return self._replies(dict(op="submit", kind=kind, args=args,
+                                  priority=priority, queue=queue, stream=True), stream=True)
+
+    def status(self, job=None):
+        reply = self.request(dict(op="status", job=job))
+        return reply if job is not None else reply["jobs"]
+
+    def watch(self, job, offset=0):
+        return self._replies(dict(op="watch", job=job, offset=offset), stream=True)
+
+    def wait(self, job):
+        """ the "end" event of `job`, once it's finished """
+        event = None
+        for event in self.watch(job, offset=None):
+            pass
+        return event
+
+    def results(self, job, offset=0):
+        return self.request(dict(op="results", job=job, offset=offset))["results"]
+
+    def cancel(self, job):
+        return self.request(dict(op="cancel", job=job))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ansible job daemon, see JobDaemon")
+    parser.add_argument("--socket", default="/tmp/ansible-jobs.sock",
+                        help="Unix socket path")
+    parser.add_argument("--port", type=int, help="listen on 127.0.0.1:PORT instead")
+    parser.add_argument("--token-file", help="shared token, made if missing (0600); "
+                                             "needed with --port")
+    parser.add_argument("--max-jobs", type=int, default=4)
+    parser.add_argument("--limit", action="append", default=[], metavar="QUEUE=N",
+                        help="jobs of QUEUE running at a time")
+    args = parser.parse_args()
+    if args.port and not args.token_file:
+        parser.error("--port needs --token-file")
+
+    limits = dict((name, int(n)) for name, n in (l.split("=", 1) for l in args.limit))
+    address = ("127.0.0.1", args.port) if args.port else args.socket
+    daemon = JobDaemon(address, max_jobs=args.max_jobs, limits=limits,
+                       token_file=args.token_file)
+    print("listening on %s" % (daemon.address,))
+    daemon.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import json
+import time
+import fnmatch
+import sqlite3
+import threading
+from contextlib import contextmanager
+import ansible.constants as C
+
+
+__all__ = ["FactCache", "JsonFactCache", "SqliteFactCache"]
+
+
+# results of these carry ansible_facts which ansible doesn't cache either
+NONPERSISTENT_ACTIONS = ("set_fact", "include_vars")
+
+
+# the runs within smart_gathering() and the gathering they found, see below
+_smart_lock = threading.Lock()
+_smart_runs = [0, None]
+
+
+@contextmanager
+def smart_gathering():
+    """
+    C.DEFAULT_GATHERING = 'smart' for the time of a run. ansible reads it
+    from its constants only, for the whole process: the first of the runs
+    at the same time (threads, run_async) sets it, the last one puts the
+    previous value back. Runs without it in the meantime gather the smart
+    way as well.
+    """
+    with _smart_lock:
+        if _smart_runs[0] == 0:
+            _smart_runs[1] = C.DEFAULT_GATHERING
+            C.DEFAULT_GATHERING = 'smart'
+        _smart_runs[0] += 1
+    try:
+        yield
+    finally:
+        with _smart_lock:
+            _smart_runs[0] -= 1
+            if _smart_runs[0] == 0:
+                C.DEFAULT_GATHERING = _smart_runs[1]
+
+
+class FactCache(object):
+    """
+    Facts of each host kept between runs, so that Runner/PlaybookRunner
+    gather them only from hosts whose facts are older than `ttl`.
+    参数说明:
+        ttl:: 事实的有效期(秒), 或函数 ttl(host_name) 为每个主机单独指定
+        fact_keys:: 只保存这些事实, 支持通配符, 比如 ["ansible_os_family", "ansible_eth*"]
+                    缓存命中时主机的其他事实不可用
+
+    Every ansible_facts of a run are written back, those of set_fact and
+    include_vars excepted. An entry's age is that of its last `setup`.
+    """
+    def __init__(self, ttl=3600, fact_keys=None):
+        self.ttl = ttl
+        self.fact_keys = fact_keys
+        self._lock = threading.Lock()
+
+    def _load(self, host):
+        """ (gathered, facts) of `host` or None """
+        raise NotImplementedError
+
+    def _store(self, host, gathered, facts):
+        raise NotImplementedError
+
+    def _delete(self, host=None):
+        raise NotImplementedError
+
+    def host_ttl(self, host):
+        return self.ttl(host) if callable(self.ttl) else self.ttl
+
+    def filter(self, facts):
+        if not self.fact_keys:
+            return dict(facts)
+        kept = dict((k, v) for k, v in facts.items()
+                    if any(fnmatch.fnmatch(k, p) for p in self.fact_keys))
+        if "module_setup" in facts:
+            kept["module_setup"] = facts["module_setup"]
+        return kept
+
+    def get(self, host, fresh=True):
+        """ the facts of `host`, None if there's none or they are stale """
+        with self._lock:
+            entry = self._load(host)
+        if entry is None:
+            return None
+        gathered, facts = entry
+        if fresh:
+            ttl = self.host_ttl(host)
+            if not gathered or (ttl is not None and time.time() - gathered > ttl):
+                return None
+        return facts
+
+    def update(self, host, facts):
+        """ merge `facts` into those of `host` """
+        facts = self.filter(facts)
+        with self._lock:
+            entry = self._load(host)
+            gathered, cached = entry if entry is not None else (0, {})
+            cached.update(facts)
+            if facts.get("module_setup"):
+                gathered = time.time()
+            self._store(host, gathered, cached)
+
+    def invalidate(self, host=None):
+        """ forget `host`, or every host if it's None """
+        with self._lock:
+            self._delete(host)
+
+    def save_result(self, res):
+        """ write back the facts of a TaskResult """
+        facts = res._result.get("ansible_facts")
+        if facts and res._task.action not in NONPERSISTENT_ACTIONS:
+            self.update(res._host.name, facts)
+
+    def prime(self, variable_manager, hosts):
+        """
+        Give `variable_manager` the fresh facts of `hosts` and mark them as
+        gathered, the others as not, for 'smart' gathering. Returns the
+        names of the hosts whose facts were fresh.
+        """
+        fresh = []
+        for host in hosts:
+            facts = self.get(host.name)
+            if facts is None:
+                host.set_gathered_facts(False)
+                continue
+            facts["module_setup"] = True
+            variable_manager.set_host_facts(host, facts)
+            host.set_gathered_facts(True)
+            fresh.append(host.name)
+        return fresh
+
+
+class JsonFactCache(FactCache):
+    """ one JSON file per host in `directory`, like ansible's jsonfile cache """
+    def __init__(self, directory, ttl=3600, fact_keys=None):
+        super(JsonFactCache, self).__init__(ttl, fact_keys)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, host):
+        return os.path.join(self.directory, host.replace(os.sep, "_"))
+
+    def _load(self, host):
+        try:
+            with open(self._path(host)) as fd:
+                data = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+        return data["gathered"], data["facts"]
+
+    def _store(self, host, gathered, facts):
+        path = self._path(host)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as fd:
+            json.dump(dict(gathered=gathered, facts=facts), fd, default=repr)
+        os.rename(tmp, path)
+
+    def _delete(self, host=None):
+        names = [host.replace(os.sep, "_")] if host else os.listdir(self.directory)
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class SqliteFactCache(FactCache):
+    """ a `facts` table of a local SQLite database """
+    def __init__(self, path, ttl=3600, fact_keys=None):
+        super(SqliteFactCache, self).__init__(ttl, fact_keys)
+        self.path = path
+        # facts may be written from the thread of Runner.iter_results()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS facts (
+                host TEXT PRIMARY KEY, gathered REAL, facts TEXT)""")
+        self._db.commit()
+
+    def _load(self, host):
+        row = self._db.execute(
+            "SELECT gathered, facts FROM facts WHERE host = ?", (host,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _store(self, host, gathered, facts):
+        self._db.execute(
+            "INSERT OR REPLACE INTO facts (host, gathered, facts) VALUES (?, ?, ?)",
+            (host, gathered, json.dumps(facts, default=repr)))
+        self._db.commit()
+
+    def _delete(self, host=None):
+        if host is None:
+            self._db.execute("DELETE FROM facts")
+        else:
+            self._db.execute("DELETE FROM facts WHERE host = ?", (host,))
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from ansible.compat.six import string_types
+
+from myinventory import MyInventory
+from snapshot import path_signature
+
+
+__all__ = ["InventoryCache", "inventory_key"]
+
+
+def inventory_key(host_list):
+    """
+    Stable hash of an inventory source, as accepted by `MyInventory`.
+
+    dict/list/string sources hash by content, paths (file, directory or
+    executable script) by path plus the mtime/size of what they read.
+    """
+    if isinstance(host_list, string_types) and os.path.exists(host_list):
+        data = ["path", os.path.abspath(host_list), path_signature(host_list)]
+    else:
+        data = ["data", host_list]
+
+    blob = json.dumps(data, sort_keys=True, default=repr)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+class InventoryCache(object):
+    """
+    Cache of parsed `MyInventory` objects, shared by Runner/PlaybookRunner.
+
+    Entries are keyed by `inventory_key(host_list)`, evicted LRU once
+    there are more than `maxsize`, and expire after `ttl` seconds
+    (None = never). A cached inventory is shared by every runner that
+    hits it, so don't run the same inventory concurrently.
+
+        cache = InventoryCache(maxsize=16, ttl=300)
+        Runner(hosts=host_dict, inventory_cache=cache, ...)
+    """
+    def __init__(self, maxsize=32, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # key: (created, inventory)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, host_list):
+        key = self._key(host_list)
+        with self._lock:
+            # _lookup() evicts an expired entry
+            return self._lookup(key) is not None
+
+    def _key(self, host_list, options=None):
+        key = inventory_key(host_list)
+        if options:
+            key += ":%s" % inventory_key(options)
+        return key
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        created, inventory = entry
+        if self.ttl is not None and time.time() - created > self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        return inventory
+
+    def get(self, host_list, **options):
+        """
+        Return the cached inventory for `host_list`, parsing it on a miss.
+        `options` are passed to MyInventory and are part of the key.
+        """
+        key = self._key(host_list, options)
+        with self._lock:
+            inventory = self._lookup(key)
+            if inventory is not None:
+                self.hits += 1
+                # move to the most recently used end
+                self._entries[key] = self._entries.pop(key)
+                return inventory
+            self.misses += 1
+
+        # parse outside the lock, a big inventory may take a while
+        inventory = MyInventory(host_list=host_list, **options)
+
+        with self._lock:
+            self._entries[key] = (time.time(), inventory)
+            while self.maxsize and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return inventory
+
+    def invalidate(self, host_list=None):
+        """
+        Drop the entries of `host_list`, or every entry if it's None.
+        """
+        with self._lock:
+            if host_list is None:
+                self._entries.clear()
+                return
+            key = inventory_key(host_list)
+            for k in list(self._entries):
+                if k.split(":")[0] == key:
+                    del self._entries[k]
+
+    def stats(self):
+        return dict(size=len(self._entries), maxsize=self.maxsize,
+                    ttl=self.ttl, hits=self.hits, misses=self.misses,
+                    evictions=self.evictions)
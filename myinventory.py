@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 # coding:utf8
 
+from __future__ import print_function
 import os
+import gc
+import re
+import uuid
+import fnmatch
+from distutils.version import LooseVersion
+from ansible import __version__ as ansible_version
 from ansible.inventory import Inventory
 from ansible.inventory.host import Host
 from ansible.inventory.group import Group
-from ansible.parsing.dataloader import DataLoader
-from ansible.vars import VariableManager
 from ansible.compat.six import string_types
 from ansible.parsing.utils.addresses import parse_address
 from ansible.utils.vars import combine_vars
@@ -17,16 +22,166 @@ from ansible.utils.unicode import to_unicode, to_str
 from ansible.plugins import vars_loader
 from ansible.compat.six import iteritems
 
+from compact import CompactHost, VarsTable, EMPTY_VARS
+from snapshot import Snapshot, write_snapshot
+
 
 __all__ = ["MyInventory", ]
 
-HOSTS_PATTERNS_CACHE = {}
+# compiled regex of every glob/`~regex` host pattern seen so far
+PATTERNS_RE_CACHE = {}
+
+# Ansible 2.0 ~ 2.2 keep the groups all/ungrouped out of the patterns ('all'
+# matching every host), 2.3 matches them like any group and never matches
+# implicit hosts, see `Inventory._enumerate_matches()`.
+if LooseVersion(ansible_version) < LooseVersion('2.3'):
+    SPECIAL_GROUPS, MATCH_IMPLICIT = ('all', 'ungrouped'), True
+else:
+    SPECIAL_GROUPS, MATCH_IMPLICIT = (), False
+
+
+def compile_pattern(pattern):
+    """
+    Compile a `~regex` or shell-glob host pattern, once per process.
+    """
+    regex = PATTERNS_RE_CACHE.get(pattern)
+    if regex is None:
+        try:
+            if pattern.startswith('~'):
+                regex = re.compile(pattern[1:])
+            else:
+                regex = re.compile(fnmatch.translate(pattern))
+        except Exception:
+            raise AnsibleError('invalid host pattern: %s' % pattern)
+        PATTERNS_RE_CACHE[pattern] = regex
+    return regex
+
+
+def is_plain_pattern(pattern):
+    """ a pattern that can only match a group or host name exactly """
+    return not pattern.startswith('~') and not any(c in pattern for c in '*?[')
+
+
+class HostIndex(object):
+    """
+    Flattened group membership of an inventory:
+        groups:: group name -> hosts of the group and of its children
+        members:: group name -> set of the names above
+        hosts:: host name -> Host
+        order:: host name -> position of the host in the inventory
+    Implicit hosts (the implicit localhost) are left out of the groups,
+    like `Inventory._enumerate_matches()` does.
+    The changes of MyInventory.add_host()... update it in place: the host
+    list of a group a host left is rebuilt, in inventory order, when used.
+    """
+    def __init__(self, groups):
+        self.groups = {}
+        self.members = {}
+        self.hosts = {}
+        self.order = {}
+        self._next = 0
+        self._stale = set()
+
+        if 'all' in groups:
+            self._add_hosts(groups['all'].get_hosts())
+        for name, group in iteritems(groups):
+            hosts = group.get_hosts()
+            self._add_hosts(hosts)
+            hosts = [h for h in hosts if not h.implicit]
+            self.groups[name] = hosts
+            self.members[name] = set(h.name for h in hosts)
+
+    def _add_hosts(self, hosts):
+        for host in hosts:
+            if host.name not in self.hosts:
+                self.hosts[host.name] = host
+                self.order[host.name] = self._next
+                self._next += 1
+
+    def group_hosts(self, name):
+        """ the hosts of group `name` ([] if there's no such group) """
+        if name in self._stale:
+            self._stale.discard(name)
+            self.groups[name] = [self.hosts[n] for n in
+                                 sorted(self.members[name], key=self.order.get)]
+        return self.groups.get(name, [])
+
+    def add_host(self, host):
+        self._add_hosts([host])
+
+    def remove_host(self, host, groups):
+        """ drop `host`, which was in `groups` (names) """
+        self.move_host(host, groups, ())
+        self.hosts.pop(host.name, None)
+        self.order.pop(host.name, None)
+
+    def move_host(self, host, before, after):
+        """ `host` was in the groups `before` and is in `after` (names) """
+        before, after = set(before), set(after)
+        for name in before - after:
+            if name in self.members:
+                self.members[name].discard(host.name)
+                self._stale.add(name)
+        for name in after - before:
+            members = self.members.setdefault(name, set())
+            if host.name in members:
+                continue
+            members.add(host.name)
+            if name not in self._stale:
+                self.groups.setdefault(name, []).append(host)
+
+    def refresh_group(self, group):
+        """ the hosts of `group` changed by way of its children """
+        hosts = [h for h in group.get_hosts() if not h.implicit]
+        self._add_hosts(hosts)
+        self._stale.discard(group.name)
+        self.groups[group.name] = hosts
+        self.members[group.name] = set(h.name for h in hosts)
+
+    def remove_group(self, name):
+        self._stale.discard(name)
+        self.groups.pop(name, None)
+        self.members.pop(name, None)
+
+    def matches_host(self, name):
+        """ whether the host `name` can be matched by its name """
+        host = self.hosts.get(name)
+        return host is not None and (MATCH_IMPLICIT or not host.implicit)
+
+    def match(self, pattern):
+        """
+        Hosts matching a single pattern (no &, ! or subscript), by the rules
+        of `Inventory._match_one_pattern()` of the ansible in use, in
+        inventory order.
+        """
+        if pattern == 'all':
+            return list(self.group_hosts('all'))
+
+        if is_plain_pattern(pattern):
+            if pattern in SPECIAL_GROUPS or pattern not in self.groups:
+                return [self.hosts[pattern]] if self.matches_host(pattern) else []
+            if not self.matches_host(pattern) or pattern in self.members[pattern]:
+                return list(self.group_hosts(pattern))
+            names = set(self.members[pattern])
+            names.add(pattern)
+        else:
+            regex = compile_pattern(pattern)
+            match_group = regex.search if pattern.startswith('~') else regex.match
+            names = set()
+            for name, members in iteritems(self.members):
+                if name not in SPECIAL_GROUPS and match_group(name):
+                    names.update(members)
+            names.update(n for n in self.hosts if regex.match(n) and self.matches_host(n))
+
+        return [self.hosts[n] for n in sorted(names, key=self.order.get)]
+
 
 class MyInventory(Inventory):
     """
     this is my ansible inventory object.
     """
-    def __init__(self, host_list=None):
+    def __init__(self, host_list=None, lazy_vars=False, compact=False,
+                 snapshot=None, snapshot_ttl=300):
         """
         host_list的数据格式是一个列表字典，比如
             {
@@ -43,22 +198,55 @@ class MyInventory(Inventory):
             "1.1.1.1,"
             or
             "1.1.1.1,2.2.2.2"
+
+        lazy_vars=True 时，主机变量和组变量(vars插件, group_vars/host_vars,
+        _meta.hostvars)不在解析时合并，而是在主机被play的pattern选中时才合并。
+
+        compact=True 时，主机为没有__dict__的CompactHost，变量名和值只保存一份，
+        内容相同的主机变量由多个主机共享(SharedVars, 修改时才复制)，用于非常大的inventory。
+
+        snapshot 为快照文件的路径时(host_list 须为inventory文件、目录或脚本)，
+        解析结果(组、层级、主机和合并后的变量)保存到快照中，下次直接从快照加载，
+        inventory的文件有变化(mtime/size, 再比较sha1)时重新解析。脚本的输出随时
+        可能变化，它的快照 snapshot_ttl 秒后过期(None: 每次重新解析)。
         """
+        self.lazy_vars = lazy_vars
+        self.compact = compact
+        self.host_class = CompactHost if compact else Host
+        self.vars_table = VarsTable() if compact else None
+        self._index = None
+        self._excluded = set()
+        self._host_order = None
+        self._resolved_hosts = set()
+        self._resolved_groups = set()
+        self.snapshot = snapshot
+        self.snapshot_ttl = snapshot_ttl
+        self._snapshot = None
+        self._snapshot_hosts = {}
         self.host_list = host_list or []
-        self.loader = DataLoader()
-        self.variable_manager = VariableManager()
-        super(MyInventory, self).__init__(self.loader, self.variable_manager, host_list=[])
+        # created when first needed, see the loader property
+        self._data_loader = None
+        self._vars_manager = None
+        super(MyInventory, self).__init__(None, None, host_list=[])
         self.clear_pattern_cache()
 
-        # perform my `parse_inventory()`
-        self.parse_inventory(host_list)
+        # perform my `parse_inventory()`, unless there's a fresh snapshot
+        if not self.load_snapshot(host_list):
+            self.parse_inventory(host_list)
+            if self._snapshot_source(host_list) is not None:
+                try:
+                    self.save_snapshot(host_list)
+                except (IOError, OSError, TypeError, ValueError):
+                    # only a cache: the inventory is parsed all the same
+                    pass
 
     def parse_inventory(self, host_list):
+        self._close_snapshot()
 
         if isinstance(host_list, string_types):
             if "," in host_list:
                 host_list = [ h.strip() for h in host_list.split(',') if h and h.strip() ]
-            else:
+            elif not self._path_exists(host_list):
                 host_list = [ host_list ]
 
 
@@ -86,7 +274,7 @@ class MyInventory(Inventory):
                     host = h
                     port = None
 
-                new_host = Host(host, port)
+                new_host = self.host_class(host, port)
                 if h in C.LOCALHOST:
                     # set default localhost from inventory to avoid creating an implicit one. Last localhost defined 'wins'.
                     if self.localhost is not None:
@@ -97,9 +285,11 @@ class MyInventory(Inventory):
 
         # custom use InventoryDictParser()
         elif isinstance(host_list, dict):
-            self.parser = InventoryDictParser(loader=self._loader, groups=self.groups, dictdata=host_list)
+            self.parser = InventoryDictParser(loader=self._data_loader, groups=self.groups,
+                                              dictdata=host_list, host_class=self.host_class)
 
-        elif self._loader.path_exists(host_list):
+        elif self._path_exists(host_list):
+            self._set_source(host_list)
             #TODO: switch this to a plugin loader and a 'condition' per plugin on which it should be tried, restoring 'inventory pllugins'
             if self.is_directory(host_list):
                 # Ensure basedir is inside the directory
@@ -117,24 +307,622 @@ class MyInventory(Inventory):
                     "host_list parse error, please correct your data source")
 
         self._vars_plugins = [ x for x in vars_loader.all(self) ]
+        self._resolved_hosts = set()
+        self._resolved_groups = set()
+        self._index = HostIndex(self.groups)
+
+        if self.lazy_vars:
+            # vars are merged by `_resolve_host()` once a host is selected
+            return
 
         # set group vars from group_vars/ files and vars plugins
         for g in self.groups:
             group = self.groups[g]
-            group.vars = combine_vars(group.vars, self.get_group_variables(group.name))
+            group.vars = combine_vars(group.vars, self._group_variables(group))
+            if self.compact:
+                group.vars = self.vars_table.interned(group.vars)
 
         # get host vars from host_vars/ files and vars plugins
         for host in self.get_hosts():
-            host.vars = combine_vars(host.vars, self.get_host_variables(host.name))
-            self.get_host_vars(host)
+            host.vars = combine_vars(host.vars, self._host_variables(host))
+            if self.compact:
+                host.vars = self.vars_table.share(host.vars)
+
+    @property
+    def loader(self):
+        """
+        The DataLoader, created when first used: a list or a dict of hosts
+        doesn't need one, and loading it imports yaml, jinja2, the vault...
+        """
+        if self._data_loader is None:
+            from ansible.parsing.dataloader import DataLoader
+            self._data_loader = DataLoader()
+        return self._data_loader
+
+    @loader.setter
+    def loader(self, loader):
+        self._data_loader = loader
+
+    _loader = loader
+
+    @property
+    def variable_manager(self):
+        """ The VariableManager, created when first used, like the loader """
+        if self._vars_manager is None:
+            from ansible.vars import VariableManager
+            self._vars_manager = VariableManager()
+        return self._vars_manager
+
+    @variable_manager.setter
+    def variable_manager(self, variable_manager):
+        self._vars_manager = variable_manager
+
+    _variable_manager = variable_manager
+
+    def _path_exists(self, path):
+        # the default DataLoader resolves a path from the working directory
+        if self._data_loader is None:
+            return os.path.exists(os.path.expanduser(path))
+        return self._loader.path_exists(path)
+
+    def _set_source(self, path):
+        """ the inventory file, directory or script: its basedir has the group_vars/, host_vars/ """
+        self.host_list = path
+        self._basedir = self.basedir()
+        self._group_vars_files = self._find_group_vars_files(self._basedir)
+        self._host_vars_files = self._find_host_vars_files(self._basedir)
+
+    def get_index(self):
+        """ the HostIndex of this inventory, rebuilt after any change """
+        if self._index is None:
+            self._index = HostIndex(self.groups)
+        return self._index
+
+    def clear_pattern_cache(self):
+        super(MyInventory, self).clear_pattern_cache()
+        self._hosts_pattern_cache = {}
+        self._index = None
+
+    def clear_group_dict_cache(self):
+        # also called by the group_by plugin, which doesn't clear the pattern cache
+        super(MyInventory, self).clear_group_dict_cache()
+        self._hosts_pattern_cache = {}
+        self._pattern_cache = {}
+        self._index = None
+
+    def subset(self, subset_pattern):
+        super(MyInventory, self).subset(subset_pattern)
+        self._hosts_pattern_cache = {}
+
+    def restrict_to_hosts(self, restriction):
+        super(MyInventory, self).restrict_to_hosts(restriction)
+        self._hosts_pattern_cache = {}
+
+    def remove_restriction(self):
+        super(MyInventory, self).remove_restriction()
+        self._hosts_pattern_cache = {}
+
+    def exclude_hosts(self, hosts):
+        """
+        Leave the hosts (names) out of get_hosts() like a restriction
+        would, until exclude_hosts(None). Used by the circuit breaker.
+        """
+        self._excluded = set(hosts or ())
+        self._hosts_pattern_cache = {}
+
+    def set_host_order(self, order):
+        """
+        Have get_hosts() return its hosts sorted by `order(hosts)`, until
+        set_host_order(None). The strategy queues the hosts in that order.
+        Used by the scheduler (see scheduler.py).
+        """
+        self._host_order = order
+        self._hosts_pattern_cache = {}
+
+    def _get_hosts(self, pattern, ignore_limits=False, ignore_restrictions=False):
+        """
+        `Inventory.get_hosts()` with set based filters. Results are cached
+        per inventory instead of in ansible's module-wide
+        HOSTS_PATTERNS_CACHE, which mixes up the hosts of inventories that
+        live side by side (see InventoryCache).
+        """
+        if isinstance(pattern, list):
+            pattern_hash = u":".join(pattern)
+        else:
+            pattern_hash = pattern
+        key = (pattern_hash, ignore_limits or not self._subset,
+               ignore_restrictions or not (self._restriction or self._excluded))
+
+        if key not in self._hosts_pattern_cache:
+            hosts = self._evaluate_patterns(Inventory.split_host_pattern(pattern))
+
+            if not ignore_limits and self._subset:
+                # exclude hosts not in a subset, if defined
+                subset = set(h.name for h in self._evaluate_patterns(self._subset))
+                hosts = [h for h in hosts if h.name in subset]
+
+            if not ignore_restrictions and self._restriction:
+                # exclude hosts mentioned in any restriction (ex: failed hosts)
+                restriction = set(self._restriction)
+                hosts = [h for h in hosts if h.name in restriction]
+
+            if not ignore_restrictions and self._excluded:
+                hosts = [h for h in hosts if h.name not in self._excluded]
+
+            if self._host_order is not None:
+                hosts = list(self._host_order(hosts))
+
+            self._hosts_pattern_cache[key] = hosts
+
+        return self._hosts_pattern_cache[key][:]
+
+    def _evaluate_patterns(self, patterns):
+        """
+        Same as `Inventory._evaluate_patterns()`, with sets instead of
+        nested list scans.
+        """
+        patterns = Inventory.order_patterns(patterns)
+        hosts = []
+        names = set()
+
+        for p in patterns:
+            # avoid resolving a pattern that is a plain host
+            if p in self._hosts_cache and self._hosts_cache[p] is not None:
+                that = [self._hosts_cache[p]]
+            else:
+                that = self._match_one_pattern(p)
+
+            if p.startswith("!"):
+                excluded = set(h.name for h in that)
+                hosts = [h for h in hosts if h.name not in excluded]
+                names.difference_update(excluded)
+            elif p.startswith("&"):
+                kept = set(h.name for h in that)
+                hosts = [h for h in hosts if h.name in kept]
+                names.intersection_update(kept)
+            else:
+                for h in that:
+                    if h.name not in names:
+                        names.add(h.name)
+                        hosts.append(h)
+        return hosts
+
+    def _enumerate_matches(self, pattern):
+        results = self.get_index().match(pattern)
+
+        if pattern in C.LOCALHOST and len(results) == 0:
+            results.append(self._create_implicit_localhost(pattern))
+            self._index = None
+        return results
+
+    def _get_host(self, hostname):
+        if hostname in C.LOCALHOST:
+            return super(MyInventory, self)._get_host(hostname)
+        return self.get_index().hosts.get(hostname)
+
+    # The group_vars/ and host_vars/ files next to the inventory are merged
+    # into the vars of the groups and hosts: ansible hands them to the
+    # VariableManager the inventory was made with, not the one of the runs.
+
+    def _group_variables(self, group):
+        """ the vars of `group` from the vars plugins and group_vars/ """
+        vars = self.get_group_variables(group.name)
+        if self._basedir is None:
+            return vars
+        return combine_vars(vars, self.get_group_vars(group, return_results=True))
+
+    def _host_variables(self, host):
+        """ the vars of `host` from the vars plugins, the parser and host_vars/ """
+        vars = self.get_host_variables(host.name)
+        if self._basedir is None:
+            return vars
+        return combine_vars(vars, self.get_host_vars(host, return_results=True))
+
+    def _resolve_group(self, group):
+        if group.name in self._resolved_groups:
+            return
+        self._resolved_groups.add(group.name)
+        group.vars = combine_vars(group.vars, self._group_variables(group))
+        if self.compact:
+            group.vars = self.vars_table.interned(group.vars)
+
+    def _resolve_host(self, host):
+        """
+        lazy_vars: merge the vars of `host` and of its groups, or read them
+        from the snapshot the inventory was loaded from, only once.
+        """
+        if host.name in self._resolved_hosts:
+            return
+        self._resolved_hosts.add(host.name)
+
+        if host.name in self._snapshot_hosts:
+            # merged before the snapshot was written
+            vars = self._snapshot.host_vars(self._snapshot_hosts[host.name])
+            host.vars = combine_vars(vars, host.vars) if host.vars else vars
+            if self.compact:
+                host.vars = self.vars_table.share(host.vars)
+            return
+
+        for group in host.get_groups():
+            self._resolve_group(group)
+        host.vars = combine_vars(host.vars, self._host_variables(host))
+        if self.compact:
+            host.vars = self.vars_table.share(host.vars)
+
+    def get_hosts(self, pattern=None, ignore_limits=False, ignore_restrictions=False):
+        """
+        Same as `Inventory.get_hosts()`. With lazy_vars, the hosts matched by
+        an explicit pattern (the play's `hosts`) get their vars resolved;
+        calls without a pattern, such as ansible_play_batch, only list them.
+        """
+        hosts = self._get_hosts(pattern or "all", ignore_limits, ignore_restrictions)
+        if self.lazy_vars and pattern is not None:
+            for host in hosts:
+                self._resolve_host(host)
+        return hosts
+
+    def get_host(self, hostname):
+        host = super(MyInventory, self).get_host(hostname)
+        if self.lazy_vars and host is not None:
+            self._resolve_host(host)
+        return host
+
+    def list_hosts(self, pattern="all"):
+        """ list the hosts of a pattern, without resolving any vars """
+        result = self._get_hosts(pattern)
+        if len(result) == 0 and pattern in C.LOCALHOST:
+            result = [pattern]
+        return result
+
+    # Snapshots: the parsed inventory in a file, mapped in memory when
+    # loaded. Only the vars of the hosts are read lazily, the groups and
+    # the hosts themselves are built at once.
+
+    def _snapshot_source(self, host_list):
+        """ the inventory path `host_list` snapshots are kept for, or None """
+        if self.snapshot is None or not isinstance(host_list, string_types) \
+                or "," in host_list or not os.path.exists(host_list):
+            return None
+        return host_list
+
+    def _close_snapshot(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+        self._snapshot = None
+        self._snapshot_hosts = {}
+
+    def save_snapshot(self, host_list):
+        """
+        Write this inventory, parsed from the path `host_list`, to the file
+        `self.snapshot`. The vars of every host are resolved first.
+        """
+        source = self._snapshot_source(host_list)
+        if source is None:
+            raise AnsibleError("a snapshot needs an inventory file, directory or script")
+        groups = list(self.groups.values())
+        hosts = [h for h in self.groups['all'].get_hosts() if not h.implicit]
+        if self.lazy_vars:
+            for host in hosts:
+                self._resolve_host(host)
+            for group in groups:
+                self._resolve_group(group)
+
+        group_index = dict((g.name, i) for i, g in enumerate(groups))
+        host_index = dict((h.name, i) for i, h in enumerate(hosts))
+        # the groups of a host, as one of the distinct lists of groups
+        group_sets, host_group_sets = {}, []
+        for host in hosts:
+            key = tuple(group_index[g.name] for g in host.groups)
+            host_group_sets.append(group_sets.setdefault(key, len(group_sets)))
+        structure = dict(
+            groups=[(g.name, g.vars, g.depth, g.priority,
+                     [group_index[c.name] for c in g.child_groups],
+                     [group_index[p.name] for p in g.parent_groups],
+                     [host_index[h.name] for h in g.hosts if h.name in host_index])
+                    for g in groups],
+            hosts=[h.name for h in hosts],
+            group_sets=sorted(group_sets, key=group_sets.get),
+            host_group_sets=host_group_sets,
+            addresses=dict((i, h.address) for i, h in enumerate(hosts)
+                           if h.address != h.name),
+        )
+        write_snapshot(self.snapshot, Snapshot.make_meta(source), structure,
+                       [h.vars for h in hosts])
+
+    def load_snapshot(self, host_list):
+        """
+        Load the inventory from `self.snapshot` if it's a fresh snapshot of
+        the path `host_list`. Returns whether it did.
+        """
+        source = self._snapshot_source(host_list)
+        if source is None or not os.path.exists(self.snapshot):
+            return False
+        try:
+            snapshot = Snapshot(self.snapshot)
+        except Exception:
+            # truncated, of another version...: parsed again and rewritten
+            return False
+        if not snapshot.is_fresh(source, self.snapshot_ttl):
+            snapshot.close()
+            return False
+
+        self._close_snapshot()
+        self._set_source(source)
+        self.parser = None
+        if not os.path.isdir(source):
+            vars_loader.add_directory(self._basedir, with_subdir=True)
+
+        self._vars_plugins = [ x for x in vars_loader.all(self) ]
+        self._resolved_groups = set()
+        self._index = None
+
+        # tens of thousands of objects and no cycle to collect among them
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            hosts = self._build_snapshot(snapshot.structure)
+            self._resolved_groups = set(self.groups)
+            if self.lazy_vars:
+                self._resolved_hosts = set()
+                self._snapshot = snapshot
+                self._snapshot_hosts = dict((h.name, i) for i, h in enumerate(hosts))
+            else:
+                for host, vars in zip(hosts, snapshot.all_host_vars()):
+                    host.vars = self.vars_table.share(vars) if self.compact else vars
+                self._resolved_hosts = set(h.name for h in hosts)
+                snapshot.close()
+        finally:
+            if collecting:
+                gc.enable()
+        return True
+
+    def _build_snapshot(self, structure):
+        """ the groups and the hosts (returned) of a snapshot, without their vars """
+        groups = []
+        for name, vars, depth, priority, children, parents, members in structure["groups"]:
+            group = Group(name)
+            group.vars = self.vars_table.interned(vars) if self.compact else vars
+            group.depth = depth
+            group.priority = priority
+            groups.append(group)
+        group_sets = [[groups[g] for g in ids] for ids in structure["group_sets"]]
+
+        # Host.__init__() costs a uuid4 per host, the most of it: the hosts
+        # are made without it, with consecutive uuids from a random one
+        first_uuid = uuid.uuid4().int
+        addresses = structure["addresses"]
+        host_sets = structure["host_group_sets"]
+        hosts = []
+        if self.compact:
+            new = CompactHost.__new__
+            for i, name in enumerate(structure["hosts"]):
+                host = new(CompactHost)
+                host.name = name
+                host.vars = EMPTY_VARS
+                host.groups = list(group_sets[host_sets[i]])
+                host.address = addresses.get(i, name)
+                host._gathered_facts = False
+                host._uuid = first_uuid + i
+                host.implicit = False
+                hosts.append(host)
+        else:
+            new = Host.__new__
+            for i, name in enumerate(structure["hosts"]):
+                host = new(Host)
+                host.__dict__ = {"name": name, "vars": {},
+                                 "groups": list(group_sets[host_sets[i]]),
+                                 "address": addresses.get(i, name),
+                                 "_gathered_facts": False,
+                                 "_uuid": first_uuid + i, "implicit": False}
+                hosts.append(host)
+
+        for group, (name, vars, depth, priority, children, parents, members) in \
+                zip(groups, structure["groups"]):
+            group.child_groups = [groups[g] for g in children]
+            group.parent_groups = [groups[g] for g in parents]
+            group.hosts = [hosts[h] for h in members]
+        self.groups = dict((g.name, g) for g in groups)
+        return hosts
+
+    # Incremental changes, for the deltas of a CMDB: the groups, the
+    # HostIndex and the merged vars concerned are updated in place, the
+    # pattern caches are dropped, nothing is parsed again.
+
+    def _changed(self, hosts=()):
+        self._hosts_pattern_cache = {}
+        self._pattern_cache = {}
+        self._group_dict_cache = {}
+        for name in hosts:
+            self._hosts_cache.pop(name, None)
+
+    def _group(self, name, create=False):
+        group = self.groups.get(name)
+        if group is None:
+            if not create:
+                raise AnsibleError("group not found: %s" % name)
+            group = Group(name)
+            self.groups[name] = group
+            self.groups['all'].add_child_group(group)
+            self.get_index().refresh_group(group)
+            if not self.lazy_vars:
+                self._resolve_group(group)
+        return group
+
+    def _existing_host(self, name):
+        host = self.get_index().hosts.get(name)
+        if host is None:
+            raise AnsibleError("host not found: %s" % name)
+        return host
+
+    @staticmethod
+    def _group_names(host):
+        return set(g.name for g in host.get_groups())
+
+    @staticmethod
+    def _reset_ancestors(hosts):
+        """ ansible 2.3+ keeps the ancestors of its groups in host.groups """
+        if not hasattr(Host, 'populate_ancestors'):
+            return
+        for host in hosts:
+            groups = [g for g in host.groups if host in g.hosts]
+            host.groups = []
+            for group in groups:
+                host.add_group(group)
+
+    def _refresh_groups(self, group):
+        """ `group` and its ancestors but all, whose children changed """
+        index = self.get_index()
+        for g in [group] + list(group.get_ancestors()):
+            if g.name != 'all':
+                index.refresh_group(g)
+
+    @staticmethod
+    def _reset_depth(group):
+        group.depth = max([p.depth + 1 for p in group.parent_groups] or [0])
+        for child in group.child_groups:
+            MyInventory._reset_depth(child)
+
+    def add_host(self, name, groups=None, vars=None):
+        """
+        Add host `name` to `groups` (names, created if need be, default
+        ungrouped) with its host `vars`.
+        """
+        if name in self.get_index().hosts:
+            raise AnsibleError("host already in inventory: %s" % name)
+        host = self.host_class(name)
+        for group_name in groups or ['ungrouped']:
+            self._group(group_name, create=True).add_host(host)
+        index = self.get_index()
+        index.add_host(host)
+        index.move_host(host, (), self._group_names(host))
+        self._changed([name])
+
+        # merged like parse_inventory() does, the vars given as _meta's
+        host.vars = combine_vars(self.get_host_variables(name, update_cached=True), vars or {})
+        if self._basedir is not None:
+            host.vars = combine_vars(host.vars, self.get_host_vars(host, return_results=True))
+        if self.compact:
+            host.vars = self.vars_table.share(host.vars)
+        if self.lazy_vars:
+            self._resolved_hosts.add(name)
+        return host
+
+    def remove_host(self, name):
+        host = self._existing_host(name)
+        before = self._group_names(host)
+        for group in [g for g in host.groups if host in g.hosts]:
+            group.remove_host(host)
+        self.get_index().remove_host(host, before)
+        self._vars_per_host.pop(name, None)
+        self._snapshot_hosts.pop(name, None)
+        self._resolved_hosts.discard(name)
+        self._changed([name])
+
+    def move_host(self, name, from_group, to_group):
+        """ move host `name` from group `from_group` to `to_group` (created if need be) """
+        host = self._existing_host(name)
+        source = self._group(from_group)
+        if host not in source.hosts:
+            raise AnsibleError("host %s is not in group %s" % (name, from_group))
+        before = self._group_names(host)
+        target = self._group(to_group, create=True)
+        source.remove_host(host)
+        if host not in target.hosts:
+            target.add_host(host)
+        self.get_index().move_host(host, before, self._group_names(host))
+        self._changed([name])
+
+    def add_child_group(self, parent, child):
+        """ make group `child` a child of `parent`, both created if need be """
+        parent_group = self._group(parent, create=True)
+        child_group = self._group(child, create=True)
+        if child_group is parent_group or \
+                child in [g.name for g in parent_group.get_ancestors()]:
+            raise AnsibleError("The group named '%s' would have a recursive "
+                               "dependency loop." % child)
+        parent_group.add_child_group(child_group)
+        top = self.groups['all']
+        if parent != 'all' and top in child_group.parent_groups:
+            # a top level group no more, like parse_inventory() leaves it
+            top.child_groups.remove(child_group)
+            child_group.parent_groups.remove(top)
+            top.clear_hosts_cache()
+        self._refresh_groups(parent_group)
+        self._changed()
+
+    def remove_child_group(self, parent, child):
+        parent_group = self._group(parent)
+        child_group = self._group(child)
+        if child_group not in parent_group.child_groups:
+            raise AnsibleError("group %s is not a child of %s" % (child, parent))
+        parent_group.child_groups.remove(child_group)
+        child_group.parent_groups.remove(parent_group)
+        parent_group.clear_hosts_cache()
+        if not child_group.parent_groups:
+            self.groups['all'].add_child_group(child_group)
+        self._reset_ancestors(child_group.get_hosts())
+        self._reset_depth(child_group)
+        self._refresh_groups(parent_group)
+        self._changed()
+
+    def remove_group(self, name):
+        """
+        Remove group `name`: its children without another parent become top
+        level groups, its hosts without another group become ungrouped.
+        """
+        if name in ('all', 'ungrouped'):
+            raise AnsibleError("group %s can't be removed" % name)
+        group = self._group(name)
+        for child in list(group.child_groups):
+            self.remove_child_group(name, child.name)
+        hosts = [(host, self._group_names(host)) for host in group.hosts]
+        for parent in group.parent_groups:
+            parent.child_groups.remove(group)
+            parent.clear_hosts_cache()
+        group.parent_groups = []
+
+        index = self.get_index()
+        ungrouped = self.groups['ungrouped']
+        for host, before in hosts:
+            group.remove_host(host)
+            self._reset_ancestors([host])
+            if not [g for g in host.groups if g.name != 'all']:
+                ungrouped.add_host(host)
+            index.move_host(host, before, self._group_names(host))
+        index.remove_group(name)
+        del self.groups[name]
+        self._vars_per_group.pop(name, None)
+        self._resolved_groups.discard(name)
+        self._changed()
+
+    def set_group_vars(self, name, vars=None, unset=()):
+        """ set the `vars` of group `name` and remove the vars `unset` """
+        group = self._group(name)
+        for key in unset:
+            group.vars.pop(key, None)
+        for key, value in iteritems(vars or {}):
+            if self.compact:
+                key, value = self.vars_table.value(key), self.vars_table.value(value)
+            group.set_variable(key, value)
+
+    def set_host_vars(self, name, vars=None, unset=()):
+        """ set the `vars` of host `name` and remove the vars `unset` """
+        host = self._existing_host(name)
+        host.vars = dict(host.vars)
+        for key in unset:
+            host.vars.pop(key, None)
+        host.vars.update(vars or {})
+        if self.compact:
+            host.vars = self.vars_table.share(host.vars)
 
 
 class InventoryDictParser(object):
     """
     Host inventory parser for ansible using Dict data. as inventory scripts.
     """
-    def __init__(self, loader, groups=None, dictdata=None):
+    def __init__(self, loader, groups=None, dictdata=None, host_class=Host):
         self._loader = loader
+        self.host_class = host_class
         self.groups = groups or {}
         self.dictdata = dictdata
         self.host_vars_from_top = None
@@ -172,7 +960,7 @@ class InventoryDictParser(object):
 
                 for hostname in data['hosts']:
                     if hostname not in all_hosts:
-                        all_hosts[hostname] = Host(hostname)
+                        all_hosts[hostname] = self.host_class(hostname)
                     host = all_hosts[hostname]
                     group.add_host(host)
 
@@ -234,20 +1022,20 @@ if __name__ == "__main__":
     hosts_source = host_list
     myhosts = MyInventory(hosts_source)
 
-    print "groups:", myhosts.list_groups()
-    print "all.child_groups:", myhosts.groups["all"].child_groups
-    print "all:", myhosts.list_hosts("all")
-    print "*:", myhosts.list_hosts("*")
+    print("groups:", myhosts.list_groups())
+    print("all.child_groups:", myhosts.groups["all"].child_groups)
+    print("all:", myhosts.list_hosts("all"))
+    print("*:", myhosts.list_hosts("*"))
 
-    print "all group hosts:", myhosts.groups["all"].get_hosts()
-    print "pattern_cache:", myhosts._pattern_cache
+    print("all group hosts:", myhosts.groups["all"].get_hosts())
+    print("pattern_cache:", myhosts._pattern_cache)
 
     if isinstance(hosts_source, dict):
-        print "group1:", myhosts.list_hosts("group1")
-        print "group2:", myhosts.list_hosts("group2")
+        print("group1:", myhosts.list_hosts("group1"))
+        print("group2:", myhosts.list_hosts("group2"))
 
-        print "group1 vars:", myhosts.get_group_vars(myhosts.groups["group1"])
-        print myhosts.groups["group1"].vars
+        print("group1 vars:", myhosts.get_group_vars(myhosts.groups["group1"]))
+        print(myhosts.groups["group1"].vars)
 
-        print "group2 vars:", myhosts.get_group_vars(myhosts.groups["group2"])
-        print myhosts.groups["group2"].vars
+        print("group2 vars:", myhosts.get_group_vars(myhosts.groups["group2"]))
+        print(myhosts.groups["group2"].vars)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import threading
+from collections import OrderedDict
+from ansible.compat.six.moves import cPickle as pickle
+from ansible.parsing.dataloader import DataLoader
+try:
+    from ansible.module_utils._text import to_text
+except ImportError:
+    # ansible 2.0/2.1: DataLoader.load() takes the contents as they are read
+    to_text = None
+
+
+__all__ = ["PlaybookCache", "CachingDataLoader"]
+
+
+def file_signature(path):
+    """ (mtime, size, inode) of `path`, None if it can't be read """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class PlaybookCache(object):
+    """
+    Process-wide cache of parsed YAML/JSON files: playbooks and every role,
+    task, handler and vars file they include, all of which are read through
+    DataLoader.load_from_file(). An entry is used only while the file keeps
+    its mtime/size/inode, so editing any file of a playbook re-parses that
+    file alone. At most `maxsize` files are kept, least recently used out.
+    Vault encrypted files are never cached.
+
+    Entries are kept pickled: unpickling is the copy every loader gets,
+    and it's much cheaper than the deepcopy DataLoader makes.
+
+        cache = PlaybookCache(maxsize=512)
+        PlaybookRunner(playbook_path="site.yml", playbook_cache=cache, ...)
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # path: (signature, pickled data)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, signature):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries[path] = self._entries.pop(path)
+            return entry[1]
+
+    def set(self, path, signature, data):
+        with self._lock:
+            self._entries.pop(path, None)
+            self._entries[path] = (signature, data)
+            while self.maxsize and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, path=None):
+        """ drop `path`, or every file if it's None """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        return dict(size=len(self._entries), maxsize=self.maxsize,
+                    hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+class CachingDataLoader(DataLoader):
+    """ DataLoader whose load_from_file() goes through a PlaybookCache """
+    def __init__(self, cache):
+        super(CachingDataLoader, self).__init__()
+        self.cache = cache
+
+    def load_from_file(self, file_name):
+        file_name = self.path_dwim(file_name)
+        signature = file_signature(file_name)
+        if signature is None:
+            return super(CachingDataLoader, self).load_from_file(file_name)
+
+        pickled = self.cache.get(file_name, signature)
+        if pickled is not None:
+            return pickle.loads(pickled)
+
+        (b_file_data, show_content) = self._get_file_contents(file_name)
+        if to_text is None:
+            file_data = b_file_data
+        else:
+            file_data = to_text(b_file_data, errors='surrogate_or_strict')
+        parsed_data = self.load(data=file_data, file_name=file_name, show_content=show_content)
+        # show_content is False for vault encrypted files
+        if show_content:
+            try:
+                pickled = pickle.dumps(parsed_data, 2)
+            except Exception:
+                # inline vault values and the like, not worth caching
+                pickled = None
+            if pickled is not None:
+                self.cache.set(file_name, signature, pickled)
+                # a copy, ansible modifies what it loads
+                return pickle.loads(pickled)
+        return parsed_data
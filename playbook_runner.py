@@ -3,15 +3,18 @@
 
 import os
 from collections import namedtuple
-from ansible.parsing.dataloader import DataLoader
-from ansible.vars import VariableManager
-from ansible.executor.playbook_executor import PlaybookExecutor
-from ansible.plugins.callback import CallbackBase
 import ansible.constants as C
+from ansible.compat.six import string_types
 from ansible.errors import AnsibleError
 from ansible.utils.vars import load_extra_vars
 from ansible.utils.vars import load_options_vars
 from myinventory import MyInventory
+from runner import terminate_tqm, load_aio
+from timing import RunTiming
+from fact_cache import smart_gathering
+
+# PlaybookExecutor, DataLoader, VariableManager and the callback are
+# imported by the first PlaybookRunner, see runner.py.
 
 
 __all__ = ['PlaybookRunner']
@@ -23,102 +26,13 @@ Options = namedtuple('Options', [
     'become', 'become_method', 'become_user', 'verbosity', 'check', 'extra_vars'])
 
 
-class CallbackModule(CallbackBase):
-    """
-    Custom callback model for handlering the output data of
-    execute playbook file,
-
-    Base on the build-in callback plugins of ansible which named `json`.
-    """
-
-    CALLBACK_VERSION = 2.0
-    CALLBACK_TYPE = 'stdout'
-    CALLBACK_NAME = 'Dict'
-
-    def __init__(self, display=None):
-        super(CallbackModule, self).__init__(display)
-        self.results = []
-        self.output = ""
-        self.item_results = {}  # {"host": []}
-
-    def _new_play(self, play):
-        return {
-            'play': {
-                'name': play.name,
-                'id': str(play._uuid)
-            },
-            'tasks': []
-        }
-
-    def _new_task(self, task):
-        return {
-            'task': {
-                'name': task.get_name(),
-            },
-            'hosts': {}
-        }
-
-    def v2_playbook_on_no_hosts_matched(self):
-        self.output = "skipping: No match hosts."
-
-    def v2_playbook_on_no_hosts_remaining(self):
-        pass
-
-    def v2_playbook_on_task_start(self, task, is_conditional):
-        self.results[-1]['tasks'].append(self._new_task(task))
-
-    def v2_playbook_on_play_start(self, play):
-        self.results.append(self._new_play(play))
-
-    def v2_playbook_on_stats(self, stats):
-        hosts = sorted(stats.processed.keys())
-        summary = {}
-        for h in hosts:
-            s = stats.summarize(h)
-            summary[h] = s
-
-        if self.output:
-            pass
-        else:
-            self.output = {
-                'plays': self.results,
-                'stats': summary
-            }
-
-    def gather_result(self, res):
-        if res._task.loop and "results" in res._result and res._host.name in self.item_results:
-            res._result.update({"results": self.item_results[res._host.name]})
-            del self.item_results[res._host.name]
-
-        self.results[-1]['tasks'][-1]['hosts'][res._host.name] = res._result
-
-    def v2_runner_on_ok(self, res, **kwargs):
-        if "ansible_facts" in res._result:
-            del res._result["ansible_facts"]
-
-        self.gather_result(res)
-
-    def v2_runner_on_failed(self, res, **kwargs):
-        self.gather_result(res)
-
-    def v2_runner_on_unreachable(self, res, **kwargs):
-        self.gather_result(res)
-
-    def v2_runner_on_skipped(self, res, **kwargs):
-        self.gather_result(res)
-
-    def gather_item_result(self, res):
-        self.item_results.setdefault(res._host.name, []).append(res._result)
-
-    def v2_runner_item_on_ok(self, res):
-        self.gather_item_result(res)
-
-    def v2_runner_item_on_failed(self, res):
-        self.gather_item_result(res)
-
-    def v2_runner_item_on_skipped(self, res):
-        self.gather_item_result(res)
-
+def _attach(output, name, value):
+    """ put an extra of the run on the output dict, or on the sink """
+    if isinstance(output, dict):
+        output[name] = value
+    elif not isinstance(output, string_types):
+        # a ResultSink, a message such as "skipping: No match hosts." has no extras
+        setattr(output, name, value)
 
 
 class PlaybookRunner(object):
@@ -129,7 +43,8 @@ class PlaybookRunner(object):
     def __init__(
         self,
         hosts=None,                 # a list or dynamic-hosts,
-                                    # default is /etc/ansible/hosts
+                                    # default is /etc/ansible/hosts,
+                                    # or a MyInventory object
         playbook_path=None,         # * a playbook file
         forks=C.DEFAULT_FORKS,
         listtags=False,
@@ -151,19 +66,55 @@ class PlaybookRunner(object):
         connection_type="ssh",
         passwords=None,
         private_key_file=None,
-        check=False
+        check=False,
+        inventory_cache=None,       # share parsed inventories, see InventoryCache
+        result_sink=None,           # write results to a ResultSink, see result_sink.py
+        projection=None,            # trim results, see ResultProjection
+        timing=None,                # True or a hook, time each host/task, see RunTiming
+        playbook_cache=None,        # share parsed playbooks/roles, see PlaybookCache
+        fact_cache=None,            # keep facts between runs, see FactCache
+        gathering=None,             # 'smart': gather facts only of hosts not in
+                                    # fact_cache or stale, default with a fact_cache
+        breaker=None,               # leave hosts down in the last runs out, see CircuitBreaker
+        ssh_pool=None,              # reuse ssh master connections, see SSHPool
+        adaptive_forks=None         # a ForksController or True, adapt forks from one
+                                    # batch (serial or whole play) to the next, see adaptive.py
     ):
 
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.vars import VariableManager
+        from ansible.executor.playbook_executor import PlaybookExecutor
+        from callbacks import CallbackModule
+
         C.RETRY_FILES_ENABLED = False
-        self.callbackmodule = CallbackModule()
+        self.timing = RunTiming(forks) if timing else None
+        self.timing_hook = timing if callable(timing) else None
+        self.callbackmodule = CallbackModule(
+            sink=result_sink, projection=projection, timing=self.timing,
+            fact_cache=fact_cache, breaker=breaker)
+        self.fact_cache = fact_cache
+        self.breaker = breaker
+        self.skipped_by_breaker = []
+        if gathering is None and fact_cache is not None:
+            gathering = 'smart'
+        self.gathering = gathering
         if playbook_path is None or not os.path.exists(playbook_path):
             raise AnsibleError(
                 "Not Found the playbook file: %s." % playbook_path)
         self.playbook_path = playbook_path
-        self.loader = DataLoader()
+        if playbook_cache is not None:
+            from playbook_cache import CachingDataLoader
+            self.loader = CachingDataLoader(playbook_cache)
+        else:
+            self.loader = DataLoader()
         self.variable_manager = VariableManager()
         self.passwords = passwords or {}
-        self.inventory = MyInventory(host_list=hosts)
+        if isinstance(hosts, MyInventory):
+            self.inventory = hosts
+        elif inventory_cache is not None:
+            self.inventory = inventory_cache.get(hosts)
+        else:
+            self.inventory = MyInventory(host_list=hosts)
 
         self.options = Options(
             listtags=listtags,
@@ -176,7 +127,8 @@ class PlaybookRunner(object):
             forks=forks,
             remote_user=remote_user,
             private_key_file=private_key_file,
-            ssh_common_args=ssh_common_args or "",
+            ssh_common_args=ssh_pool.ssh_common_args(ssh_common_args)
+            if ssh_pool is not None else ssh_common_args or "",
             ssh_extra_args=ssh_extra_args or "",
             sftp_extra_args=sftp_extra_args,
             scp_extra_args=scp_extra_args,
@@ -191,8 +143,13 @@ class PlaybookRunner(object):
         self.variable_manager.extra_vars = load_extra_vars(loader=self.loader, options=self.options)
         self.variable_manager.options_vars = load_options_vars(self.options)
 
+        self.ssh_pool = ssh_pool
         self.variable_manager.set_inventory(self.inventory)
-        self.runner = PlaybookExecutor(
+        if adaptive_forks is True:
+            from adaptive import ForksController
+            adaptive_forks = ForksController(min_forks=min(5, forks), max_forks=forks)
+        self.forks_controller = adaptive_forks or None
+        executor_args = dict(
             playbooks=[self.playbook_path],
             inventory=self.inventory,
             variable_manager=self.variable_manager,
@@ -200,12 +157,77 @@ class PlaybookRunner(object):
             options=self.options,
             passwords=self.passwords
         )
+        if self.forks_controller is not None:
+            from adaptive import AdaptivePlaybookExecutor
+            self.runner = AdaptivePlaybookExecutor(self.forks_controller, **executor_args)
+        else:
+            self.runner = PlaybookExecutor(**executor_args)
         if self.runner._tqm:
             self.runner._tqm._stdout_callback = self.callbackmodule
 
-    def run(self):
+    def check_hosts(self):
         if not self.inventory.list_hosts("all"):
             raise AnsibleError("Inventory is empty.")
 
-        self.runner.run()
-        return self.callbackmodule.output
+    def _execute(self):
+        if self.timing is not None:
+            self.timing.start()
+        try:
+            if self.breaker is not None:
+                self.skipped_by_breaker = self.breaker.excluded(
+                    self.inventory.list_hosts("all"))
+                self.inventory.exclude_hosts(self.skipped_by_breaker)
+            if self.fact_cache is not None:
+                self.fact_cache.prime(self.variable_manager,
+                                      self.inventory.list_hosts("all"))
+            if self.ssh_pool is not None:
+                self.ssh_pool.observe(self.inventory, "all",
+                                      self.options.remote_user, self.options.connection)
+            if self.forks_controller is not None:
+                self.forks_controller.reset()
+            if self.gathering == 'smart':
+                with smart_gathering():
+                    self.runner.run()
+            else:
+                self.runner.run()
+        finally:
+            if self.breaker is not None:
+                self.inventory.exclude_hosts(None)
+            if self.timing is not None:
+                self.timing.finish()
+                if self.timing_hook is not None:
+                    self.timing_hook(self.timing)
+
+    def run(self):
+        self.check_hosts()
+        self._execute()
+        sink = self.callbackmodule.sink
+        output = self.callbackmodule.output if sink is None else sink
+        if self.timing is not None:
+            _attach(output, 'timing', self.timing if sink is not None else self.timing.to_dict())
+        if self.breaker is not None:
+            _attach(output, 'skipped_by_breaker', self.skipped_by_breaker)
+        if self.forks_controller is not None:
+            _attach(output, 'concurrency', self.forks_controller.history)
+        return output
+
+    def run_async(self):
+        """
+        Awaitable run() for asyncio (python 3.5+), see Runner.run_async().
+        """
+        self.check_hosts()
+        return load_aio().run_async(self.run, self.terminate)
+
+    def aiter_results(self, maxsize=1000):
+        """
+        `async for host, status, result in ...` over every task of the
+        playbook (python 3.5+), the results are not kept in `output`.
+        """
+        self.check_hosts()
+        return load_aio().AsyncResultIterator(
+            self._execute, self.callbackmodule, self.terminate, maxsize)
+
+    def terminate(self):
+        """ stop a run in progress, from another thread """
+        if self.runner._tqm:
+            terminate_tqm(self.runner._tqm)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding:utf8
+
+from ansible.compat.six import string_types, text_type, iteritems
+
+
+__all__ = ["ResultProjection"]
+
+
+class ResultProjection(object):
+    """
+    Trim a module result before the callbacks store it.
+    参数说明:
+        keys:: 只保留这些字段, None则保留全部
+        exclude:: 去掉这些字段, 默认去掉 invocation
+        max_bytes:: 字符串字段的最大字节数, 一个整数(所有字段)或 {字段: 字节数}
+        drop_lines:: 保留了stdout/stderr时, 去掉重复的stdout_lines/stderr_lines
+
+    Truncated fields are listed in the `_truncated` key of the result.
+
+        ResultProjection(keys=["rc", "stdout", "changed"], max_bytes={"stdout": 4096})
+    """
+    def __init__(self, keys=None, exclude=("invocation",), max_bytes=None, drop_lines=True):
+        self.keys = set(keys) if keys is not None else None
+        self.exclude = set(exclude or ())
+        self.max_bytes = max_bytes
+        self.drop_lines = drop_lines
+
+    def _cap(self, key):
+        if isinstance(self.max_bytes, dict):
+            return self.max_bytes.get(key)
+        return self.max_bytes
+
+    @staticmethod
+    def _truncate(value, cap):
+        if isinstance(value, text_type):
+            data = value.encode("utf-8")
+            if len(data) <= cap:
+                return value, False
+            return data[:cap].decode("utf-8", "ignore"), True
+        if len(value) <= cap:
+            return value, False
+        return value[:cap], True
+
+    def __call__(self, result):
+        """ return a trimmed copy of `result`, which is left untouched """
+        projected = {}
+        truncated = []
+
+        for key, value in iteritems(result):
+            if self.keys is not None and key not in self.keys:
+                continue
+            if key in self.exclude:
+                continue
+            if self.drop_lines and key.endswith("_lines") and key[:-6] in result \
+                    and (self.keys is None or key[:-6] in self.keys):
+                continue
+
+            if key == "results" and isinstance(value, list):
+                # loop items, each one is a result too
+                value = [self(item) if isinstance(item, dict) else item for item in value]
+
+            cap = self._cap(key)
+            if cap is not None and isinstance(value, string_types):
+                value, cut = self._truncate(value, cap)
+                if cut:
+                    truncated.append(key)
+
+            projected[key] = value
+
+        if truncated:
+            projected["_truncated"] = truncated
+        return projected
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import json
+import sqlite3
+import threading
+from abc import ABCMeta, abstractmethod
+from ansible.compat.six import add_metaclass
+
+
+__all__ = ["ResultSink", "JsonlResultSink", "SqliteResultSink"]
+
+
+@add_metaclass(ABCMeta)
+class ResultSink(object):
+    """
+    Where Runner/PlaybookRunner write each host result as it arrives,
+    instead of keeping them all in memory. The sink is also what `run()`
+    returns, a handle to look the results up afterwards.
+
+    A record is a dict: {"play", "task", "host", "status", "result"},
+    status being ok/failed/unreachable/skipped (or timed_out, see watchdog.py).
+    """
+    def __init__(self):
+        self.stats = {}     # PlaybookRunner: the summary of each host
+        self.timing = None  # the RunTiming of the run, if asked for
+        self.skipped_by_breaker = []    # hosts a CircuitBreaker left out
+        self.concurrency = None     # the forks of each batch, with adaptive_forks
+        self.message = None     # PlaybookRunner: "skipping: No match hosts." and the like
+        self._lock = threading.Lock()
+
+    def add(self, host, status, result, task=None, play=None):
+        record = dict(play=play, task=task, host=host, status=status, result=result)
+        with self._lock:
+            self._write(record)
+
+    @abstractmethod
+    def _write(self, record):
+        """ store a record, called with the lock held """
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def records(self, host=None, task=None, status=None):
+        """ yield the records matching every filter given """
+
+    def get(self, host, task=None):
+        """ the last result of `host` (for `task`), or None """
+        result = None
+        for record in self.records(host=host, task=task):
+            result = record["result"]
+        return result
+
+    def hosts(self, status=None):
+        return set(r["host"] for r in self.records(status=status))
+
+    def counts(self):
+        counts = {}
+        for record in self.records():
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+        return counts
+
+    def __iter__(self):
+        return self.records()
+
+
+class JsonlResultSink(ResultSink):
+    """
+    Append one JSON line per result to `path`. Lookups read the file
+    again, so memory use doesn't depend on the size of the run.
+    """
+    def __init__(self, path, truncate=True):
+        super(JsonlResultSink, self).__init__()
+        self.path = path
+        self._fd = open(path, "w" if truncate else "a")
+
+    def _write(self, record):
+        self._fd.write(json.dumps(record, default=repr))
+        self._fd.write("\n")
+
+    def flush(self):
+        with self._lock:
+            if not self._fd.closed:
+                self._fd.flush()
+
+    def close(self):
+        with self._lock:
+            self._fd.close()
+
+    def records(self, host=None, task=None, status=None):
+        self.flush()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as fd:
+            for line in fd:
+                record = json.loads(line)
+                if host is not None and record["host"] != host:
+                    continue
+                if task is not None and record["task"] != task:
+                    continue
+                if status is not None and record["status"] != status:
+                    continue
+                yield record
+
+
+class SqliteResultSink(ResultSink):
+    """
+    Insert each result into a local SQLite database, indexed by host,
+    task and status. Inserts are committed every `batch` results.
+    """
+    def __init__(self, path, batch=500):
+        super(SqliteResultSink, self).__init__()
+        self.path = path
+        self.batch = batch
+        self._pending = 0
+        # results may arrive from the thread of Runner.iter_results()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                play TEXT, task TEXT, host TEXT, status TEXT, result TEXT);
+            CREATE INDEX IF NOT EXISTS results_host ON results (host);
+            CREATE INDEX IF NOT EXISTS results_task ON results (task);
+            CREATE INDEX IF NOT EXISTS results_status ON results (status);
+        """)
+
+    def _write(self, record):
+        self._db.execute(
+            "INSERT INTO results (play, task, host, status, result) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (record["play"], record["task"], record["host"], record["status"],
+             json.dumps(record["result"], default=repr)))
+        self._pending += 1
+        if self._pending >= self.batch:
+            self._db.commit()
+            self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def records(self, host=None, task=None, status=None):
+        self.flush()
+        where, args = [], []
+        for column, value in (("host", host), ("task", task), ("status", status)):
+            if value is not None:
+                where.append("%s = ?" % column)
+                args.append(value)
+
+        sql = "SELECT play, task, host, status, result FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id"
+
+        with self._lock:
+            cursor = self._db.execute(sql, args)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self.batch)
+            if not rows:
+                break
+            for play, task, host, status, result in rows:
+                yield dict(play=play, task=task, host=host, status=status,
+                           result=json.loads(result))
+
+    def hosts(self, status=None):
+        self.flush()
+        sql, args = "SELECT DISTINCT host FROM results", ()
+        if status is not None:
+            sql, args = sql + " WHERE status = ?", (status,)
+        with self._lock:
+            return set(row[0] for row in self._db.execute(sql, args))
+
+    def counts(self):
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM results GROUP BY status")
+            return dict(rows.fetchall())
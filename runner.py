@@ -2,20 +2,28 @@
 # coding:utf8
 
 
+import os
+import sys
+import signal
+import threading
 from collections import namedtuple
-from ansible.parsing.dataloader import DataLoader
-from ansible.vars import VariableManager
-from ansible.playbook.play import Play
-from ansible.executor.task_queue_manager import TaskQueueManager
-from ansible.plugins.callback import CallbackBase
+from ansible.compat.six.moves import queue
 import ansible.constants as C
 from ansible.errors import AnsibleError
 from ansible.utils.vars import load_extra_vars
 from ansible.utils.vars import load_options_vars
 
 from myinventory import MyInventory
+from timing import RunTiming
+from fact_cache import smart_gathering
+from watchdog import RunWatchdog
 
-__all__ = ["Runner"]
+# The executor (TaskQueueManager, Play, DataLoader, VariableManager) and
+# the callbacks, which load jinja2, yaml, the vault ciphers..., are
+# imported by the first Runner: importing this module, building a
+# MyInventory or matching patterns doesn't pay for them.
+
+__all__ = ["Runner", "BatchRunner"]
 
 # free to report host to `known_hosts` file.
 C.HOST_KEY_CHECKING = False
@@ -24,38 +32,72 @@ C.HOST_KEY_CHECKING = False
 Options = namedtuple("Options", [
     'connection', 'module_path', 'private_key_file', "remote_user", "timeout",
     'forks', 'become', 'become_method', 'become_user', 'check', "extra_vars",
+    'ssh_common_args', 'ssh_extra_args',
     ]
 )
 
 
-class ResultCallback(CallbackBase):
-    """
-    Custom Callback
-    """
-    def __init__(self):
-        self.result_q = dict(contacted={}, dark={})
-
-    def gather_result(self, n, res):
-        self.result_q[n].update({res._host.name: res._result})
+# end of a streamed run, see Runner.iter_results()
+_DONE = object()
 
-    def v2_runner_on_ok(self, result):
-        self.gather_result("contacted", result)
 
-    def v2_runner_on_failed(self, result, ignore_errors=False):
-        self.gather_result("dark", result)
+def load_aio():
+    """ the asyncio helpers, see aio.py """
+    if sys.version_info < (3, 5):
+        raise AnsibleError("asyncio support needs python 3.5+")
+    import aio
+    return aio
 
-    def v2_runner_on_unreachable(self, result):
-        self.gather_result("dark", result)
 
-    def v2_runner_on_skipped(self, result):
-        self.gather_result("dark", result)
-
-    def v2_playbook_on_task_start(self, task, is_conditional):
-        pass
+def kill_processes(processes, rslt_q=None, sig=signal.SIGTERM, timeout=10):
+    """
+    Send `sig` to those of `processes` still alive, never while one of them
+    writes to `rslt_q`, the multiprocessing.Queue they put to: killed
+    halfway through a put, a process leaves a partial message in the pipe
+    and the reader of the queue blocks on it for good. The queue's write
+    lock is held while they are killed, so each is between two puts, or
+    waiting for the lock.
+    Gives up after `timeout` seconds without the lock: a writer blocked on
+    a pipe nobody reads any more. Returns the processes killed.
+    """
+    processes = [p for p in processes if p is not None and p.is_alive()]
+    if not processes:
+        return []
+    lock = getattr(rslt_q, "_wlock", None)
+    if lock is not None and not lock.acquire(True, timeout):
+        return []
+    try:
+        killed = []
+        for process in processes:
+            try:
+                os.kill(process.pid, sig)
+            except OSError:
+                # exited in the meantime
+                continue
+            killed.append(process)
+        return killed
+    finally:
+        if lock is not None:
+            lock.release()
 
-    def v2_playbook_on_play_start(self, play):
-        pass
 
+def terminate_tqm(tqm):
+    """
+    Stop a running TaskQueueManager: no more hosts get queued and the
+    workers still running are killed, each between two results (see
+    kill_processes()), so the results thread of the strategy and its
+    cleanup() don't hang. Safe to call from another thread.
+    """
+    tqm.terminate()
+    # ansible 2.2+: the workers put to tqm._final_q, 2.0/2.1: each to its rslt_q
+    by_queue = {}
+    for worker_prc, rslt_q in list(getattr(tqm, "_workers", [])):
+        if worker_prc is None:
+            continue
+        rslt_q = getattr(worker_prc, "_rslt_q", rslt_q)
+        by_queue.setdefault(id(rslt_q), (rslt_q, []))[1].append(worker_prc)
+    for rslt_q, workers in by_queue.values():
+        kill_processes(workers, rslt_q)
 
 
 class Runner(object):
@@ -63,6 +105,7 @@ class Runner(object):
     仿照ansible1.9 的python API,制作的ansible2.0 API的简化版本。
     参数说明:
         inventory:: 仓库对象，可以是列表，逗号间隔的ip字符串,可执行文件. 默认/etc/ansible/hosts
+                    也可以直接传入MyInventory对象, 比如MyInventory(hosts, lazy_vars=True)
         module_name:: 指定要使用的模块
         module_args:: 模块参数
         forks:: 并发数量, 默认5
@@ -70,6 +113,35 @@ class Runner(object):
         pattern:: 模式匹配，指定要连接的主机名, 默认all
         remote_user:: 指定连接用户, 默认root
         private_key_files:: 指定私钥文件
+        inventory_cache:: InventoryCache对象, 相同的inventory只解析一次
+        result_sink:: ResultSink对象, 结果写入JSONL文件/SQLite, run()返回该对象
+        projection:: ResultProjection对象, 保存结果前只保留/截断指定字段
+        timing:: True则记录每个主机/任务的耗时(见timing.py), 结果在 result_q['timing'],
+                 也可以是一个函数, 执行结束后以RunTiming对象为参数调用, 比如导出到Prometheus
+        fact_cache:: FactCache对象, 缓存各主机的facts, 执行结果中的facts会写回缓存
+        gather_facts:: 'no'不收集, 'yes'每次收集, 'smart'只收集缓存中没有或已过期的主机
+                       默认: 有fact_cache时为'smart', 否则为'no'. 收集结果不在result_q中,
+                       收集失败或不可达的主机除外(即该主机的结果)
+        gather_subset:: 收集哪些facts, 同setup模块的gather_subset参数
+        breaker:: CircuitBreaker对象, 多次不可达的主机暂时不再执行,
+                  这些主机在 result_q['skipped_by_breaker'] 中
+        ssh_common_args/ssh_extra_args:: 附加的ssh参数
+        ssh_pool:: SSHPool对象, 复用各主机的SSH长连接(ControlMaster)
+        deadline:: 整个执行的最长时间(秒), 到时结束执行, 返回已有的结果
+        max_stragglers:: 只剩这么多主机未完成时结束执行
+        min_complete:: 完成的主机达到这个比例(0~1)时结束执行
+        straggler_grace:: 达到 max_stragglers/min_complete 后再等待的时间(秒), 默认0
+                   未完成的主机在 result_q['timed_out'] 中
+        quorum:: 成功(ok)的主机达到这个数量时结束执行, 不再执行其他主机,
+                 也可以是一个函数 quorum(results), 参数为到目前为止的
+                 [(host, status, result), ...], 返回True时结束执行.
+                 未执行完的主机在 result_q['cancelled'] 中,
+                 是否达到在 result_q['quorum_reached'] 中
+        scheduler:: HostScheduler对象, 按历史耗时从长到短的顺序执行各主机(LPT),
+                    执行后记录本次耗时, 需要timing, result_q['timing']也会返回
+        adaptive_forks:: ForksController对象, 或True(即ForksController(max_forks=forks)),
+                         主机分批执行, 每批的并发数根据上一批的结果速度、主机耗时、
+                         控制机CPU/内存调整, 各批的并发数在 result_q['concurrency'] 中
     """
     def __init__(
         self,
@@ -88,9 +160,32 @@ class Runner(object):
         check=False,
         passwords=None,
         extra_vars = None,
-        private_key_file=None
+        private_key_file=None,
+        inventory_cache=None,
+        result_sink=None,
+        projection=None,
+        timing=None,
+        fact_cache=None,
+        gather_facts=None,
+        gather_subset=None,
+        breaker=None,
+        ssh_common_args=None,
+        ssh_extra_args=None,
+        ssh_pool=None,
+        deadline=None,
+        max_stragglers=None,
+        min_complete=None,
+        straggler_grace=0,
+        quorum=None,
+        scheduler=None,
+        adaptive_forks=None
     ):
 
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.vars import VariableManager
+        from ansible.playbook.play import Play
+        from ansible.executor.task_queue_manager import TaskQueueManager
+
         # storage & defaults
         self.pattern = pattern
         self.variable_manager = VariableManager()
@@ -98,8 +193,30 @@ class Runner(object):
         self.module_name = module_name
         self.module_args = module_args
         self.check_module_args()
-        self.gather_facts = 'no'
-        self.resultcallback = ResultCallback()
+        self.fact_cache = fact_cache
+        if gather_facts is None:
+            gather_facts = 'smart' if fact_cache is not None else 'no'
+        elif gather_facts in (True, False):
+            gather_facts = 'yes' if gather_facts else 'no'
+        if gather_facts not in ('no', 'yes', 'smart'):
+            raise AnsibleError("gather_facts should be 'no', 'yes' or 'smart'.")
+        if self.module_name == 'setup':
+            gather_facts = 'no'
+        self.gather_facts = gather_facts
+        self.breaker = breaker
+        self.skipped_by_breaker = []
+        self.scheduler = scheduler
+        if adaptive_forks is True:
+            from adaptive import ForksController
+            adaptive_forks = ForksController(min_forks=min(5, forks), max_forks=forks)
+        self.forks_controller = adaptive_forks or None
+        # the scheduler learns from the timing of the run
+        self.timing = RunTiming(forks) if timing or scheduler is not None else None
+        self.timing_hook = timing if callable(timing) else None
+        self.resultcallback = self.make_callback(
+            sink=result_sink, projection=projection, timing=self.timing,
+            fact_cache=fact_cache, breaker=breaker,
+            skip_setup=self.gather_facts != 'no')
         self.options = Options(
             connection=connection_type,
             timeout=timeout,
@@ -112,26 +229,45 @@ class Runner(object):
             remote_user=remote_user,
             extra_vars=extra_vars or [],
             private_key_file=private_key_file,
+            ssh_common_args=ssh_pool.ssh_common_args(ssh_common_args)
+            if ssh_pool is not None else ssh_common_args or "",
+            ssh_extra_args=ssh_extra_args or "",
         )
+        self.ssh_pool = ssh_pool
+        self.deadline = deadline
+        self.max_stragglers = max_stragglers
+        self.min_complete = min_complete
+        self.straggler_grace = straggler_grace
+        self.quorum = quorum
+        self.quorum_reached = None
+        if min_complete is not None and not 0 < min_complete <= 1:
+            raise AnsibleError("min_complete should be in (0, 1].")
 
         self.variable_manager.extra_vars = load_extra_vars(loader=self.loader, options=self.options)
         self.variable_manager.options_vars = load_options_vars(self.options)
 
         self.passwords = passwords or {}
-        self.inventory = MyInventory(host_list=hosts)
+        if isinstance(hosts, MyInventory):
+            self.inventory = hosts
+        elif inventory_cache is not None:
+            self.inventory = inventory_cache.get(hosts)
+        else:
+            self.inventory = MyInventory(host_list=hosts)
         self.variable_manager.set_inventory(self.inventory)
 
         self.play_source = dict(
             name="Ansible Ad-hoc",
             hosts=self.pattern,
-            gather_facts=self.gather_facts,
-            tasks=[dict(action=dict(
-                module=self.module_name, args=self.module_args))]
+            gather_facts='no' if self.gather_facts == 'no' else 'yes',
+            tasks=self.play_tasks()
         )
+        if gather_subset is not None:
+            self.play_source['gather_subset'] = gather_subset
 
         self.play = Play().load(
             self.play_source, variable_manager=self.variable_manager,
             loader=self.loader)
+        self.resultcallback.set_play(self.play)
 
         self.runner = TaskQueueManager(
             inventory=self.inventory,
@@ -144,7 +280,14 @@ class Runner(object):
 
         # ** end __init__() **
 
-    def run(self):
+    def make_callback(self, **kwargs):
+        from callbacks import ResultCallback
+        return ResultCallback(**kwargs)
+
+    def play_tasks(self):
+        return [dict(action=dict(module=self.module_name, args=self.module_args))]
+
+    def check_hosts(self):
         if not self.inventory.list_hosts("all"):
             raise AnsibleError("Inventory is empty.")
 
@@ -152,20 +295,266 @@ class Runner(object):
             raise AnsibleError(
                 "pattern: %s  dose not match any hosts." % self.pattern)
 
+    def prime_facts(self):
+        """ the cached facts of the hosts, before the run """
+        if self.fact_cache is not None:
+            self.fact_cache.prime(self.variable_manager,
+                                  self.inventory.list_hosts(self.pattern))
+
+    def exclude_broken(self):
+        """ leave the hosts the breaker is open for out of the run """
+        if self.breaker is not None:
+            self.skipped_by_breaker = self.breaker.excluded(
+                self.inventory.list_hosts(self.pattern))
+            self.inventory.exclude_hosts(self.skipped_by_breaker)
+
+    def schedule_job(self):
+        """ what the scheduler keeps the durations of the run under """
+        return self.module_name
+
+    def schedule_hosts(self):
+        """ the hosts longest expected first, and that order for the timing """
+        if self.scheduler is not None:
+            self.inventory.set_host_order(self.scheduler.host_order(self.schedule_job()))
+        if self.timing is not None:
+            self.timing.set_host_order(
+                [h.name for h in self.inventory.list_hosts(self.pattern)])
+
+    @property
+    def watchdog_enabled(self):
+        return self.deadline is not None or self.max_stragglers is not None \
+            or self.min_complete is not None or self.quorum is not None
+
+    def make_watchdog(self):
+        """ a RunWatchdog for the hosts of the run, None if not needed """
+        if not self.watchdog_enabled:
+            return None
+        return RunWatchdog(
+            [h.name for h in self.inventory.list_hosts(self.pattern)],
+            self.terminate, deadline=self.deadline,
+            max_stragglers=self.max_stragglers, min_complete=self.min_complete,
+            grace=self.straggler_grace, quorum=self.quorum)
+
+    def report_cut_off(self, watchdog):
+        """ the hosts the watchdog cut off, as timed_out/cancelled results """
+        if self.quorum is not None:
+            self.quorum_reached = watchdog.quorum_reached
+        if not watchdog.tripped:
+            return
+        status, msg = watchdog.status(), watchdog.message()
+        for host in watchdog.remaining():
+            self.resultcallback.gather_cut_off(
+                host, status, {status: True, "unreachable": False, "msg": msg})
+
+    def _execute(self):
+        if self.timing is not None:
+            self.timing.start()
+        watchdog = None
         try:
-            self.runner.run(self.play)
+            self.exclude_broken()
+            self.schedule_hosts()
+            self.prime_facts()
+            if self.ssh_pool is not None:
+                self.ssh_pool.observe(self.inventory, self.pattern,
+                                      self.options.remote_user, self.options.connection)
+            watchdog = self.resultcallback.watchdog = self.make_watchdog()
+            if watchdog is not None:
+                watchdog.start()
+            try:
+                if self.gather_facts == 'smart':
+                    with smart_gathering():
+                        self.run_play()
+                else:
+                    self.run_play()
+            finally:
+                if watchdog is not None:
+                    watchdog.finish()
+                    self.resultcallback.watchdog = None
+            if watchdog is not None:
+                self.report_cut_off(watchdog)
         except Exception as e:
             raise Exception(e)
-        else:
-            return self.resultcallback.result_q
         finally:
+            if self.breaker is not None:
+                self.inventory.exclude_hosts(None)
+            if self.scheduler is not None:
+                self.inventory.set_host_order(None)
             if self.runner:
                 self.runner.cleanup()
             if self.loader:
                 self.loader.cleanup_all_tmp_files()
+            self.finish_timing()
+
+    def run_play(self):
+        """
+        Run the play, in batches at the forks of the ForksController if
+        there's one, the TaskQueueManager being reused from one to the next.
+        """
+        if self.forks_controller is None:
+            self.runner.run(self.play)
+            return
+        self.forks_controller.reset()
+        try:
+            for batch in self.forks_controller.batches(self.inventory.list_hosts(self.pattern)):
+                if self.runner._terminated:
+                    break
+                self.inventory.restrict_to_hosts(batch)
+                if self.timing is not None:
+                    self.timing.set_host_order([h.name for h in batch])
+                self.runner._options = self.options._replace(forks=self.forks_controller.forks)
+                self.runner.run(self.play)
+        finally:
+            self.inventory.remove_restriction()
+
+    def finish_timing(self):
+        if self.timing is None:
+            return
+        self.timing.finish()
+        if self.scheduler is not None:
+            self.scheduler.learn(self.timing, self.schedule_job())
+        if self.timing_hook is not None:
+            self.timing_hook(self.timing)
+
+    def run(self):
+        self.check_hosts()
+        self._execute()
+        if self.resultcallback.sink is not None:
+            self.resultcallback.sink.flush()
+            self.resultcallback.sink.timing = self.timing
+            self.resultcallback.sink.skipped_by_breaker = self.skipped_by_breaker
+            if self.forks_controller is not None:
+                self.resultcallback.sink.concurrency = self.forks_controller.history
+            return self.resultcallback.sink
+        if self.timing is not None:
+            self.resultcallback.result_q['timing'] = self.timing.to_dict()
+        if self.breaker is not None:
+            self.resultcallback.result_q['skipped_by_breaker'] = self.skipped_by_breaker
+        if self.watchdog_enabled:
+            self.resultcallback.result_q.setdefault('timed_out', {})
+        if self.forks_controller is not None:
+            self.resultcallback.result_q['concurrency'] = self.forks_controller.history
+        if self.quorum is not None:
+            self.resultcallback.result_q.setdefault('cancelled', {})
+            self.resultcallback.result_q['quorum_reached'] = self.quorum_reached
+        return self.resultcallback.result_q
+
+    def iter_results(self, maxsize=1000):
+        """
+        Run in a background thread and yield (host, status, result) as
+        each host finishes, status being ok/failed/unreachable/skipped.
+        Nothing is kept in result_q; at most `maxsize` results wait in the
+        queue, after that the run waits for the caller to catch up.
+        Leaving the loop early stops the run.
+        """
+        self.check_hosts()
+        results = queue.Queue(maxsize)
+        self.resultcallback.queue = results
+        errors = []
+
+        def target():
+            try:
+                self._execute()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results.put(_DONE)
+
+        thread = threading.Thread(target=target, name="runner-stream")
+        thread.daemon = True
+        thread.start()
+
+        done = False
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    done = True
+                    break
+                yield item
+        finally:
+            if not done:
+                # the caller stopped early: stop queueing hosts and unblock
+                # the callback until the run is over.
+                terminate_tqm(self.runner)
+                while results.get() is not _DONE:
+                    pass
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def run_async(self):
+        """
+        Awaitable run() for asyncio (python 3.5+). The run goes to the
+        loop's default executor; cancelling the awaiting task terminates it.
+        """
+        self.check_hosts()
+        return load_aio().run_async(self.run, self.terminate)
+
+    def aiter_results(self, maxsize=1000):
+        """
+        The `async for` version of iter_results() (python 3.5+).
+        """
+        self.check_hosts()
+        return load_aio().AsyncResultIterator(
+            self._execute, self.resultcallback, self.terminate, maxsize)
+
+    def terminate(self):
+        """ stop a run in progress, from another thread """
+        terminate_tqm(self.runner)
 
 
     def check_module_args(self):
         if self.module_name in C.MODULE_REQUIRE_ARGS and not self.module_args:
             err = "No argument passed to '%s' module." % self.module_name
             raise AnsibleError(err)
+
+
+class BatchRunner(Runner):
+    """
+    Run several ad-hoc tasks as one Play, against one inventory and one
+    TaskQueueManager, instead of one Runner per task. Every task runs even
+    if a previous one failed on the host (ignore_errors), and SSH
+    connections are reused from one task to the next (ControlPersist).
+    参数说明:
+        tasks:: [(module_name, module_args), ...]
+                或 [(name, module_name, module_args), ...], name默认为 "module args"
+        其余参数同Runner, module_name/module_args除外
+
+    run() returns {task name: {'contacted': {...}, 'dark': {...}}}.
+
+        BatchRunner(tasks=[("shell", "uptime"), ("shell", "df -h")], hosts=host_dict)
+    """
+    def __init__(self, tasks, **kwargs):
+        self.tasks = []
+        for task in tasks:
+            if len(task) == 2:
+                module_name, module_args = task
+                name = ("%s %s" % (module_name, module_args or "")).strip()
+            else:
+                name, module_name, module_args = task
+            if name in [t[0] for t in self.tasks]:
+                raise AnsibleError("Duplicate task name in batch: %s" % name)
+            self.tasks.append((name, module_name, module_args))
+
+        if not self.tasks:
+            raise AnsibleError("No task passed to BatchRunner.")
+        super(BatchRunner, self).__init__(**kwargs)
+
+    def schedule_job(self):
+        return ",".join(t[1] for t in self.tasks)
+
+    def make_callback(self, **kwargs):
+        from callbacks import BatchResultCallback
+        return BatchResultCallback([t[0] for t in self.tasks], **kwargs)
+
+    def play_tasks(self):
+        return [dict(name=name, ignore_errors=True,
+                     action=dict(module=module_name, args=module_args))
+                for name, module_name, module_args in self.tasks]
+
+    def check_module_args(self):
+        for name, module_name, module_args in self.tasks:
+            if module_name in C.MODULE_REQUIRE_ARGS and not module_args:
+                err = "No argument passed to '%s' module." % module_name
+                raise AnsibleError(err)
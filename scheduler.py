@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import time
+import sqlite3
+import threading
+from ansible.compat.six import string_types
+
+
+__all__ = ["HostScheduler"]
+
+
+class HostScheduler(object):
+    """
+    Longest-first (LPT) ordering of the hosts of a run: the hosts expected
+    to take the longest start first, so that they don't finish well after
+    everything else. Expectations come from the previous runs, kept per
+    host and per job (the module of a Runner) in a SQLite database.
+    PlaybookRunner has no scheduler: a playbook runs its hosts in the
+    order of the inventory.
+    参数说明:
+        path:: SQLite文件, 默认只在内存中
+        alpha:: 最近一次耗时的权重(指数移动平均), 0~1
+        default:: 没有历史数据的主机的预计耗时(秒), 默认为同一job已知主机的平均值
+
+    A host without history for the job is expected to take what it took
+    for the other jobs on average, or else `default`.
+
+        scheduler = HostScheduler("/var/lib/ansible/durations.db")
+        Runner(hosts=host_dict, module_name="shell", module_args="yum -y update",
+               forks=20, scheduler=scheduler).run()
+    """
+    def __init__(self, path=":memory:", alpha=0.5, default=None):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha should be in (0, 1].")
+        self.path = path
+        self.alpha = alpha
+        self.default = default
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS durations (
+                host TEXT, job TEXT, seconds REAL, runs INTEGER, updated REAL,
+                PRIMARY KEY (host, job))""")
+        self._db.commit()
+
+    def _known(self, job):
+        return dict(self._db.execute(
+            "SELECT host, seconds FROM durations WHERE job = ?", (job,)))
+
+    def record(self, job, durations):
+        """ fold {host: seconds} of a run of `job` into the history """
+        if not durations:
+            return
+        now = time.time()
+        with self._lock:
+            known = dict((row[0], (row[1], row[2])) for row in self._db.execute(
+                "SELECT host, seconds, runs FROM durations WHERE job = ?", (job,)))
+            rows = []
+            for host, seconds in durations.items():
+                if host in known:
+                    previous, runs = known[host]
+                    seconds = self.alpha * seconds + (1 - self.alpha) * previous
+                    rows.append((host, job, seconds, runs + 1, now))
+                else:
+                    rows.append((host, job, seconds, 1, now))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO durations (host, job, seconds, runs, updated) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def learn(self, timing, job):
+        """
+        Record the durations of a RunTiming: per host, the time its tasks
+        took, the waits for a free fork excepted.
+        """
+        durations = {}
+        for task in timing.tasks:
+            for host, record in task["hosts"].items():
+                busy = max(0.0, record["total"] - record["wait"])
+                durations[host] = durations.get(host, 0.0) + busy
+        self.record(job, durations)
+
+    def estimates(self, hosts, job):
+        """ {host name: expected seconds} of `hosts` for `job` """
+        names = [h if isinstance(h, string_types) else h.name for h in hosts]
+        with self._lock:
+            known = self._known(job)
+            missing = [n for n in names if n not in known]
+            others = {}
+            if missing:
+                others = dict(self._db.execute(
+                    "SELECT host, AVG(seconds) FROM durations GROUP BY host"))
+        default = self.default
+        if default is None:
+            default = sum(known.values()) / len(known) if known else 0.0
+        estimates = {}
+        for name in names:
+            if name in known:
+                estimates[name] = known[name]
+            else:
+                estimates[name] = others.get(name, default)
+        return estimates
+
+    def order(self, hosts, job):
+        """ `hosts` (Host objects or names), the longest expected first """
+        estimates = self.estimates(hosts, job)
+        # sorted() is stable: unknown hosts keep the inventory order
+        return sorted(hosts, key=lambda h: -estimates[
+            h if isinstance(h, string_types) else h.name])
+
+    def host_order(self, job):
+        """ the order function of MyInventory.set_host_order() for `job` """
+        return lambda hosts: self.order(hosts, job)
+
+    def forget(self, host=None):
+        """ drop the history of `host`, or of every host """
+        with self._lock:
+            if host is None:
+                self._db.execute("DELETE FROM durations")
+            else:
+                self._db.execute("DELETE FROM durations WHERE host = ?", (host,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
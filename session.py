@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import threading
+import ansible.constants as C
+from ansible.errors import AnsibleError
+from ansible.utils.vars import load_extra_vars
+from ansible.utils.vars import load_options_vars
+
+from myinventory import MyInventory
+from runner import Options
+
+# the executor and the callbacks are imported by the first RunnerSession,
+# as by the first Runner, see runner.py.
+
+__all__ = ["RunnerSession"]
+
+
+class RunnerSession(object):
+    """
+    A long-lived Runner: the inventory, variable manager, loader and
+    TaskQueueManager (its callbacks and queues) are built once and reused
+    by every `submit()`, until `close()`. Facts gathered by one submission
+    stay visible to the next ones. Submissions run one at a time.
+    参数说明同Runner, module_name/module_args/pattern 在submit()时指定.
+
+        with RunnerSession(hosts=host_dict, forks=20) as session:
+            session.submit("web", "shell", "uptime")
+            session.submit("db", "ping")
+    """
+    def __init__(
+        self,
+        hosts=C.DEFAULT_HOST_LIST,
+        forks=C.DEFAULT_FORKS,
+        timeout=C.DEFAULT_TIMEOUT,
+        remote_user=C.DEFAULT_REMOTE_USER,
+        module_path=None,
+        connection_type="smart",
+        become=None,
+        become_method=None,
+        become_user=None,
+        check=False,
+        passwords=None,
+        extra_vars=None,
+        private_key_file=None,
+        inventory_cache=None,
+        projection=None,
+        ssh_common_args=None,
+        ssh_extra_args=None,
+        ssh_pool=None
+    ):
+
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.vars import VariableManager
+        from ansible.executor.task_queue_manager import TaskQueueManager
+        from callbacks import ResultCallback
+
+        self.variable_manager = VariableManager()
+        self.loader = DataLoader()
+        self.resultcallback = ResultCallback(projection=projection)
+        self.options = Options(
+            connection=connection_type,
+            timeout=timeout,
+            module_path=module_path,
+            forks=forks,
+            become=become,
+            become_method=become_method,
+            become_user=become_user,
+            check=check,
+            remote_user=remote_user,
+            extra_vars=extra_vars or [],
+            private_key_file=private_key_file,
+            ssh_common_args=ssh_pool.ssh_common_args(ssh_common_args)
+            if ssh_pool is not None else ssh_common_args or "",
+            ssh_extra_args=ssh_extra_args or "",
+        )
+        self.ssh_pool = ssh_pool
+
+        self.variable_manager.extra_vars = load_extra_vars(loader=self.loader, options=self.options)
+        self.variable_manager.options_vars = load_options_vars(self.options)
+
+        self.passwords = passwords or {}
+        if isinstance(hosts, MyInventory):
+            self.inventory = hosts
+        elif inventory_cache is not None:
+            self.inventory = inventory_cache.get(hosts)
+        else:
+            self.inventory = MyInventory(host_list=hosts)
+        self.variable_manager.set_inventory(self.inventory)
+
+        self.runner = TaskQueueManager(
+            inventory=self.inventory,
+            variable_manager=self.variable_manager,
+            loader=self.loader,
+            options=self.options,
+            passwords=self.passwords,
+            stdout_callback=self.resultcallback
+        )
+        self.runner.load_callbacks()
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, pattern="all", module_name=C.DEFAULT_MODULE_NAME, module_args=C.DEFAULT_MODULE_ARGS):
+        """
+        Run one ad-hoc task and return its result_q, like Runner.run().
+        """
+        if self.closed:
+            raise AnsibleError("The session is closed.")
+        if module_name in C.MODULE_REQUIRE_ARGS and not module_args:
+            raise AnsibleError("No argument passed to '%s' module." % module_name)
+        if not self.inventory.list_hosts(pattern):
+            raise AnsibleError(
+                "pattern: %s  dose not match any hosts." % pattern)
+
+        from ansible.playbook.play import Play
+
+        play_source = dict(
+            name="Ansible Ad-hoc",
+            hosts=pattern,
+            gather_facts='no',
+            tasks=[dict(action=dict(module=module_name, args=module_args))]
+        )
+
+        with self._lock:
+            play = Play().load(
+                play_source, variable_manager=self.variable_manager,
+                loader=self.loader)
+
+            # the TQM remembers failed/unreachable hosts between plays,
+            # each submission starts afresh.
+            self.runner.clear_failed_hosts()
+            self.runner._unreachable_hosts = dict()
+            self.runner._terminated = False
+            self.resultcallback.result_q = dict(contacted={}, dark={})
+            if self.ssh_pool is not None:
+                self.ssh_pool.observe(self.inventory, pattern,
+                                      self.options.remote_user, self.options.connection)
+            try:
+                self.runner.run(play)
+            finally:
+                self.loader.cleanup_all_tmp_files()
+            return self.resultcallback.result_q
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.runner.cleanup()
+        self.loader.cleanup_all_tmp_files()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import signal
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from ansible.compat.six.moves import queue
+import ansible.constants as C
+from ansible.errors import AnsibleError
+
+from myinventory import MyInventory
+from result_sink import ResultSink
+from runner import Runner, kill_processes
+from playbook_runner import PlaybookRunner
+
+
+__all__ = ["ShardedRunner", "ShardedPlaybookRunner", "partition_hosts"]
+
+
+def _primary_group(host):
+    """ the deepest group of `host`, its hosts tend to run the same things """
+    groups = [g for g in host.get_groups() if g.name != "all"]
+    if not groups:
+        return "all"
+    return max(groups, key=lambda g: g.depth).name
+
+
+def partition_hosts(inventory, pattern, shards):
+    """
+    Split the hosts matching `pattern` into at most `shards` lists of host
+    names. Hosts are bucketed by their deepest group, so that a group stays
+    in one shard unless it is bigger than a shard.
+    """
+    hosts = inventory.list_hosts(pattern)
+    if not hosts:
+        return []
+    shards = max(1, min(shards, len(hosts)))
+    size = -(-len(hosts) // shards)
+
+    buckets = OrderedDict()
+    for host in hosts:
+        buckets.setdefault(_primary_group(host), []).append(host.name)
+
+    chunks = []
+    for names in buckets.values():
+        for i in range(0, len(names), size):
+            chunks.append(names[i:i + size])
+
+    # biggest chunks first, each to the smallest shard so far
+    parts = [[] for _ in range(shards)]
+    for chunk in sorted(chunks, key=len, reverse=True):
+        min(parts, key=len).extend(chunk)
+    return [part for part in parts if part]
+
+
+def _merge_dict(merged, part):
+    for key, value in part.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            _merge_dict(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class _ForwardSink(ResultSink):
+    """ the sink of a shard: send each record to the parent process """
+    def __init__(self, queue, index):
+        super(_ForwardSink, self).__init__()
+        self.queue = queue
+        self.index = index
+
+    def _write(self, record):
+        self.queue.put(("record", self.index, record))
+
+    def records(self, host=None, task=None, status=None):
+        # they are in the sink of the parent process
+        return iter(())
+
+
+class ShardedRunner(object):
+    """
+    Runner whose hosts are split into `shards`, each one run by its own
+    process with its own TaskQueueManager, so that result processing and
+    templating use several cores. The shard processes are forked, they
+    don't parse the inventory again. `forks` is shared among the shards.
+    参数说明:
+        shards:: 分片(进程)数量, 默认为CPU核数
+        runner_class:: 每个分片使用的Runner类, 比如BatchRunner
+        其余参数同Runner
+
+    run() returns the same thing as the Runner of a single process: the
+    merged result_q, or the result_sink which got the results of every
+    shard (written by this process).
+
+        ShardedRunner(shards=8, forks=400, hosts=host_dict, module_name="ping")
+    """
+    runner_class = Runner
+
+    def __init__(
+        self,
+        shards=None,
+        hosts=C.DEFAULT_HOST_LIST,
+        pattern="all",
+        forks=C.DEFAULT_FORKS,
+        inventory_cache=None,
+        result_sink=None,
+        runner_class=None,
+        **kwargs
+    ):
+        self.shards = shards or multiprocessing.cpu_count()
+        self.pattern = pattern
+        self.forks = forks
+        self.result_sink = result_sink
+        self.kwargs = kwargs
+        if runner_class is not None:
+            self.runner_class = runner_class
+        self._processes = []
+        self._results = None
+
+        if isinstance(hosts, MyInventory):
+            self.inventory = hosts
+        elif inventory_cache is not None:
+            self.inventory = inventory_cache.get(hosts)
+        else:
+            self.inventory = MyInventory(host_list=hosts)
+
+    def partition(self):
+        return partition_hosts(self.inventory, self.pattern, self.shards)
+
+    def make_runner(self, hosts, forks, sink):
+        """ the runner of one shard, called in the shard process """
+        self.inventory.subset(hosts)
+        return self.runner_class(hosts=self.inventory, pattern=self.pattern,
+                                 forks=forks, result_sink=sink, **self.kwargs)
+
+    def collect(self, runner):
+        """ what a shard sends back when there's no result_sink """
+        return runner.resultcallback.result_q
+
+    def merge(self, parts):
+        merged = {}
+        for part in parts:
+            _merge_dict(merged, part)
+        if self.result_sink is not None:
+            self.result_sink.flush()
+            return self.result_sink
+        return merged
+
+    def check_hosts(self):
+        if not self.inventory.list_hosts("all"):
+            raise AnsibleError("Inventory is empty.")
+
+    def _run_shard(self, index, hosts, forks, results):
+        shard = os.getpid()
+
+        def stop(signum, frame):
+            if os.getpid() != shard:
+                # a worker of the shard, which inherited the handler
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+                return
+            runner.terminate()
+
+        try:
+            # the shards build the same modules at the same time: each one
+            # gets its own module cache, the write locks aren't shared
+            C.DEFAULT_LOCAL_TMP = tempfile.mkdtemp(
+                prefix="shard-%d-" % index, dir=C.DEFAULT_LOCAL_TMP)
+            sink = None
+            if self.result_sink is not None:
+                sink = _ForwardSink(results, index)
+            runner = self.make_runner(hosts, forks, sink)
+            # terminate(): the shard stops its run and reports what it got
+            signal.signal(signal.SIGTERM, stop)
+            runner.run()
+            results.put(("done", index, self.collect(runner)))
+        except Exception as e:
+            results.put(("error", index, "%s" % e))
+
+    def run(self):
+        self.check_hosts()
+        shards = self.partition()
+        if not shards:
+            raise AnsibleError(
+                "pattern: %s  dose not match any hosts." % self.pattern)
+
+        # forks shared among the shards, at least one each
+        count = len(shards)
+        forks = [max(1, self.forks // count + (i < self.forks % count))
+                 for i in range(count)]
+
+        results = self._results = multiprocessing.Queue()
+        self._processes = [
+            multiprocessing.Process(target=self._run_shard,
+                                    args=(i, shards[i], forks[i], results),
+                                    name="shard-%d" % i)
+            for i in range(count)]
+        for process in self._processes:
+            process.start()
+
+        parts = [None] * count
+        errors = []
+        pending = set(range(count))
+        while pending:
+            try:
+                kind, index, payload = results.get(timeout=1)
+            except queue.Empty:
+                # a shard which died without a word, killed maybe
+                for index in list(pending):
+                    process = self._processes[index]
+                    if not process.is_alive():
+                        pending.discard(index)
+                        errors.append("shard %d exited with code %s"
+                                      % (index, process.exitcode))
+                continue
+
+            if kind == "record":
+                self.result_sink.add(payload["host"], payload["status"], payload["result"],
+                                     task=payload["task"], play=payload["play"])
+            elif kind == "done":
+                parts[index] = payload
+                pending.discard(index)
+            else:
+                errors.append("shard %d: %s" % (index, payload))
+                pending.discard(index)
+
+        for process in self._processes:
+            process.join()
+        if errors:
+            raise AnsibleError("; ".join(errors))
+        return self.merge(parts)
+
+    def terminate(self):
+        """
+        stop a run in progress, from another thread: each shard terminates
+        its runner, run() returns what the shards got so far
+        """
+        kill_processes(self._processes, self._results)
+
+
+class ShardedPlaybookRunner(ShardedRunner):
+    """
+    PlaybookRunner whose hosts (those matching `pattern`) are split into
+    `shards` processes, see ShardedRunner. Each shard runs the whole
+    playbook for its hosts, so `serial` and `run_once` apply per shard.
+    参数说明同PlaybookRunner, 另加 shards/pattern
+
+    `output` is merged: the hosts of the same play/task in every shard.
+    """
+    runner_class = PlaybookRunner
+
+    def make_runner(self, hosts, forks, sink):
+        self.inventory.subset(hosts)
+        return self.runner_class(hosts=self.inventory, forks=forks,
+                                 result_sink=sink, **self.kwargs)
+
+    def collect(self, runner):
+        callback = runner.callbackmodule
+        stats = runner.runner._tqm._stats
+        summary = dict((h, stats.summarize(h)) for h in stats.processed)
+        if self.result_sink is not None:
+            return [], summary, callback.sink.message
+        if not isinstance(callback.output, dict):
+            # no hosts matched: the message PlaybookRunner returns
+            return callback.results, summary, callback.output
+        return callback.output["plays"], summary, None
+
+    @staticmethod
+    def _merge_plays(merged, plays):
+        # the same playbook runs in every shard: plays match by position,
+        # tasks by name and occurrence within the play.
+        for i, play in enumerate(plays):
+            if i >= len(merged):
+                merged.append(play)
+                continue
+
+            tasks, seen = {}, {}
+            for task in merged[i]["tasks"]:
+                name = task["task"]["name"]
+                seen[name] = seen.get(name, 0) + 1
+                tasks[(name, seen[name])] = task
+
+            seen = {}
+            for task in play["tasks"]:
+                name = task["task"]["name"]
+                seen[name] = seen.get(name, 0) + 1
+                if (name, seen[name]) in tasks:
+                    tasks[(name, seen[name])]["hosts"].update(task["hosts"])
+                else:
+                    merged[i]["tasks"].append(task)
+
+    def merge(self, parts):
+        plays, stats, messages = [], {}, []
+        for part_plays, part_stats, message in parts:
+            self._merge_plays(plays, part_plays)
+            stats.update(part_stats)
+            if message:
+                messages.append(message)
+
+        if self.result_sink is not None:
+            self.result_sink.stats = stats
+            if len(messages) == len(parts):
+                self.result_sink.message = messages[0]
+            self.result_sink.flush()
+            return self.result_sink
+        if len(messages) == len(parts):
+            return messages[0]
+        return {'plays': plays, 'stats': stats}
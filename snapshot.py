@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import sys
+import mmap
+import time
+import struct
+import marshal
+import hashlib
+import tempfile
+from ansible import __version__ as ansible_version
+from ansible.compat.six import text_type, binary_type, integer_types, iteritems
+
+
+__all__ = ["Snapshot", "write_snapshot", "path_signature", "plain"]
+
+
+MAGIC = b"MYINVSNP"
+VERSION = 1
+
+# magic, version, length of the meta
+HEADER = struct.Struct("<8sII")
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+
+
+def path_signature(path):
+    """
+    (path, mtime, size) of `path` and, for a directory, of every file
+    under it. group_vars/ and host_vars/ next to an inventory file are
+    included too, as the vars plugins read them while parsing.
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        roots = [path]
+    else:
+        basedir = os.path.dirname(path)
+        roots = [path, os.path.join(basedir, "group_vars"),
+                 os.path.join(basedir, "host_vars")]
+
+    signature = []
+    for root in roots:
+        if not os.path.exists(root):
+            continue
+        if not os.path.isdir(root):
+            st = os.stat(root)
+            signature.append((root, st.st_mtime, st.st_size))
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                fullpath = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(fullpath)
+                except OSError:
+                    continue
+                signature.append((fullpath, st.st_mtime, st.st_size))
+    return signature
+
+
+def is_script(path):
+    """ whether the inventory `path` is, or has, an executable script """
+    if os.path.isdir(path):
+        return any(os.access(os.path.join(dirpath, name), os.X_OK)
+                   for dirpath, dirnames, filenames in os.walk(path)
+                   for name in filenames)
+    return os.access(path, os.X_OK)
+
+
+def content_hash(signature):
+    """ sha1 of the content of the files of a path_signature() """
+    digest = hashlib.sha1()
+    for path, mtime, size in signature:
+        digest.update(path.encode("utf-8"))
+        try:
+            with open(path, "rb") as fd:
+                digest.update(fd.read())
+        except (IOError, OSError):
+            pass
+    return digest.hexdigest()
+
+
+def plain(data):
+    """
+    `data` with builtin types only, what marshal takes: the AnsibleUnicode
+    and the like of a parsed inventory become unicode/str, tuples lists.
+    """
+    if isinstance(data, dict):
+        return dict((plain(k), plain(v)) for k, v in iteritems(data))
+    if isinstance(data, (list, tuple)):
+        return [plain(v) for v in data]
+    if isinstance(data, text_type):
+        return text_type(data)
+    if isinstance(data, binary_type):
+        return binary_type(data)
+    if data is None or isinstance(data, (bool, float) + integer_types):
+        return data
+    raise TypeError("can't snapshot %r" % type(data))
+
+
+def write_snapshot(path, meta, structure, host_vars):
+    """
+    Write a snapshot file, atomically:
+
+        header (magic, version, meta length), meta (marshal)
+        structure length, structure (marshal)
+        offset table: len(host_vars) + 1 offsets (uint64)
+        host vars: one marshal per host, at its offsets in the table
+    """
+    blobs = [marshal.dumps(plain(v)) for v in host_vars]
+    meta = marshal.dumps(plain(meta))
+    structure = marshal.dumps(plain(structure))
+
+    offsets, position = [], 0
+    for blob in blobs:
+        offsets.append(position)
+        position += len(blob)
+    offsets.append(position)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, len(meta)))
+            out.write(meta)
+            out.write(LENGTH.pack(len(structure)))
+            out.write(structure)
+            out.write(b"".join(OFFSET.pack(o) for o in offsets))
+            out.write(b"".join(blobs))
+        os.rename(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Snapshot(object):
+    """
+    A snapshot file, mapped in memory: the meta and the structure are read
+    when it's opened, the vars of a host only by host_vars(), from the
+    mapping. Raises ValueError if the file isn't a snapshot of this
+    version, written by this python and ansible.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fd:
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open()
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        if len(self._map) < HEADER.size:
+            raise ValueError("not an inventory snapshot: %s" % self.path)
+        magic, version, length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not an inventory snapshot of version %d: %s"
+                             % (VERSION, self.path))
+        position = HEADER.size
+        self.meta = marshal.loads(self._map[position:position + length])
+        if self.meta.get("python") != list(sys.version_info[:2]) or \
+                self.meta.get("ansible") != ansible_version:
+            raise ValueError("snapshot written by another python/ansible: %s" % self.path)
+        position += length
+
+        length, = LENGTH.unpack_from(self._map, position)
+        position += LENGTH.size
+        self.structure = marshal.loads(self._map[position:position + length])
+        position += length
+
+        self._table = position
+        self._vars = position + OFFSET.size * (len(self.structure["hosts"]) + 1)
+
+    @staticmethod
+    def make_meta(source):
+        """ the meta of a snapshot of the inventory path `source` """
+        signature = path_signature(source)
+        return dict(source=os.path.abspath(source), files=signature,
+                    sha1=content_hash(signature), script=is_script(source),
+                    created=time.time(), python=list(sys.version_info[:2]),
+                    ansible=ansible_version)
+
+    def is_fresh(self, source, ttl=None):
+        """
+        Whether the snapshot is still that of the inventory path `source`:
+        its files have the same mtime/size, or else the same content. The
+        output of a script may change at any time: its snapshot expires
+        `ttl` seconds after it was written (None: at once).
+        """
+        meta = self.meta
+        if meta["source"] != os.path.abspath(source):
+            return False
+        if meta["script"] and (ttl is None or time.time() - meta["created"] > ttl):
+            return False
+        signature = [list(f) for f in path_signature(source)]
+        if signature == [list(f) for f in meta["files"]]:
+            return True
+        # touched, copied...: the same files with the same content
+        return [f[0] for f in signature] == [f[0] for f in meta["files"]] and \
+            content_hash(signature) == meta["sha1"]
+
+    def host_vars(self, index):
+        """ the merged vars of the host at `index` in structure["hosts"] """
+        start, = OFFSET.unpack_from(self._map, self._table + OFFSET.size * index)
+        end, = OFFSET.unpack_from(self._map, self._table + OFFSET.size * (index + 1))
+        return marshal.loads(self._map[self._vars + start:self._vars + end])
+
+    def all_host_vars(self):
+        """ the merged vars of every host, in the order of structure["hosts"] """
+        count = len(self.structure["hosts"])
+        offsets = struct.unpack_from("<%dQ" % (count + 1), self._map, self._table)
+        data, start = self._map, self._vars
+        return [marshal.loads(data[start + offsets[i]:start + offsets[i + 1]])
+                for i in range(count)]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
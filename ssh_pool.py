@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import os
+import getpass
+import tempfile
+import threading
+import subprocess
+from multiprocessing.pool import ThreadPool
+from ansible.utils.vars import combine_vars
+
+from myinventory import MyInventory
+
+
+__all__ = ["SSHPool"]
+
+
+SSH_CONNECTIONS = ("ssh", "smart")
+
+
+class SSHPool(object):
+    """
+    Persistent SSH connections (ControlMaster) shared by the runs of
+    Runner/PlaybookRunner, one control socket per host/port/user in
+    `control_dir`.
+    参数说明:
+        control_dir:: 控制socket目录, 默认 ~/.ansible/cp
+        persist:: 连接空闲多久后关闭(秒)
+        timeout:: prewarm() 的连接超时(秒)
+        ssh_executable:: ssh命令
+
+    Runner/PlaybookRunner(ssh_pool=pool) pass ControlMaster/ControlPersist/
+    ControlPath through ssh_common_args. ansible.cfg's ssh_args come first
+    on the ssh command line and ssh keeps the first value of an option:
+    with ansible's default ssh_args, the connections ansible opens itself
+    persist 60s, set ANSIBLE_SSH_ARGS="-C" to have `persist` apply to them
+    too. Connections opened by prewarm() always persist `persist` seconds.
+
+        pool = SSHPool(persist=600)
+        pool.prewarm(host_dict, "web")
+        Runner(hosts=host_dict, pattern="web", ssh_pool=pool, ...).run()
+        pool.stats()    # {"hits": ..., "misses": ..., "prewarmed": ..., ...}
+    """
+    def __init__(self, control_dir=None, persist=300, timeout=10, ssh_executable="ssh"):
+        self.control_dir = os.path.expanduser(control_dir or "~/.ansible/cp")
+        if not os.path.isdir(self.control_dir):
+            os.makedirs(self.control_dir, 0o700)
+        self.persist = persist
+        self.timeout = timeout
+        self.ssh_executable = ssh_executable
+        self.hits = 0
+        self.misses = 0
+        self.prewarmed = 0
+        self.prewarm_failed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def control_path(self):
+        return os.path.join(self.control_dir, "%h-%p-%r")
+
+    def ssh_common_args(self, extra=None):
+        args = '-o ControlMaster=auto -o ControlPersist=%ds -o ControlPath="%s"' % (
+            self.persist, self.control_path)
+        if extra:
+            args = "%s %s" % (args, extra)
+        return args
+
+    @staticmethod
+    def _inventory(hosts):
+        if isinstance(hosts, MyInventory):
+            return hosts
+        return MyInventory(host_list=hosts)
+
+    def endpoints(self, inventory, pattern="all", remote_user=None, connection="smart"):
+        """
+        {host name: (address, port, user, private key)} of the hosts
+        matching `pattern` that are reached over ssh.
+        """
+        endpoints = {}
+        for host in inventory.get_hosts(pattern):
+            hostvars = combine_vars(host.get_group_vars(), host.get_vars())
+            if hostvars.get("ansible_connection", connection) not in SSH_CONNECTIONS:
+                continue
+            address = hostvars.get("ansible_host") or hostvars.get("ansible_ssh_host") or host.name
+            port = hostvars.get("ansible_port") or hostvars.get("ansible_ssh_port") or 22
+            user = hostvars.get("ansible_user") or hostvars.get("ansible_ssh_user") \
+                or remote_user or getpass.getuser()
+            key = hostvars.get("ansible_ssh_private_key_file") \
+                or hostvars.get("ansible_private_key_file")
+            endpoints[host.name] = ("%s" % address, int(port), "%s" % user, key)
+        return endpoints
+
+    def socket_path(self, address, port, user):
+        """ the ControlPath of an endpoint, as ssh expands it """
+        return os.path.join(self.control_dir, "%s-%d-%s" % (address.lower(), port, user))
+
+    def is_open(self, address, port, user):
+        return os.path.exists(self.socket_path(address, port, user))
+
+    def observe(self, inventory, pattern="all", remote_user=None, connection="smart"):
+        """ count the hosts of a run whose master connection is open (hits) """
+        endpoints = self.endpoints(inventory, pattern, remote_user, connection)
+        hits = sum(1 for e in endpoints.values() if self.is_open(*e[:3]))
+        with self._lock:
+            self.hits += hits
+            self.misses += len(endpoints) - hits
+
+    def _open(self, endpoint):
+        address, port, user, key = endpoint
+        if self.is_open(address, port, user):
+            return None
+        command = [
+            self.ssh_executable, "-fnN",
+            "-o", "ControlMaster=yes",
+            "-o", "ControlPersist=%ds" % self.persist,
+            "-o", "ControlPath=%s" % self.control_path,
+            "-o", "ConnectTimeout=%d" % self.timeout,
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            "-p", "%d" % port, "-l", user,
+        ]
+        if key:
+            command += ["-i", os.path.expanduser(key)]
+        command.append(address)
+
+        # not pipes: the master stays in the background with them open
+        with open(os.devnull, "w") as devnull:
+            with tempfile.TemporaryFile() as stderr:
+                returncode = subprocess.call(command, stdout=devnull, stderr=stderr)
+                if returncode == 0:
+                    return None
+                stderr.seek(0)
+                error = stderr.read().decode("utf-8", "replace").strip()
+        return error or "ssh exited with %d" % returncode
+
+    def prewarm(self, hosts, pattern="all", remote_user=None, connection="smart", forks=50):
+        """
+        Open the master connections of the hosts matching `pattern` in
+        parallel, `hosts` being a MyInventory or what it takes.
+        Returns {"opened": [...], "open": [...], "failed": {host: error}}.
+        """
+        endpoints = self.endpoints(self._inventory(hosts), pattern, remote_user, connection)
+        names = sorted(endpoints)
+        already = [n for n in names if self.is_open(*endpoints[n][:3])]
+        todo = [n for n in names if n not in already]
+
+        failed = {}
+        if todo:
+            pool = ThreadPool(max(1, min(forks, len(todo))))
+            try:
+                errors = pool.map(self._open, [endpoints[n] for n in todo])
+            finally:
+                pool.close()
+                pool.join()
+            failed = dict((n, e) for n, e in zip(todo, errors) if e)
+
+        opened = [n for n in todo if n not in failed]
+        with self._lock:
+            self.prewarmed += len(opened)
+            self.prewarm_failed += len(failed)
+        return dict(opened=opened, open=already, failed=failed)
+
+    def sockets(self):
+        return [os.path.join(self.control_dir, name)
+                for name in sorted(os.listdir(self.control_dir))]
+
+    def close(self):
+        """ close every master connection of the control directory """
+        with open(os.devnull, "w") as devnull:
+            for path in self.sockets():
+                subprocess.call([self.ssh_executable, "-o", "ControlPath=%s" % path,
+                                 "-O", "exit", "localhost"],
+                                stdout=devnull, stderr=subprocess.STDOUT)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, prewarmed=self.prewarmed,
+                    prewarm_failed=self.prewarm_failed, open=len(self.sockets()))
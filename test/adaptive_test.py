@@ -0,0 +1,73 @@
+# coding:utf8
+
+import os
+
+from adaptive import ForksController
+from runner import Runner
+from playbook_runner import PlaybookRunner
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def controller(**kwargs):
+    # no cpu/memory limit: the forks only follow the throughput
+    return ForksController(cpu_limit=float("inf"), memory_limit=float("inf"), **kwargs)
+
+
+def test_batches_follow_the_forks():
+    forks = controller(min_forks=1, max_forks=4, window=1)
+    sizes = [len(batch) for batch in forks.batches(range(10))]
+    assert sum(sizes) == 10
+    assert sizes[0] == 1
+    assert forks.history[0]["reason"] == "grow" and forks.history[0]["next"] == 2
+
+
+def test_runner_with_adaptive_forks(hosts, within):
+    forks = controller(min_forks=1, max_forks=4, window=1)
+    runner = Runner(module_name="shell", module_args="sleep 0.3; echo hi", hosts=hosts(7),
+                    connection_type="local", forks=4, adaptive_forks=forks)
+    result_q = within(120, runner.run)
+    assert sorted(result_q["contacted"]) == ["host%d" % i for i in range(7)]
+    assert result_q["dark"] == {}
+    history = result_q["concurrency"]
+    assert sum(batch["hosts"] for batch in history) == 7
+    assert history[0]["forks"] == 1
+    assert all(1 <= batch["forks"] <= 4 for batch in history)
+
+
+def test_playbook_with_adaptive_forks(hosts, within):
+    runner = PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"), hosts=hosts(3),
+                            forks=2, adaptive_forks=controller(min_forks=1, max_forks=2))
+    output = within(120, runner.run)
+    assert sorted(output["stats"]) == ["host0", "host1", "host2"]
+    assert all(s["failures"] == 0 and s["unreachable"] == 0 for s in output["stats"].values())
+    # a play without serial is one batch, at the forks the previous play left
+    assert [batch["hosts"] for batch in output["concurrency"]] == [3, 3]
+    assert [batch["forks"] for batch in output["concurrency"]] == [1, 2]
+
+
+def test_play_without_serial_keeps_running_after_failures(hosts, within, tmpdir):
+    playbook = tmpdir.join("failing.yml")
+    playbook.write("- hosts: all\n  gather_facts: no\n  tasks:\n"
+                   "  - fail:\n    when: inventory_hostname != 'host2'\n"
+                   "  - shell: echo once\n    run_once: true\n"
+                   "  - shell: echo hi\n")
+    runner = PlaybookRunner(playbook_path=str(playbook), hosts=hosts(3), forks=2,
+                            adaptive_forks=controller(min_forks=1, max_forks=2, window=1))
+    output = within(120, runner.run)
+    stats = output["stats"]
+    assert stats["host0"]["failures"] == 1 and stats["host1"]["failures"] == 1
+    # host2 was not cut off by the failures of the other hosts
+    assert stats["host2"]["failures"] == 0 and stats["host2"]["ok"] == 2
+    assert len(output["concurrency"]) == 1
+
+
+def test_serial_batches_keep_their_size(hosts, within, tmpdir):
+    playbook = tmpdir.join("serial.yml")
+    playbook.write("- hosts: all\n  gather_facts: no\n  serial: 2\n"
+                   "  tasks:\n  - shell: echo hi\n")
+    runner = PlaybookRunner(playbook_path=str(playbook), hosts=hosts(5), forks=2,
+                            adaptive_forks=controller(min_forks=1, max_forks=2))
+    output = within(120, runner.run)
+    assert sorted(output["stats"]) == ["host%d" % i for i in range(5)]
+    assert [batch["hosts"] for batch in output["concurrency"]] == [2, 2, 1]
@@ -0,0 +1,89 @@
+# coding:utf8
+"""
+Runs on python 3.5+ only, and parses on python 2.7: no async syntax.
+"""
+
+import sys
+import time
+import threading
+
+import pytest
+
+from runner import Runner
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="asyncio needs python 3.5+")
+
+if sys.version_info >= (3, 5):
+    import asyncio
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def drain(loop, iterator, limit=None):
+    """ `async for` over `iterator`, from a thread other than the loop's """
+    asyncio.set_event_loop(loop)
+    items = []
+    while limit is None or len(items) < limit:
+        try:
+            items.append(loop.run_until_complete(iterator.__anext__()))
+        except StopAsyncIteration:
+            break
+    return items
+
+
+def test_run_async(hosts, within, loop):
+    runner = Runner(module_name="shell", module_args="echo hi", hosts=hosts(3),
+                    connection_type="local")
+    result_q = within(120, loop.run_until_complete, runner.run_async())
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2"]
+
+
+def test_cancel_terminates_the_run(hosts, within, loop):
+    runner = Runner(module_name="shell", module_args="sleep 30", hosts=hosts(3),
+                    connection_type="local", forks=3)
+    task = loop.create_task(asyncio.wait_for(runner.run_async(), None))
+    loop.call_later(2, task.cancel)
+    started = time.time()
+    within(60, loop.run_until_complete, asyncio.wait([task]))
+    assert time.time() - started < 30
+    assert task.cancelled()
+    # the run wound down before the task was cancelled
+    assert runner.runner._terminated
+    assert threading.active_count() < 10
+
+
+def test_wait_for_timeout(hosts, within, loop):
+    runner = Runner(module_name="shell", module_args="sleep 30", hosts=hosts(2),
+                    connection_type="local")
+    with pytest.raises(asyncio.TimeoutError):
+        within(60, loop.run_until_complete, asyncio.wait_for(runner.run_async(), 2))
+
+
+def test_aiter_results(hosts, within, loop):
+    runner = Runner(module_name="shell", module_args="echo hi", hosts=hosts(4),
+                    connection_type="local", forks=4)
+    items = within(120, drain, loop, runner.aiter_results(maxsize=1))
+    assert sorted(host for host, _, _ in items) == ["host0", "host1", "host2", "host3"]
+    assert set(status for _, status, _ in items) == set(["ok"])
+
+
+def test_aclose_stops_the_run(hosts, within, loop):
+    inventory = hosts(6)
+    inventory["_meta"] = {"hostvars": dict(
+        ("host%d" % i, {"pause": 30}) for i in range(1, 6))}
+    runner = Runner(module_name="shell", module_args="sleep {{ pause | default(0) }}",
+                    hosts=inventory, connection_type="local", forks=6)
+    iterator = runner.aiter_results(maxsize=2)
+    started = time.time()
+    items = within(60, drain, loop, iterator, 1)
+    assert [host for host, _, _ in items] == ["host0"]
+    within(60, loop.run_until_complete, iterator.aclose())
+    assert time.time() - started < 30
+    assert runner.runner._terminated
@@ -0,0 +1,32 @@
+# coding:utf8
+
+import pytest
+
+from ansible.errors import AnsibleError
+
+from runner import BatchRunner
+
+
+def test_batch_runs_every_task(hosts, within):
+    inventory = hosts(3)
+    inventory["_meta"] = {"hostvars": {"host2": {"fail": 1}}}
+    runner = BatchRunner(tasks=[("first", "shell", "exit {{ fail | default(0) }}"),
+                                ("shell", "echo second"),
+                                ("ping", "")],
+                         hosts=inventory, connection_type="local", forks=3)
+    result_q = within(120, runner.run)
+    assert sorted(result_q) == ["first", "ping", "shell echo second"]
+    assert sorted(result_q["first"]["contacted"]) == ["host0", "host1"]
+    assert sorted(result_q["first"]["dark"]) == ["host2"]
+    assert result_q["first"]["dark"]["host2"]["rc"] == 1
+    # the failure of the first task doesn't stop the following ones
+    second = result_q["shell echo second"]["contacted"]
+    assert sorted(second) == ["host0", "host1", "host2"]
+    assert all(r["stdout"] == "second" for r in second.values())
+    assert all(r["ping"] == "pong" for r in result_q["ping"]["contacted"].values())
+    assert not result_q["ping"]["dark"] and not result_q["shell echo second"]["dark"]
+
+
+def test_batch_refuses_duplicate_names(hosts):
+    with pytest.raises(AnsibleError):
+        BatchRunner(tasks=[("shell", "uptime"), ("shell", "uptime")], hosts=hosts(1))
@@ -0,0 +1,68 @@
+# coding:utf8
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from ansible.plugins import connection_loader
+
+from myinventory import MyInventory
+from runner import Runner
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH)
+
+from fake_hosts import make_inventory, host_names
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    connection_loader.add_directory(os.path.join(BENCH, "connection_plugins"))
+    for name in ("FAKE_LATENCY", "FAKE_CONNECT_LATENCY", "FAKE_JITTER", "FAKE_FAILURE_RATE"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+@pytest.mark.parametrize("form", ["dict", "list", "string"])
+def test_synthetic_inventories(form):
+    inventory = MyInventory(host_list=make_inventory(120, form=form))
+    assert sorted(h.name for h in inventory.list_hosts("all")) == host_names(120)
+    if form == "dict":
+        assert len(inventory.list_hosts("group2")) == 20
+        assert len(inventory.list_hosts("region0")) == 120
+
+
+def test_fake_connection(fake, within):
+    fake.setenv("FAKE_LATENCY", "0.2")
+    hosts = make_inventory(4, group_size=2)
+    runner = Runner(module_name="ping", hosts=hosts, connection_type="fake", forks=4,
+                    extra_vars=["ansible_python_interpreter=%s" % sys.executable])
+    result_q = within(120, runner.run)
+    assert sorted(result_q["contacted"]) == host_names(4)
+    assert all(r["ping"] == "pong" for r in result_q["contacted"].values())
+
+
+def test_fake_connection_failures(fake, within):
+    fake.setenv("FAKE_FAILURE_RATE", "1")
+    runner = Runner(module_name="ping", hosts=make_inventory(3), connection_type="fake",
+                    extra_vars=["ansible_python_interpreter=%s" % sys.executable])
+    result_q = within(120, runner.run)
+    assert result_q["contacted"] == {}
+    assert sorted(result_q["dark"]) == host_names(3)
+    assert all(r["unreachable"] for r in result_q["dark"].values())
+
+
+def test_bench_report(within, tmpdir):
+    output = str(tmpdir.join("bench.json"))
+    command = [sys.executable, os.path.join(BENCH, "bench.py"), "--sizes", "10",
+               "--forms", "dict", "--forks", "2", "--run-hosts", "3", "--repeat", "1",
+               "--slow-seconds", "0.5", "-o", output]
+    assert within(180, subprocess.call, command) == 0
+    with open(output) as fd:
+        report = json.load(fd)
+    assert [r["hosts"] for r in report["runner"]] == [3]
+    assert all(r["failed"] == 0 for r in report["runner"] + report["playbook"])
+    assert report["inventory"][0]["form"] == "dict"
@@ -0,0 +1,81 @@
+# coding:utf8
+
+import os
+
+from breaker import CircuitBreaker, OPEN
+from result_sink import JsonlResultSink
+from runner import Runner
+from playbook_runner import PlaybookRunner
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# nothing listens on port 1: the host is unreachable at once
+REFUSED = {"ansible_connection": "ssh", "ansible_host": "127.0.0.1", "ansible_port": 1}
+
+
+def inventory_with_dead_host(hosts):
+    inventory = hosts(3)
+    inventory["_meta"] = {"hostvars": {"host2": REFUSED}}
+    return inventory
+
+
+def test_breaker_leaves_a_dead_host_out(hosts, within, tmpdir):
+    path = str(tmpdir.join("breaker.db"))
+    inventory = inventory_with_dead_host(hosts)
+
+    def run(breaker):
+        return within(120, Runner(module_name="ping", hosts=inventory, connection_type="local",
+                                  breaker=breaker).run)
+
+    breaker = CircuitBreaker(path, threshold=2, backoff=3600)
+    first = run(breaker)
+    assert sorted(first["dark"]) == ["host2"] and first["skipped_by_breaker"] == []
+    second = run(breaker)
+    assert sorted(second["dark"]) == ["host2"] and second["skipped_by_breaker"] == []
+    assert breaker.state("host2")["state"] == OPEN
+
+    # another breaker on the same database: the state is shared
+    third = run(CircuitBreaker(path, threshold=2, backoff=3600))
+    assert third["skipped_by_breaker"] == ["host2"]
+    assert sorted(third["contacted"]) == ["host0", "host1"]
+    assert third["dark"] == {}
+
+
+def test_breaker_probes_after_the_backoff(hosts, within):
+    breaker = CircuitBreaker(threshold=1, backoff=0)
+    breaker.failure("host1", "down")
+    assert breaker.state("host1")["state"] == OPEN
+
+    runner = Runner(module_name="ping", hosts=inventory_with_dead_host(hosts),
+                    connection_type="local", breaker=breaker)
+    result_q = within(120, runner.run)
+    # host1 was probed and answered, host2 tripped its breaker
+    assert result_q["skipped_by_breaker"] == []
+    assert sorted(result_q["contacted"]) == ["host0", "host1"]
+    assert breaker.states() == {"host2": breaker.state("host2")}
+    assert breaker.state("host2")["state"] == OPEN
+
+
+def test_breaker_in_playbooks(hosts, within):
+    breaker = CircuitBreaker(threshold=1, backoff=3600)
+    breaker.failure("host2")
+    runner = PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"),
+                            hosts=inventory_with_dead_host(hosts), breaker=breaker)
+    output = within(120, runner.run)
+    assert output["skipped_by_breaker"] == ["host2"]
+    assert sorted(output["stats"]) == ["host0", "host1"]
+    assert all(s["unreachable"] == 0 for s in output["stats"].values())
+
+
+def test_breaker_open_for_every_host_with_a_sink(hosts, within, tmpdir):
+    breaker = CircuitBreaker(threshold=1, backoff=3600)
+    for name in ("host0", "host1"):
+        breaker.failure(name)
+    sink = JsonlResultSink(str(tmpdir.join("results.jsonl")))
+    runner = PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"),
+                            hosts=hosts(2), breaker=breaker, result_sink=sink)
+    output = within(120, runner.run)
+    assert output is sink
+    assert sorted(sink.skipped_by_breaker) == ["host0", "host1"]
+    assert list(sink.records()) == [] and sink.stats == {}
+    sink.close()
@@ -0,0 +1,50 @@
+# coding:utf8
+
+import os
+
+from compact import CompactHost, SharedVars
+from myinventory import MyInventory
+from runner import Runner
+from playbook_runner import PlaybookRunner
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def compact_inventory(hosts, **kwargs):
+    inventory = hosts(4)
+    inventory["_meta"] = {"hostvars": dict(
+        ("host%d" % i, {"rack": "rack-%d" % (i % 2)}) for i in range(4))}
+    return MyInventory(host_list=inventory, compact=True, **kwargs)
+
+
+def test_hosts_share_identical_vars(hosts):
+    inventory = compact_inventory(hosts)
+    host0, host1, host2 = [inventory.get_host("host%d" % i) for i in range(3)]
+    # every attribute is a slot: no instance dict gets filled
+    assert isinstance(host0, CompactHost) and host0.__dict__ == {}
+    assert host0.vars is host2.vars and isinstance(host0.vars, SharedVars)
+    assert host0.vars is not host1.vars
+
+    host0.set_variable("rack", "rack-9")
+    assert host0.vars == {"rack": "rack-9"}
+    assert host2.vars == {"rack": "rack-0"}
+    assert host0.__dict__ == {}
+
+
+def test_runner_on_a_compact_inventory(hosts, within):
+    for lazy_vars in (False, True):
+        runner = Runner(module_name="shell", module_args="echo {{ rack }}",
+                        hosts=compact_inventory(hosts, lazy_vars=lazy_vars),
+                        connection_type="local", forks=4)
+        result_q = within(120, runner.run)
+        assert sorted(result_q["contacted"]) == ["host0", "host1", "host2", "host3"]
+        assert result_q["contacted"]["host1"]["stdout"] == "rack-1"
+        assert result_q["contacted"]["host2"]["stdout"] == "rack-0"
+
+
+def test_playbook_on_a_compact_inventory(hosts, within):
+    runner = PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"),
+                            hosts=compact_inventory(hosts))
+    output = within(120, runner.run)
+    assert sorted(output["stats"]) == ["host0", "host1", "host2", "host3"]
+    assert all(s["failures"] == 0 and s["unreachable"] == 0 for s in output["stats"].values())
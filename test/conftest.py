@@ -0,0 +1,64 @@
+# coding:utf8
+"""
+Fixtures of the tests: inventories of hosts that run on the local
+connection, with the python running the tests, and a guard for calls
+that must return in bounded time.
+
+    cd test && python -m pytest -q
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# scripts against real hosts, run by hand
+collect_ignore = ["runner_test.py", "playbook_test.py"]
+
+
+def local_inventory(count=4, group="group1", prefix="host"):
+    """ a dict inventory of `count` hosts on the local connection """
+    return {
+        group: {
+            "hosts": ["%s%d" % (prefix, i) for i in range(count)],
+            "vars": {"ansible_connection": "local",
+                     "ansible_python_interpreter": sys.executable},
+        }
+    }
+
+
+def call_within(timeout, func, *args, **kwargs):
+    """
+    func(*args, **kwargs) in a thread, failing the test if it hasn't
+    returned after `timeout` seconds; its result, or what it raised.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, name="bounded-call")
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        pytest.fail("%s did not return within %ss" % (getattr(func, "__name__", func), timeout))
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+@pytest.fixture
+def hosts():
+    return local_inventory
+
+
+@pytest.fixture
+def within():
+    return call_within
@@ -0,0 +1,124 @@
+# coding:utf8
+
+import os
+import time
+
+import pytest
+
+from ansible.errors import AnsibleError
+
+import daemon
+from daemon import JobDaemon, DaemonClient
+
+
+class StuckRunner(object):
+    """ a job that ignores terminate(), as one hung winding down """
+    def __init__(self, result_sink=None, **kwargs):
+        self.sink = result_sink
+
+    def run(self):
+        self.sink.add("host0", "ok", {"msg": "started"})
+        # a signal cuts a sleep short
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            time.sleep(1)
+
+    def terminate(self):
+        pass
+
+
+@pytest.fixture
+def jobs(tmpdir):
+    job_daemon = JobDaemon(os.path.join(str(tmpdir), "jobs.sock"), max_jobs=1,
+                           kill_after=2).start()
+    yield job_daemon
+    job_daemon.shutdown()
+
+
+def wait_for(predicate, timeout=60):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.1)
+
+
+def test_runner_job(jobs, hosts, within):
+    client = DaemonClient(jobs.address)
+    job = client.submit("runner", hosts=hosts(3), module_name="shell",
+                        module_args="echo hi", connection_type="local")
+    end = within(120, client.wait, job)
+    assert end["state"] == "done"
+    assert end["counts"] == {"ok": 3}
+    records = client.results(job)
+    assert sorted(r["host"] for r in records) == ["host0", "host1", "host2"]
+    assert all(r["result"]["stdout"] == "hi" for r in records)
+
+
+def test_job_keeps_the_last_records(hosts, within, tmpdir):
+    job_daemon = JobDaemon(os.path.join(str(tmpdir), "jobs.sock"), max_records=2).start()
+    try:
+        client = DaemonClient(job_daemon.address)
+        job = client.submit("runner", hosts=hosts(3), module_name="shell",
+                            module_args="echo hi", connection_type="local")
+        end = within(120, client.wait, job)
+        assert end["state"] == "done"
+        assert end["counts"] == {"ok": 3}
+        assert end["results"] == 3 and end["dropped"] == 1
+        assert len(client.results(job)) == 2
+        assert len(job_daemon.get(job).results) == 2
+    finally:
+        job_daemon.shutdown()
+
+
+def test_cancel_frees_the_slot(jobs, hosts, within):
+    client = DaemonClient(jobs.address)
+    slow = client.submit("runner", hosts=hosts(2), module_name="shell",
+                         module_args="sleep 60", connection_type="local")
+    queued = client.submit("runner", hosts=hosts(1), module_name="shell",
+                           module_args="echo next", connection_type="local")
+    wait_for(lambda: client.status(slow)["state"] == "running")
+    time.sleep(2)
+    started = time.time()
+    client.cancel(slow)
+    assert within(60, client.wait, slow)["state"] == "cancelled"
+    assert time.time() - started < 30
+    # max_jobs=1: the next job only runs once the slot is back
+    assert within(120, client.wait, queued)["state"] == "done"
+
+
+def test_stuck_job_is_killed(jobs, within, monkeypatch):
+    monkeypatch.setitem(daemon.RUNNERS, "stuck", StuckRunner)
+    client = DaemonClient(jobs.address)
+    job = client.submit("stuck")
+    wait_for(lambda: client.status(job)["results"] == 1)
+    started = time.time()
+    client.cancel(job)
+    end = within(60, client.wait, job)
+    assert time.time() - started < 30
+    assert end["state"] == "cancelled"
+    assert end["results"] == 1
+    assert jobs._active == 0
+
+
+def test_tcp_daemon_needs_the_token(tmpdir):
+    with pytest.raises(AnsibleError):
+        JobDaemon(("127.0.0.1", 0))
+    token_file = str(tmpdir.join("jobs.token"))
+    job_daemon = JobDaemon(("127.0.0.1", 0), token_file=token_file).start()
+    try:
+        assert os.stat(token_file).st_mode & 0o777 == 0o600
+        assert DaemonClient(job_daemon.address, token_file=token_file).ping()["pong"]
+        with pytest.raises(AnsibleError):
+            DaemonClient(job_daemon.address).submit("runner", hosts=["127.0.0.1"],
+                                                    module_name="ping")
+        assert job_daemon.jobs == {}
+    finally:
+        job_daemon.shutdown()
+
+
+def test_token_file_others_can_read_is_refused(tmpdir):
+    token_file = tmpdir.join("jobs.token")
+    token_file.write("secret")
+    token_file.chmod(0o644)
+    with pytest.raises(AnsibleError):
+        JobDaemon(("127.0.0.1", 0), token_file=str(token_file))
@@ -0,0 +1,77 @@
+# coding:utf8
+
+import ansible.constants as C
+
+from runner import Runner, BatchRunner
+from fact_cache import JsonFactCache, smart_gathering
+
+
+def test_gathered_facts_stay_out_of_the_results(hosts, within):
+    runner = Runner(module_name="shell", module_args="echo hi", hosts=hosts(3),
+                    connection_type="local", gather_facts="yes")
+    items = within(120, lambda: list(runner.iter_results()))
+    assert sorted(host for host, _, _ in items) == ["host0", "host1", "host2"]
+    for host, status, result in items:
+        assert status == "ok"
+        assert result["stdout"] == "hi"
+        assert "ansible_facts" not in result
+
+
+def test_gathered_facts_stay_out_of_result_q(hosts, within):
+    result_q = within(120, Runner(
+        module_name="shell", module_args="echo hi", hosts=hosts(3),
+        connection_type="local", gather_facts="yes").run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2"]
+    assert all(r["stdout"] == "hi" for r in result_q["contacted"].values())
+    assert result_q["dark"] == {}
+
+
+def test_batch_gathers_facts_once(hosts, within):
+    result_q = within(120, BatchRunner(
+        tasks=[("shell", "echo one"), ("shell", "echo two")], hosts=hosts(2),
+        connection_type="local", gather_facts="yes").run)
+    assert sorted(result_q) == ["shell echo one", "shell echo two"]
+    assert sorted(result_q["shell echo two"]["contacted"]) == ["host0", "host1"]
+
+
+def test_smart_gathering_uses_the_cache(hosts, within, tmpdir):
+    cache = JsonFactCache(str(tmpdir), ttl=600)
+    inventory = hosts(2)
+
+    def run():
+        return Runner(module_name="shell", module_args="echo hi", hosts=inventory,
+                      connection_type="local", fact_cache=cache, timing=True).run()
+
+    first = within(120, run)
+    assert sorted(first["contacted"]) == ["host0", "host1"]
+    assert cache.get("host0")["ansible_python_version"]
+    second = within(120, run)
+    assert sorted(second["contacted"]) == ["host0", "host1"]
+    tasks = lambda result_q: set(task for host in result_q["timing"]["hosts"].values()
+                                 for task in host)
+    # gathered, then every host has fresh facts
+    assert len(tasks(first)) == 2
+    assert tasks(second) == set(["command"])
+
+
+def test_failed_gathering_is_the_host_result(hosts, within):
+    inventory = hosts(2)
+    inventory["_meta"] = {"hostvars": {"host1": {"ansible_python_interpreter": "/nonexistent/python"}}}
+    result_q = within(120, Runner(
+        module_name="shell", module_args="echo hi", hosts=inventory,
+        connection_type="local", gather_facts="yes").run)
+    assert sorted(result_q["contacted"]) == ["host0"]
+    assert sorted(result_q["dark"]) == ["host1"]
+    assert result_q["dark"]["host1"]["failed"]
+
+
+def test_overlapping_smart_gatherings_restore_the_setting():
+    before = C.DEFAULT_GATHERING
+    first, second = smart_gathering(), smart_gathering()
+    first.__enter__()
+    second.__enter__()
+    # the first run ends while the second one still runs
+    first.__exit__(None, None, None)
+    assert C.DEFAULT_GATHERING == 'smart'
+    second.__exit__(None, None, None)
+    assert C.DEFAULT_GATHERING == before
@@ -0,0 +1,47 @@
+# coding:utf8
+
+import os
+
+from inventory_cache import InventoryCache, inventory_key
+from runner import Runner
+
+
+def test_same_content_same_inventory(hosts):
+    cache = InventoryCache(maxsize=2)
+    inventory = cache.get(hosts(2))
+    assert cache.get(hosts(2)) is inventory
+    assert cache.get(hosts(3)) is not inventory
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_out(hosts):
+    cache = InventoryCache(maxsize=2)
+    cache.get(hosts(1))
+    cache.get(hosts(2))
+    cache.get(hosts(1))
+    cache.get(hosts(3))
+    assert hosts(1) in cache and hosts(3) in cache
+    assert hosts(2) not in cache
+
+
+def test_edited_file_is_parsed_again(tmpdir):
+    path = tmpdir.join("hosts")
+    path.write("[web]\nweb1\n")
+    cache = InventoryCache()
+    first = cache.get(str(path))
+    assert [h.name for h in first.list_hosts("web")] == ["web1"]
+    key = inventory_key(str(path))
+    path.write("[web]\nweb1\nweb2\n")
+    os.utime(str(path), (1, 1))
+    assert inventory_key(str(path)) != key
+    assert [h.name for h in cache.get(str(path)).list_hosts("web")] == ["web1", "web2"]
+
+
+def test_runners_share_the_inventory(hosts, within):
+    cache = InventoryCache()
+    for _ in range(2):
+        runner = Runner(module_name="shell", module_args="echo hi", hosts=hosts(2),
+                        connection_type="local", inventory_cache=cache)
+        result_q = within(120, runner.run)
+        assert sorted(result_q["contacted"]) == ["host0", "host1"]
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
@@ -0,0 +1,46 @@
+# coding:utf8
+
+import pytest
+from ansible.inventory import Inventory
+
+from myinventory import MyInventory
+
+HOSTS = {
+    "web": {"hosts": ["web1", "web2", "alpha"], "vars": {"role": "web"}},
+    "db": {"hosts": ["db1", "web2"]},
+    "dc": {"children": ["web", "db"]},
+    "allstars": ["star1"],
+    "ungrouped": ["loner", "ungrouped"],
+    "_meta": {"hostvars": {"db1": {"port": 5432}}},
+}
+
+PATTERNS = [
+    "all", "ungrouped", "al*", "ungr*", "*", "web", "dc", "db1", "loner",
+    "web*", "w?b2", "[ad]*", "~^web", "~eb", "~^(db|star)", "~^all", "nothing", "no*",
+]
+
+
+def names(hosts):
+    return sorted(set(h.name for h in hosts))
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_index_matches_like_ansible(pattern):
+    inventory = MyInventory(HOSTS)
+    expected = names(Inventory._enumerate_matches(inventory, pattern))
+    assert names(inventory.get_index().match(pattern)) == expected
+
+
+@pytest.mark.parametrize("pattern", ["all", "ungrouped", "al*", "ungr*", "1.1.*", "~2$"])
+def test_index_matches_a_host_list_like_ansible(pattern):
+    inventory = MyInventory(["1.1.1.1", "2.2.2.2"])
+    expected = names(Inventory._enumerate_matches(inventory, pattern))
+    assert names(inventory.get_index().match(pattern)) == expected
+
+
+def test_list_hosts_combines_patterns():
+    inventory = MyInventory(HOSTS)
+    assert names(inventory.list_hosts("dc:!db")) == ["alpha", "web1"]
+    assert names(inventory.list_hosts("web:&db")) == ["web2"]
+    assert names(inventory.list_hosts("web[0]")) == ["web1"]
+    assert inventory.list_hosts("nothing") == []
@@ -0,0 +1,40 @@
+# coding:utf8
+
+from myinventory import MyInventory
+from runner import Runner
+
+
+def inventory_data(hosts):
+    data = hosts(3)
+    data["group1"]["vars"]["greeting"] = "hello"
+    data["_meta"] = {"hostvars": {"host0": {"name": "zero"}, "host2": {"name": "two"}}}
+    return data
+
+
+def test_vars_resolved_when_selected(hosts):
+    inventory = MyInventory(inventory_data(hosts), lazy_vars=True)
+    assert "name" not in inventory.get_index().hosts["host0"].vars
+    inventory.list_hosts("all")
+    assert not inventory._resolved_hosts
+
+    selected = inventory.get_hosts("host0")
+    assert [h.name for h in selected] == ["host0"]
+    assert selected[0].vars["name"] == "zero"
+    assert inventory._resolved_hosts == set(["host0"])
+
+
+def test_same_vars_as_eager(hosts):
+    eager = MyInventory(inventory_data(hosts))
+    lazy = MyInventory(inventory_data(hosts), lazy_vars=True)
+    for name in ("host0", "host1", "host2"):
+        assert lazy.get_host(name).get_vars() == eager.get_host(name).get_vars()
+
+
+def test_run_sees_the_vars(hosts, within):
+    inventory = MyInventory(inventory_data(hosts), lazy_vars=True)
+    runner = Runner(module_name="shell", module_args="echo {{ greeting }} {{ name }}",
+                    hosts=inventory, pattern="host0:host2", connection_type="local")
+    result_q = within(120, runner.run)
+    assert result_q["contacted"]["host0"]["stdout"] == "hello zero"
+    assert result_q["contacted"]["host2"]["stdout"] == "hello two"
+    assert "host1" not in inventory._resolved_hosts
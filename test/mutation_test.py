@@ -0,0 +1,72 @@
+# coding:utf8
+
+import pytest
+
+from ansible.errors import AnsibleError
+
+from myinventory import MyInventory
+from runner import Runner
+
+PATTERNS = ["all", "ungrouped", "web", "db", "prod", "host*", "prod:!db", "web:&prod", "new0"]
+
+
+def names(inventory, pattern):
+    return sorted(h.name for h in inventory.list_hosts(pattern))
+
+
+def start(hosts):
+    data = hosts(3, group="web")
+    data.update(hosts(2, group="db", prefix="db"))
+    data["prod"] = {"children": ["web"]}
+    return data
+
+
+def test_mutations_match_a_rebuilt_inventory(hosts):
+    inventory = MyInventory(host_list=start(hosts))
+    for pattern in PATTERNS:
+        inventory.list_hosts(pattern)   # the caches the changes must drop
+
+    inventory.add_host("new0", groups=["web", "db"], vars={"rack": 1})
+    inventory.remove_host("host1")
+    inventory.move_host("db1", "db", "web")
+    inventory.add_child_group("prod", "db")
+    inventory.remove_child_group("prod", "web")
+
+    rebuilt = start(hosts)
+    rebuilt["web"]["hosts"] = ["host0", "host2", "new0", "db1"]
+    rebuilt["db"]["hosts"] = ["db0", "new0"]
+    rebuilt["prod"] = {"children": ["db"]}
+    rebuilt["_meta"] = {"hostvars": {"new0": {"rack": 1}}}
+    expected = MyInventory(host_list=rebuilt)
+    for pattern in PATTERNS:
+        assert names(inventory, pattern) == names(expected, pattern), pattern
+
+    inventory.remove_group("db")
+    del rebuilt["db"]
+    rebuilt["prod"] = {"hosts": []}
+    rebuilt["ungrouped"] = {"hosts": ["db0"]}
+    expected = MyInventory(host_list=rebuilt)
+    for pattern in PATTERNS:
+        assert names(inventory, pattern) == names(expected, pattern), pattern
+    assert [g.name for g in inventory.get_host("db0").get_groups()
+            if g.name != "all"] == ["ungrouped"]
+
+    with pytest.raises(AnsibleError):
+        inventory.add_host("host0")
+
+
+def test_runner_sees_the_changes(hosts, within):
+    inventory = MyInventory(host_list=start(hosts))
+    within(120, Runner(module_name="ping", hosts=inventory, pattern="web",
+                       connection_type="local").run)
+
+    inventory.remove_host("host0")
+    inventory.add_host("new0", groups=["web"])
+    inventory.set_group_vars("web", {"greeting": "hello"})
+    inventory.set_host_vars("host2", {"greeting": "bye"})
+    result_q = within(120, Runner(module_name="shell", module_args="echo {{ greeting }}",
+                                  hosts=inventory, pattern="web",
+                                  connection_type="local").run)
+    assert sorted(result_q["contacted"]) == ["host1", "host2", "new0"]
+    assert result_q["contacted"]["new0"]["stdout"] == "hello"
+    assert result_q["contacted"]["host2"]["stdout"] == "bye"
@@ -0,0 +1,39 @@
+# coding:utf8
+
+import os
+
+from playbook_cache import PlaybookCache, CachingDataLoader
+from playbook_runner import PlaybookRunner
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_loader_reads_each_file_once():
+    cache = PlaybookCache()
+    path = os.path.join(HERE, "two_play.yml")
+    first = CachingDataLoader(cache).load_from_file(path)
+    second = CachingDataLoader(cache).load_from_file(path)
+    assert first == second
+    assert first is not second
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_edited_file_is_parsed_again(tmpdir):
+    cache = PlaybookCache()
+    path = tmpdir.join("vars.yml")
+    path.write("a: 1\n")
+    assert CachingDataLoader(cache).load_from_file(str(path)) == {"a": 1}
+    path.write("a: 22\n")
+    assert CachingDataLoader(cache).load_from_file(str(path)) == {"a": 22}
+
+
+def test_playbook_runs_with_the_cache(hosts, within):
+    cache = PlaybookCache()
+    for _ in range(2):
+        output = within(120, PlaybookRunner(
+            playbook_path=os.path.join(HERE, "debug.yml"), hosts=hosts(2),
+            playbook_cache=cache).run)
+        assert sorted(output["stats"]) == ["host0", "host1"]
+        assert all(s["failures"] == 0 and s["unreachable"] == 0
+                   for s in output["stats"].values())
+    assert cache.stats()["hits"] >= 1
@@ -0,0 +1,33 @@
+# coding:utf8
+
+import os
+
+from projection import ResultProjection
+from runner import Runner
+from playbook_runner import PlaybookRunner
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_projection_trims_the_results(hosts, within):
+    projection = ResultProjection(keys=["rc", "stdout", "stdout_lines"], max_bytes={"stdout": 4})
+    runner = Runner(module_name="shell", module_args="echo 0123456789", hosts=hosts(2),
+                    connection_type="local", projection=projection)
+    result_q = within(120, runner.run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1"]
+    for result in result_q["contacted"].values():
+        assert result == {"rc": 0, "stdout": "0123", "_truncated": ["stdout"]}
+
+
+def test_projection_applies_to_playbooks(hosts, within):
+    runner = PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"), hosts=hosts(2),
+                            projection=ResultProjection())
+    output = within(120, runner.run)
+    assert sorted(output["stats"]) == ["host0", "host1"]
+    assert all(s["failures"] == 0 and s["unreachable"] == 0 for s in output["stats"].values())
+    results = [result for play in output["plays"] for task in play["tasks"]
+               for result in task["hosts"].values()]
+    assert len(results) == 8
+    for result in results:
+        assert "invocation" not in result
+    assert all("stdout_lines" not in r for r in results if "stdout" in r)
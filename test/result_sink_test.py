@@ -0,0 +1,77 @@
+# coding:utf8
+
+import os
+from distutils.version import LooseVersion
+
+import pytest
+
+from ansible import __version__ as ansible_version
+
+from result_sink import ResultSink, JsonlResultSink, SqliteResultSink
+from runner import Runner
+from playbook_runner import PlaybookRunner
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(params=["jsonl", "sqlite"])
+def sink(request, tmpdir):
+    if request.param == "jsonl":
+        sink = JsonlResultSink(str(tmpdir.join("results.jsonl")))
+    else:
+        sink = SqliteResultSink(str(tmpdir.join("results.db")), batch=2)
+    yield sink
+    sink.close()
+
+
+def test_runner_writes_to_the_sink(hosts, within, sink):
+    inventory = hosts(3)
+    inventory["_meta"] = {"hostvars": {"host2": {"ansible_python_interpreter": "/nonexistent/python"}}}
+    output = within(120, Runner(module_name="shell", module_args="echo hi", hosts=inventory,
+                                connection_type="local", result_sink=sink).run)
+    assert output is sink
+    assert sink.hosts("ok") == set(["host0", "host1"])
+    assert sink.hosts("failed") == set(["host2"])
+    assert sink.counts() == {"ok": 2, "failed": 1}
+    assert sink.get("host0")["stdout"] == "hi"
+
+
+def test_playbook_writes_to_the_sink(hosts, within, sink):
+    output = within(120, PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"),
+                                        hosts=hosts(2), result_sink=sink).run)
+    assert output is sink
+    assert sorted(sink.stats) == ["host0", "host1"]
+    assert sink.get("host1", task="hostname")["stdout"]
+    plays = set(r["play"] for r in sink.records(host="host0"))
+    assert plays == set(["Test the plabybook API.", "Second test"])
+    assert set(r["status"] for r in sink) == set(["ok"])
+
+
+def test_playbook_matching_no_host_returns_the_sink(hosts, within, sink, tmpdir):
+    playbook = tmpdir.join("nomatch.yml")
+    playbook.write("- hosts: nosuchgroup\n  gather_facts: no\n  tasks:\n  - ping:\n")
+    output = within(120, PlaybookRunner(playbook_path=str(playbook), hosts=hosts(2),
+                                        result_sink=sink).run)
+    assert output is sink
+    assert list(sink.records()) == [] and sink.stats == {}
+    # ansible 2.2 and earlier run such a play silently
+    if LooseVersion(ansible_version) >= LooseVersion("2.3"):
+        assert sink.message == "skipping: No match hosts."
+
+
+def test_incomplete_sink_fails_when_created():
+    class OnlyWrite(ResultSink):
+        def _write(self, record):
+            pass
+
+    with pytest.raises(TypeError):
+        OnlyWrite()
+
+
+def test_playbook_matching_no_host_keeps_the_timing(hosts, within, sink, tmpdir):
+    playbook = tmpdir.join("nomatch.yml")
+    playbook.write("- hosts: nosuchgroup\n  gather_facts: no\n  tasks:\n  - ping:\n")
+    output = within(120, PlaybookRunner(playbook_path=str(playbook), hosts=hosts(2),
+                                        result_sink=sink, timing=True).run)
+    assert output is sink
+    assert sink.timing is not None and sink.timing.to_dict()["results"] == 0
@@ -0,0 +1,36 @@
+# coding:utf8
+
+from scheduler import HostScheduler
+from runner import Runner
+
+
+def test_order_longest_first():
+    scheduler = HostScheduler(alpha=0.5)
+    scheduler.record("job", {"a": 1.0, "b": 4.0, "c": 2.0})
+    scheduler.record("job", {"a": 9.0})
+    assert scheduler.order(["a", "b", "c", "d"], "job") == ["a", "b", "d", "c"]
+    assert scheduler.estimates(["a", "d"], "job") == {"a": 5.0, "d": 11.0 / 3}
+    # no history for the job: what the host took for the others
+    assert scheduler.order(["c", "b"], "other") == ["b", "c"]
+
+
+def test_runner_starts_the_slow_host_first(hosts, within):
+    inventory = hosts(4)
+    inventory["_meta"] = {"hostvars": {"host3": {"pause": 2}}}
+    scheduler = HostScheduler()
+
+    def run():
+        runner = Runner(module_name="shell", module_args="sleep {{ pause | default(0) }}",
+                        hosts=inventory, connection_type="local", forks=1,
+                        scheduler=scheduler)
+        return list(runner.iter_results())
+
+    first = within(120, run)
+    assert [host for host, _, _ in first] == ["host0", "host1", "host2", "host3"]
+    estimates = scheduler.estimates(["host0", "host3"], "shell")
+    assert estimates["host3"] > 2 > estimates["host0"]
+
+    # one fork: the results come in the order the hosts are queued
+    second = within(120, run)
+    assert [host for host, _, _ in second][0] == "host3"
+    assert set(status for _, status, _ in second) == set(["ok"])
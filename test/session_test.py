@@ -0,0 +1,29 @@
+# coding:utf8
+
+import pytest
+
+from ansible.errors import AnsibleError
+
+from session import RunnerSession
+
+
+def test_session_runs_submissions_in_turn(hosts, within):
+    inventory = hosts(3)
+    inventory["_meta"] = {"hostvars": {"host2": {"fail": 1}}}
+    with RunnerSession(hosts=inventory, connection_type="local", forks=3) as session:
+        first = within(120, session.submit, "all", "shell", "exit {{ fail | default(0) }}")
+        assert sorted(first["contacted"]) == ["host0", "host1"]
+        assert sorted(first["dark"]) == ["host2"]
+
+        # host2 failed in the first submission, it runs in the next ones
+        second = within(120, session.submit, "all", "shell", "echo again")
+        assert sorted(second["contacted"]) == ["host0", "host1", "host2"]
+        assert second["dark"] == {}
+        assert all(r["stdout"] == "again" for r in second["contacted"].values())
+
+        third = within(120, session.submit, "host1", "ping")
+        assert list(third["contacted"]) == ["host1"]
+        assert third["contacted"]["host1"]["ping"] == "pong"
+
+    with pytest.raises(AnsibleError):
+        session.submit("all", "ping")
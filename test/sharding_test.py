@@ -0,0 +1,62 @@
+# coding:utf8
+
+import os
+import time
+import threading
+
+from result_sink import JsonlResultSink
+from sharding import ShardedRunner, ShardedPlaybookRunner, partition_hosts
+from myinventory import MyInventory
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+
+def test_partition_keeps_groups_together(hosts):
+    inventory = hosts(4, group="web")
+    inventory.update(hosts(4, group="db", prefix="db"))
+    parts = partition_hosts(MyInventory(host_list=inventory), "all", 2)
+    assert sorted(sorted(part) for part in parts) == [
+        ["db0", "db1", "db2", "db3"], ["host0", "host1", "host2", "host3"]]
+
+
+def test_shards_merge_their_results(hosts, within):
+    inventory = hosts(5)
+    inventory["_meta"] = {"hostvars": {"host4": {"fail": 1}}}
+    runner = ShardedRunner(shards=2, forks=4, hosts=inventory, connection_type="local",
+                           module_name="shell", module_args="hostname; exit {{ fail | default(0) }}")
+    result_q = within(120, runner.run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2", "host3"]
+    assert sorted(result_q["dark"]) == ["host4"]
+
+
+def test_shards_write_to_the_sink(hosts, within, tmpdir):
+    runner = ShardedRunner(shards=2, forks=4, hosts=hosts(4), connection_type="local",
+                           module_name="shell", module_args="echo hi", result_sink=JsonlResultSink(str(tmpdir.join("results.jsonl"))))
+    sink = within(120, runner.run)
+    assert sink.hosts("ok") == set(["host0", "host1", "host2", "host3"])
+    assert sink.counts() == {"ok": 4}
+
+
+def test_sharded_playbook(hosts, within):
+    runner = ShardedPlaybookRunner(shards=2, forks=4, hosts=hosts(4),
+                                   playbook_path=os.path.join(HERE, "two_play.yml"))
+    output = within(120, runner.run)
+    assert sorted(output["stats"]) == ["host0", "host1", "host2", "host3"]
+    assert all(s["failures"] == 0 for s in output["stats"].values())
+    tasks = output["plays"][1]["tasks"]
+    assert sorted(tasks[-1]["hosts"]) == ["host0", "host1", "host2", "host3"]
+
+
+def test_terminate_stops_the_shards(hosts, within):
+    runner = ShardedRunner(shards=2, forks=4, hosts=hosts(4), connection_type="local",
+                           module_name="shell", module_args="sleep 30")
+    timer = threading.Timer(5, runner.terminate)
+    timer.start()
+    started = time.time()
+    try:
+        result_q = within(60, runner.run)
+    finally:
+        timer.cancel()
+    assert time.time() - started < 30
+    assert result_q["contacted"] == {}
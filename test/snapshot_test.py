@@ -0,0 +1,81 @@
+# coding:utf8
+
+import os
+import sys
+
+import pytest
+
+from myinventory import MyInventory
+from runner import Runner
+
+PATTERNS = ["all", "web", "db", "prod", "web:&prod", "host*"]
+
+INI = """
+[web]
+host0
+host1 rack=r1
+
+[db]
+host2
+
+[prod:children]
+web
+
+[all:vars]
+ansible_connection=local
+ansible_python_interpreter=%s
+"""
+
+
+@pytest.fixture
+def source(tmpdir):
+    path = tmpdir.join("hosts")
+    path.write(INI % sys.executable)
+    tmpdir.mkdir("group_vars").join("web.yml").write("role: frontend\n")
+    tmpdir.mkdir("host_vars").join("host2.yml").write("role: database\n")
+    return path
+
+
+def names(inventory, pattern):
+    return sorted(h.name for h in inventory.list_hosts(pattern))
+
+
+@pytest.mark.parametrize("options", [{}, {"lazy_vars": True}, {"compact": True}])
+def test_snapshot_loads_like_a_parse(source, tmpdir, options):
+    snapshot = str(tmpdir.join("hosts.snapshot"))
+    parsed = MyInventory(str(source), snapshot=snapshot, **options)
+    assert parsed.parser is not None and os.path.exists(snapshot)
+
+    loaded = MyInventory(str(source), snapshot=snapshot, **options)
+    assert loaded.parser is None
+    for pattern in PATTERNS:
+        assert names(loaded, pattern) == names(parsed, pattern), pattern
+    for name in ("host0", "host1", "host2"):
+        loaded.get_hosts(name)  # lazy_vars: resolved once matched
+        parsed.get_hosts(name)
+        assert loaded.get_vars(name) == parsed.get_vars(name)
+    assert loaded.get_vars("host1")["rack"] == "r1"
+    assert loaded.get_vars("host2")["role"] == "database"
+    assert loaded.groups["web"].vars == parsed.groups["web"].vars
+    assert loaded.groups["web"].vars["role"] == "frontend"
+
+
+def test_a_changed_inventory_is_parsed_again(source, tmpdir):
+    snapshot = str(tmpdir.join("hosts.snapshot"))
+    MyInventory(str(source), snapshot=snapshot)
+    source.write(INI.replace("host2", "host2\nhost3") % sys.executable)
+    inventory = MyInventory(str(source), snapshot=snapshot)
+    assert inventory.parser is not None
+    assert names(inventory, "db") == ["host2", "host3"]
+
+
+def test_runner_on_a_loaded_snapshot(source, tmpdir, within):
+    snapshot = str(tmpdir.join("hosts.snapshot"))
+    MyInventory(str(source), snapshot=snapshot)
+    inventory = MyInventory(str(source), snapshot=snapshot)
+    assert inventory.parser is None
+    result_q = within(120, Runner(module_name="shell", module_args="echo {{ role }} {{ rack | default('-') }}",
+                                  hosts=inventory, connection_type="local").run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2"]
+    assert result_q["contacted"]["host1"]["stdout"] == "frontend r1"
+    assert result_q["contacted"]["host2"]["stdout"] == "database -"
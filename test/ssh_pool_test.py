@@ -0,0 +1,44 @@
+# coding:utf8
+
+import getpass
+
+from ssh_pool import SSHPool
+from runner import Runner
+from myinventory import MyInventory
+
+# nothing listens on port 1: the host is unreachable at once
+REFUSED = {"ansible_connection": "ssh", "ansible_host": "127.0.0.1", "ansible_port": 1}
+
+
+def inventory_with_ssh_host(hosts):
+    inventory = hosts(3)
+    inventory["_meta"] = {"hostvars": {"host2": REFUSED}}
+    return inventory
+
+
+def test_endpoints_are_the_ssh_hosts(hosts, tmpdir):
+    pool = SSHPool(control_dir=str(tmpdir))
+    inventory = MyInventory(host_list=inventory_with_ssh_host(hosts))
+    assert pool.endpoints(inventory) == {"host2": ("127.0.0.1", 1, getpass.getuser(), None)}
+    assert 'ControlPath="%s/%%h-%%p-%%r"' % tmpdir in pool.ssh_common_args()
+
+
+def test_prewarm_reports_failures(hosts, within, tmpdir):
+    pool = SSHPool(control_dir=str(tmpdir), timeout=5)
+    report = within(60, pool.prewarm, inventory_with_ssh_host(hosts))
+    assert report["opened"] == [] and report["open"] == []
+    assert list(report["failed"]) == ["host2"]
+    assert pool.stats()["prewarm_failed"] == 1
+    assert pool.stats()["open"] == 0
+
+
+def test_runner_with_a_pool(hosts, within, tmpdir):
+    pool = SSHPool(control_dir=str(tmpdir))
+    runner = Runner(module_name="ping", hosts=inventory_with_ssh_host(hosts),
+                    connection_type="local", ssh_pool=pool)
+    result_q = within(120, runner.run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1"]
+    assert sorted(result_q["dark"]) == ["host2"]
+    assert result_q["dark"]["host2"]["unreachable"]
+    # only host2 goes over ssh, and it had no master connection
+    assert pool.stats()["hits"] == 0 and pool.stats()["misses"] == 1
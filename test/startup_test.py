@@ -0,0 +1,44 @@
+# coding:utf8
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+sys.path.insert(0, BENCH)
+
+from startup import bench_startup, check_budget
+
+# a new process: import runner, then run it against local hosts
+FIRST_RUN = """
+import sys, json
+sys.path.insert(0, %r)
+from conftest import local_inventory
+import runner
+before = "ansible.executor.task_queue_manager" in sys.modules
+result_q = runner.Runner(module_name="shell", module_args="echo hi", hosts=local_inventory(2),
+                         connection_type="local").run()
+print(json.dumps(dict(before=before, contacted=sorted(result_q["contacted"]),
+                      stdout=[r["stdout"] for r in result_q["contacted"].values()])))
+"""
+
+
+def test_entry_points_import_lazily(within):
+    report = within(300, bench_startup, argparse.Namespace(repeat=1, hosts=100))
+    with open(os.path.join(BENCH, "startup_budget.json")) as fd:
+        budget = json.load(fd)
+    # the module counts and what is imported, not the times of this machine
+    del budget["seconds"]
+    assert check_budget(report, budget) == []
+    assert report["first_run"]["heavy"]
+
+
+def test_first_run_imports_what_it_needs(within):
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = within(120, subprocess.check_output,
+                    [sys.executable, "-W", "ignore", "-c", FIRST_RUN % here],
+                    stderr=open(os.devnull, "w"))
+    report = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    assert report == dict(before=False, contacted=["host0", "host1"], stdout=["hi", "hi"])
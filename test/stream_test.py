@@ -0,0 +1,46 @@
+# coding:utf8
+
+import time
+import threading
+
+from runner import Runner
+
+# ~200KB of stdout per host: a result takes several writes to the pipe
+BIG_OUTPUT = "head -c 200000 /dev/zero | tr '\\0' x"
+
+
+def test_iter_results_yields_every_host(hosts, within):
+    runner = Runner(module_name="shell", module_args="echo hi",
+                    hosts=hosts(4), connection_type="local", forks=4)
+    items = within(120, lambda: list(runner.iter_results()))
+    assert sorted(host for host, _, _ in items) == ["host0", "host1", "host2", "host3"]
+    assert set(status for _, status, _ in items) == set(["ok"])
+    assert all(result["stdout"] == "hi" for _, _, result in items)
+
+
+def test_iter_results_early_exit_returns(hosts, within):
+    def first():
+        runner = Runner(module_name="shell", module_args=BIG_OUTPUT + "; sleep 0.2",
+                        hosts=hosts(6), connection_type="local", forks=6)
+        for item in runner.iter_results(maxsize=2):
+            return item
+
+    # the workers killed at the early exit used to hang the run now and then
+    for _ in range(6):
+        host, status, result = within(60, first)
+        assert status == "ok"
+        assert len(result["stdout"]) == 200000
+
+
+def test_terminate_stops_the_run(hosts, within):
+    runner = Runner(module_name="shell", module_args=BIG_OUTPUT + "; sleep 30",
+                    hosts=hosts(6), connection_type="local", forks=3)
+    timer = threading.Timer(3, runner.terminate)
+    timer.start()
+    started = time.time()
+    try:
+        result_q = within(60, runner.run)
+    finally:
+        timer.cancel()
+    assert time.time() - started < 30
+    assert result_q["contacted"] == {}
@@ -0,0 +1,49 @@
+# coding:utf8
+
+import os
+
+from runner import Runner
+from playbook_runner import PlaybookRunner
+from timing import parse_delta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_parse_delta():
+    assert parse_delta("0:01:02.500000") == 62.5
+    assert parse_delta(None) is None
+
+
+def test_runner_times_each_host(hosts, within):
+    exported = []
+    runner = Runner(module_name="shell", module_args="sleep 0.5; echo hi", hosts=hosts(3),
+                    connection_type="local", forks=2,
+                    timing=lambda t: exported.append(t.to_prometheus()))
+    result_q = within(120, runner.run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2"]
+
+    timing = result_q["timing"]
+    assert timing["results"] == 3
+    assert sorted(timing["hosts"]) == ["host0", "host1", "host2"]
+    records = [r for tasks in timing["hosts"].values() for r in tasks.values()]
+    assert all(r["status"] == "ok" for r in records)
+    assert all(r["module"] >= 0.5 and r["total"] >= r["module"] for r in records)
+    # two forks: the third host waited for one of the first two
+    assert max(r["wait"] for r in records) > 0.3
+    assert timing["tasks"][0]["hosts"] == 3
+
+    assert len(exported) == 1
+    assert "ansible_run_results 3" in exported[0]
+    assert 'ansible_task_duration_seconds_count{task="command"} 3' in exported[0]
+
+
+def test_playbook_times_each_task(hosts, within):
+    runner = PlaybookRunner(playbook_path=os.path.join(HERE, "two_play.yml"),
+                            hosts=hosts(2), timing=True)
+    output = within(120, runner.run)
+    assert sorted(output["stats"]) == ["host0", "host1"]
+    timing = output["timing"]
+    # fact gathering is "setup" before 2.3, "Gathering Facts" from 2.3
+    names = [t["name"] for t in timing["tasks"]]
+    assert len(names) == 4 and names[1::2] == ["uptime", "hostname"]
+    assert all(t["hosts"] == 2 for t in timing["tasks"])
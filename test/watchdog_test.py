@@ -0,0 +1,89 @@
+# coding:utf8
+
+import time
+
+from runner import Runner
+
+BIG_OUTPUT = "head -c 200000 /dev/zero | tr '\\0' x"
+
+
+def test_deadline_applies_to_the_task(hosts, within):
+    runner = Runner(module_name="shell", module_args="sleep 5", hosts=hosts(3),
+                    connection_type="local", gather_facts="yes", deadline=3)
+    started = time.time()
+    result_q = within(60, runner.run)
+    assert time.time() - started < 5
+    assert result_q["contacted"] == {}
+    assert sorted(result_q["timed_out"]) == ["host0", "host1", "host2"]
+    assert all(r["timed_out"] for r in result_q["timed_out"].values())
+
+
+def test_deadline_keeps_the_hosts_done_in_time(hosts, within):
+    inventory = hosts(3)
+    inventory["_meta"] = {"hostvars": {"host2": {"pause": 30}}}
+    runner = Runner(module_name="shell", module_args="sleep {{ pause | default(0) }}; echo done",
+                    hosts=inventory, connection_type="local", forks=3, deadline=5)
+    result_q = within(60, runner.run)
+    assert sorted(result_q["contacted"]) == ["host0", "host1"]
+    assert sorted(result_q["timed_out"]) == ["host2"]
+
+
+def test_stragglers_are_cut_off(hosts, within):
+    inventory = hosts(4)
+    inventory["_meta"] = {"hostvars": {"host3": {"pause": 30}}}
+    runner = Runner(module_name="shell",
+                    module_args=BIG_OUTPUT + "; sleep {{ pause | default(0) }}",
+                    hosts=inventory, connection_type="local", forks=4,
+                    gather_facts="yes", max_stragglers=1, straggler_grace=1)
+    started = time.time()
+    result_q = within(60, runner.run)
+    assert time.time() - started < 30
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2"]
+    assert sorted(result_q["timed_out"]) == ["host3"]
+
+
+def test_quorum_ends_the_run(hosts, within):
+    inventory = hosts(20)
+    inventory["_meta"] = {"hostvars": dict(
+        ("host%d" % i, {"pause": 30}) for i in range(3, 20))}
+    runner = Runner(module_name="shell",
+                    module_args=BIG_OUTPUT + "; sleep {{ pause | default(0) }}",
+                    hosts=inventory, connection_type="local", forks=20, quorum=3)
+    started = time.time()
+    result_q = within(120, runner.run)
+    assert time.time() - started < 30
+    assert result_q["quorum_reached"] is True
+    assert sorted(result_q["contacted"]) == ["host0", "host1", "host2"]
+    assert len(result_q["cancelled"]) == 17
+
+
+def test_quorum_counts_the_task_only(hosts, within):
+    runner = Runner(module_name="shell", module_args="sleep 30", hosts=hosts(6),
+                    connection_type="local", forks=6, gather_facts="yes",
+                    quorum=3, deadline=8)
+    result_q = within(60, runner.run)
+    # facts gathered everywhere, the task done nowhere before the deadline
+    assert result_q["quorum_reached"] is False
+    assert result_q["contacted"] == {}
+    assert result_q["cancelled"] == {}
+    assert len(result_q["timed_out"]) == 6
+
+
+def test_quorum_function(hosts, within):
+    seen = []
+
+    def quorum(results):
+        seen[:] = results
+        return len(results) >= 2
+
+    inventory = hosts(6)
+    inventory["_meta"] = {"hostvars": dict(
+        ("host%d" % i, {"pause": 30}) for i in range(2, 6))}
+    runner = Runner(module_name="shell", module_args="sleep {{ pause | default(0) }}",
+                    hosts=inventory, connection_type="local", forks=6,
+                    gather_facts="yes", quorum=quorum)
+    result_q = within(60, runner.run)
+    assert result_q["quorum_reached"] is True
+    assert sorted(host for host, _, _ in seen) == ["host0", "host1"]
+    assert all("ansible_facts" not in result for _, _, result in seen)
+    assert len(result_q["cancelled"]) == 4
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import re
+import json
+import math
+import time
+import threading
+from ansible.compat.six import string_types
+
+
+__all__ = ["RunTiming"]
+
+
+DELTA_RE = re.compile(r"^(\d+):(\d+):(\d+(?:\.\d+)?)$")
+
+
+def parse_delta(delta):
+    """ seconds of a module's "delta" ("0:00:01.002003"), or None """
+    if not isinstance(delta, string_types):
+        return None
+    match = DELTA_RE.match(delta)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def percentile(values, q):
+    """ nearest-rank percentile of sorted `values` """
+    if not values:
+        return None
+    return values[max(0, int(math.ceil(q * len(values))) - 1)]
+
+
+def _label(value):
+    return ("%s" % value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RunTiming(object):
+    """
+    Timing of a run, fed by the result callbacks. For each host and task:
+        wait:: 等待空闲fork的时间(估算)
+        connection:: 连接、传输模块、启动解释器等, 即 total - wait - module
+        module:: 模块执行时间, 取自结果的 delta 字段, 没有则为None
+        total:: 任务开始到收到结果的时间
+
+    Ansible 2.x has no callback when a worker picks a host up, so `wait`
+    assumes `forks` slots handed out in order: the k-th host queued waited
+    for the (k - forks)-th result. Without the queue order (set_host_order)
+    the n-th result is taken for the n-th host queued.
+    """
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, forks):
+        self.forks = forks
+        self.started = None
+        self.finished = None
+        self.tasks = []             # [{"name", "started", "hosts": {host: record}}]
+        self._done = []             # result times of the current task
+        self._position = {}         # host: rank in the queue order
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = time.time()
+
+    def finish(self):
+        self.finished = time.time()
+
+    def set_host_order(self, hosts):
+        """ the order the hosts are queued in, the inventory's """
+        with self._lock:
+            self._position = dict((h, i) for i, h in enumerate(hosts))
+
+    def task_start(self, name):
+        with self._lock:
+            self.tasks.append(dict(name=name, started=time.time(), hosts={}))
+            self._done = []
+
+    def host_done(self, host, status, result):
+        now = time.time()
+        with self._lock:
+            if not self.tasks:
+                self.tasks.append(dict(name=None, started=self.started or now, hosts={}))
+            task = self.tasks[-1]
+            n = self._position.get(host, len(self._done))
+            if n - self.forks >= len(self._done):
+                n = len(self._done)
+            total = now - task["started"]
+            wait = 0.0
+            if n >= self.forks:
+                wait = max(0.0, self._done[n - self.forks] - task["started"])
+            self._done.append(now)
+            module = parse_delta(result.get("delta")) if isinstance(result, dict) else None
+            connection = total - wait - (module or 0.0)
+            task["hosts"][host] = dict(
+                status=status, wait=wait, connection=max(0.0, connection),
+                module=module, total=total)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def task_summary(self, task):
+        totals = sorted(r["total"] for r in task["hosts"].values())
+        modules = sorted(r["module"] for r in task["hosts"].values()
+                         if r["module"] is not None)
+        summary = dict(name=task["name"], hosts=len(totals),
+                       max=totals[-1] if totals else None,
+                       sum=sum(totals),
+                       module_max=modules[-1] if modules else None)
+        for q in self.QUANTILES:
+            summary["p%d" % (q * 100)] = percentile(totals, q)
+            summary["module_p%d" % (q * 100)] = percentile(modules, q)
+        return summary
+
+    def to_dict(self):
+        """
+        {"elapsed", "results", "throughput", "fork_utilisation",
+         "tasks": [summary, ...], "hosts": {host: {task: record}}}
+        """
+        with self._lock:
+            tasks = list(self.tasks)
+        elapsed = self.elapsed
+        hosts = {}
+        results, busy = 0, 0.0
+        for task in tasks:
+            for host, record in task["hosts"].items():
+                hosts.setdefault(host, {})[task["name"]] = record
+                results += 1
+                busy += record["total"] - record["wait"]
+
+        return dict(
+            elapsed=elapsed,
+            results=results,
+            throughput=results / elapsed if elapsed else None,
+            fork_utilisation=busy / (self.forks * elapsed) if elapsed else None,
+            tasks=[self.task_summary(task) for task in tasks],
+            hosts=hosts,
+        )
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix="ansible"):
+        """ the Prometheus text format of the run and task figures """
+        data = self.to_dict()
+        lines = [
+            "# TYPE %s_run_duration_seconds gauge" % prefix,
+            "%s_run_duration_seconds %f" % (prefix, data["elapsed"]),
+            "# TYPE %s_run_results gauge" % prefix,
+            "%s_run_results %d" % (prefix, data["results"]),
+            "# TYPE %s_run_throughput gauge" % prefix,
+            "%s_run_throughput %f" % (prefix, data["throughput"] or 0.0),
+            "# TYPE %s_run_fork_utilisation gauge" % prefix,
+            "%s_run_fork_utilisation %f" % (prefix, data["fork_utilisation"] or 0.0),
+            "# TYPE %s_task_duration_seconds summary" % prefix,
+        ]
+        for task in data["tasks"]:
+            name = _label(task["name"])
+            for q in self.QUANTILES:
+                value = task["p%d" % (q * 100)]
+                if value is not None:
+                    lines.append('%s_task_duration_seconds{task="%s",quantile="%s"} %f'
+                                 % (prefix, name, q, value))
+            lines.append('%s_task_duration_seconds_sum{task="%s"} %f' % (prefix, name, task["sum"]))
+            lines.append('%s_task_duration_seconds_count{task="%s"} %d' % (prefix, name, task["hosts"]))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding:utf8
+
+import time
+import threading
+
+
+__all__ = ["RunWatchdog"]
+
+
+DEADLINE, STRAGGLERS, QUORUM = "deadline", "stragglers", "quorum"
+
+
+class RunWatchdog(object):
+    """
+    Ends a run early: calls `stop()` once the run is older than `deadline`
+    seconds, once the hosts still running are few enough to be left
+    behind as stragglers, or once a quorum of results is there.
+    参数说明:
+        hosts:: 本次执行的主机名
+        stop:: 结束执行的函数, 比如 lambda: terminate_tqm(tqm)
+        deadline:: 整个执行的最长时间(秒)
+        max_stragglers:: 只剩这么多主机未完成时结束执行
+        min_complete:: 完成的主机达到这个比例(0~1)时结束执行
+        grace:: 达到 max_stragglers/min_complete 后再等待的时间(秒)
+        quorum:: 成功(ok)的主机达到这个数量时结束执行,
+                 也可以是一个函数 quorum(results), results为到目前为止的
+                 [(host, status, result), ...], 返回True时结束执行
+
+    The hosts without a result when the run ends are remaining().
+    """
+    def __init__(self, hosts, stop, deadline=None, max_stragglers=None,
+                 min_complete=None, grace=0, quorum=None):
+        if min_complete is not None and not 0 < min_complete <= 1:
+            raise ValueError("min_complete should be in (0, 1].")
+        self.hosts = list(hosts)
+        self.stop = stop
+        self.deadline = deadline
+        self.max_stragglers = max_stragglers
+        self.min_complete = min_complete
+        self.grace = grace
+        self.quorum = quorum
+        self.results = []
+        self.successes = 0
+        self._quorum_met = False
+        self.reason = None
+        self.started = None
+        self._done = set()
+        self._deadline_at = None
+        self._cutoff_at = None
+        self._finished = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        if self.deadline is not None:
+            self._deadline_at = self.started + self.deadline
+        self._thread = threading.Thread(target=self._watch, name="runner-watchdog")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _cutoff_reached(self):
+        left = len(self.hosts) - len(self._done)
+        if left <= 0:
+            return False
+        if self.max_stragglers is not None and left <= self.max_stragglers:
+            return True
+        if self.min_complete is not None and \
+                len(self._done) >= self.min_complete * len(self.hosts):
+            return True
+        return False
+
+    def host_done(self, host):
+        """ `host` has its last result """
+        with self._cond:
+            self._done.add(host)
+            if self._cutoff_at is None and self._cutoff_reached():
+                self._cutoff_at = time.time() + self.grace
+                self._cond.notify()
+
+    def _quorum_reached(self):
+        if callable(self.quorum):
+            return bool(self.quorum(list(self.results)))
+        return self.successes >= self.quorum
+
+    def add_result(self, host, status, result):
+        """ the last result of `host`, for the quorum """
+        if self.quorum is None:
+            return
+        with self._cond:
+            if self._quorum_met:
+                return
+            if callable(self.quorum):
+                self.results.append((host, status, result))
+            elif status == "ok":
+                self.successes += 1
+            if self._quorum_reached():
+                self._quorum_met = True
+                self._cond.notify()
+
+    def _watch(self):
+        with self._cond:
+            while not self._finished:
+                if self._quorum_met:
+                    self.reason = QUORUM
+                    break
+                now = time.time()
+                if self._deadline_at is not None and now >= self._deadline_at:
+                    self.reason = DEADLINE
+                    break
+                if self._cutoff_at is not None and now >= self._cutoff_at:
+                    self.reason = STRAGGLERS
+                    break
+                due = [t for t in (self._deadline_at, self._cutoff_at) if t is not None]
+                # py2's wait() without a timeout can't be interrupted
+                self._cond.wait(min(due) - now if due else 1)
+            else:
+                return
+        self.stop()
+
+    def finish(self):
+        """ the run is over, stop watching """
+        with self._cond:
+            self._finished = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def tripped(self):
+        return self.reason is not None
+
+    def remaining(self):
+        """ the hosts without their last result, in the order of `hosts` """
+        with self._cond:
+            return [h for h in self.hosts if h not in self._done]
+
+    @property
+    def quorum_reached(self):
+        return self._quorum_met
+
+    def status(self):
+        """ what the remaining() hosts are: cancelled or timed_out """
+        return "cancelled" if self.reason == QUORUM else "timed_out"
+
+    def message(self):
+        if self.reason == QUORUM:
+            return "cancelled, quorum reached"
+        if self.reason == DEADLINE:
+            return "run deadline of %ss reached" % self.deadline
+        return "cut off as a straggler after %d of %d hosts" % (
+            len(self._done), len(self.hosts))